@@ -0,0 +1,216 @@
+# core/metrics.py
+"""
+Métriques par vue : latence des requêtes, nombre de requêtes SQL et temps SQL.
+
+MetricsMiddleware mesure chaque requête et, via connection.execute_wrapper,
+chaque requête SQL exécutée pendant son traitement ; pour une réponse en
+flux (export), jusqu'à la fin de la lecture de son contenu. Les compteurs sont
+gardés en mémoire dans le processus (un verrou, quelques additions par
+requête) et servis au format texte Prometheus par metrics_view.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Bornes des histogrammes de latence, en secondes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNRESOLVED = 'unresolved'
+
+
+class _ViewStats:
+    __slots__ = ('buckets', 'count', 'duration', 'sql_queries', 'sql_duration', 'statuses')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.sql_queries = 0
+        self.sql_duration = 0.0
+        self.statuses = {}
+
+
+class MetricsRegistry:
+    """Compteurs par vue, partagés par tous les threads du processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, status, duration, sql_queries, sql_duration):
+        status_class = f"{status // 100}xx"
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = _ViewStats()
+            stats.buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.sql_queries += sql_queries
+            stats.sql_duration += sql_duration
+            stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {
+                    'buckets': list(stats.buckets),
+                    'count': stats.count,
+                    'duration': stats.duration,
+                    'sql_queries': stats.sql_queries,
+                    'sql_duration': stats.sql_duration,
+                    'statuses': dict(stats.statuses),
+                }
+                for view, stats in self._views.items()
+            }
+
+
+registry = MetricsRegistry()
+
+
+class _QueryTimer:
+    """execute_wrapper comptant les requêtes SQL d'une requête HTTP."""
+
+    __slots__ = ('queries', 'duration')
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """
+    Middleware enregistrant, par nom d'URL résolu (ex. "sales:sale_list"),
+    la latence, le nombre de requêtes SQL et le temps SQL de chaque requête.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        start = time.perf_counter()
+
+        with _timed(timer):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else UNRESOLVED
+        if response.streaming:
+            # Le contenu d'un export est produit après la sortie du middleware :
+            # mesuré jusqu'à la fin de sa lecture
+            response.streaming_content = _measured(response.streaming_content, timer, view,
+                                                   response.status_code, start)
+        else:
+            registry.record(view, response.status_code, time.perf_counter() - start,
+                            timer.queries, timer.duration)
+        return response
+
+
+@contextmanager
+def _timed(timer):
+    """Compte dans `timer` les requêtes SQL de toutes les connexions."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        yield
+
+
+def _measured(iterable, timer, view, status, start):
+    try:
+        with _timed(timer):
+            yield from iterable
+    finally:
+        registry.record(view, status, time.perf_counter() - start, timer.queries, timer.duration)
+
+
+# ---------------------------------------------
+# Exposition au format Prometheus
+# ---------------------------------------------
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot=None):
+    from sales import report_cache
+    from . import replica
+
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    views = sorted(snapshot.items())
+    lines = [
+        '# HELP unicom_request_duration_seconds Durée des requêtes HTTP par vue.',
+        '# TYPE unicom_request_duration_seconds histogram',
+    ]
+    for view, stats in views:
+        label = _label(view)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append(f'unicom_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'unicom_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'unicom_request_duration_seconds_sum{{view="{label}"}} {stats["duration"]:.6f}')
+        lines.append(f'unicom_request_duration_seconds_count{{view="{label}"}} {stats["count"]}')
+
+    lines += [
+        '# HELP unicom_requests_total Requêtes HTTP par vue et classe de statut.',
+        '# TYPE unicom_requests_total counter',
+    ]
+    for view, stats in views:
+        for status, count in sorted(stats['statuses'].items()):
+            lines.append(f'unicom_requests_total{{view="{_label(view)}",status="{status}"}} {count}')
+
+    lines += [
+        '# HELP unicom_sql_queries_total Requêtes SQL exécutées par vue.',
+        '# TYPE unicom_sql_queries_total counter',
+    ]
+    for view, stats in views:
+        lines.append(f'unicom_sql_queries_total{{view="{_label(view)}"}} {stats["sql_queries"]}')
+
+    lines += [
+        '# HELP unicom_sql_duration_seconds_total Temps passé en SQL par vue.',
+        '# TYPE unicom_sql_duration_seconds_total counter',
+    ]
+    for view, stats in views:
+        lines.append(f'unicom_sql_duration_seconds_total{{view="{_label(view)}"}} {stats["sql_duration"]:.6f}')
+
+    cache_stats = report_cache.stats()
+    lines += [
+        '# HELP unicom_report_cache_requests_total Consultations du cache des rapports.',
+        '# TYPE unicom_report_cache_requests_total counter',
+        f'unicom_report_cache_requests_total{{result="hit"}} {cache_stats["hits"]}',
+        f'unicom_report_cache_requests_total{{result="miss"}} {cache_stats["misses"]}',
+    ]
+
+    replicas = replica.replicas()
+    if replicas:
+        lines += [
+            '# HELP unicom_replica_lag_seconds Retard des répliques (-1 : illisible ou sans battement).',
+            '# TYPE unicom_replica_lag_seconds gauge',
+        ]
+        for alias in sorted(replicas.values()):
+            lag = replica.lag(alias)
+            lines.append(f'unicom_replica_lag_seconds{{replica="{_label(alias)}"}} {-1 if lag is None else round(lag, 3)}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Métriques du processus au format texte Prometheus (administrateurs uniquement)."""
+    user = request.user
+    if not user.is_authenticated or not (user.is_superuser or user.est_admin()):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,235 @@
+# core/pagination.py
+"""
+Pagination par clé (created_at, id) des listes.
+
+Paginator lance un COUNT(*) sur la liste filtrée à chaque page, puis lit
+la page avec un OFFSET : la dernière page d'un vendeur à 100 000 ventes
+parcourt tout l'index. Ici, une page commence strictement après (ou
+avant) la ligne désignée par un curseur opaque, sans OFFSET : la page N
+coûte autant que la première, avec l'index (…, created_at) de la liste.
+
+Paramètres d'URL : ?after=<curseur> (page suivante), ?before=<curseur>
+(page précédente), ?last=1 (dernière page). Les autres paramètres
+(filtres) sont conservés dans les liens. Un curseur illisible ramène à
+la première page.
+
+Le total n'est pas exact : il est compté jusqu'à PAGINATION_TOTAL_LIMIT
+lignes au plus, et gardé en cache PAGINATION_TOTAL_TIMEOUT secondes par
+requête SQL ; il n'est calculé que si le gabarit l'affiche.
+
+Une liste répartie sur plusieurs bases (voir core/sharding.py) se passe
+comme une liste de querysets, un par base : chaque page lit au plus une
+page et une ligne dans chacune, puis fusionne par (clé, id).
+"""
+import base64
+import hashlib
+import json
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils.functional import cached_property
+
+CURSOR_PARAMS = ('after', 'before', 'last', 'page')
+
+
+def encode_cursor(value, pk):
+    """Curseur opaque désignant la position (valeur de la clé, id) d'une ligne."""
+    # isoformat() complet : DjangoJSONEncoder tronque les microsecondes
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, field):
+    """Retourne (valeur, id) ou None si le curseur est absent ou invalide."""
+    if not cursor:
+        return None
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return (None if value is None else field.to_python(value)), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError, ValidationError):
+        return None
+
+
+class KeysetPaginator:
+    """
+    Pages de `per_page` lignes de `queryset` (ou d'une liste de querysets,
+    un par base), triées par (key, id), décroissant par défaut (les plus
+    récentes d'abord). Une clé NULL est la plus petite valeur : en fin de
+    liste dans l'ordre décroissant.
+    """
+
+    def __init__(self, queryset, per_page, key='created_at', descending=True):
+        self.querysets = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+        self.queryset = self.querysets[0]
+        self.per_page = per_page
+        self.key = key
+        self.descending = descending
+        self.field = self.queryset.model._meta.get_field(key)
+
+    def _ordering(self, upward):
+        if upward:
+            return F(self.key).asc(), F('pk').asc()
+        return F(self.key).desc(), F('pk').desc()
+
+    # Deux segments dans l'ordre croissant : les clés NULL (par id), puis les
+    # autres (par clé, id). Chacun est lu avec une borne simple sur la clé,
+    # sans OR : l'index de la liste sert à se placer au curseur.
+    def _segment(self, rows, null, position, upward):
+        if self.field.null:
+            rows = rows.filter(**{f'{self.key}__isnull': null})
+        op = 'gt' if upward else 'lt'
+        if position is not None and null:
+            rows = rows.filter(**{f'pk__{op}': position[1]})
+        elif position is not None:
+            value, pk = position
+            rows = rows.filter(**{f'{self.key}__{op}e': value}).exclude(
+                **{self.key: value, f'pk__{"lte" if upward else "gte"}': pk}
+            )
+        order = self._ordering(upward)[1:] if null else self._ordering(upward)
+        return rows.order_by(*order)
+
+    def _head(self, null, position, upward, limit):
+        """Les `limit` premières lignes du segment, fusionnées entre les querysets."""
+        heads = [list(self._segment(rows, null, position, upward)[:limit]) for rows in self.querysets]
+        if len(heads) == 1:
+            return heads[0]
+        order = (lambda row: row.pk) if null else (lambda row: (getattr(row, self.key), row.pk))
+        return sorted(chain.from_iterable(heads), key=order, reverse=not upward)[:limit]
+
+    def _slice(self, position, upward):
+        """Jusqu'à per_page + 1 lignes après `position`, en montant ou en descendant."""
+        segments = [True, False] if self.field.null else [False]
+        if not upward:
+            segments.reverse()
+        if position is not None:
+            # Les segments déjà dépassés sont sautés
+            segments = segments[segments.index(position[0] is None):]
+
+        rows = []
+        for null in segments:
+            bound = position if position is not None and (position[0] is None) == null else None
+            rows += self._head(null, bound, upward, self.per_page + 1 - len(rows))
+            if len(rows) > self.per_page:
+                break
+        return rows
+
+    def page(self, after=None, before=None, last=False):
+        """La page qui suit `after`, précède `before`, la dernière, ou la première."""
+        upward = not self.descending
+        after_position = decode_cursor(after, self.field)
+        before_position = decode_cursor(before, self.field)
+
+        if after_position is None and (before_position is not None or last):
+            # En remontant la liste depuis sa fin ou depuis `before`
+            rows = self._slice(before_position, not upward)
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(self, rows, has_previous=more, has_next=before_position is not None)
+
+        rows = self._slice(after_position, upward)
+        more = len(rows) > self.per_page
+        return KeysetPage(self, rows[:self.per_page], has_previous=after_position is not None, has_next=more)
+
+    def cursor_of(self, row):
+        return encode_cursor(getattr(row, self.key), row.pk)
+
+    @cached_property
+    def total(self):
+        """(nombre de lignes, exact ?) : compté jusqu'à PAGINATION_TOTAL_LIMIT, en cache."""
+        limit = settings.PAGINATION_TOTAL_LIMIT
+        count = sum(self._count(rows, limit) for rows in self.querysets)
+        return min(count, limit), count <= limit
+
+    def _count(self, rows, limit):
+        counted = rows.order_by()
+        try:
+            sql, params = counted.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        signature = f'{counted.db}|{sql}|{params!r}'.encode()
+        key = 'keyset-total:' + hashlib.sha1(signature).hexdigest()
+
+        cache = caches[settings.REPORT_CACHE_ALIAS]
+        count = cache.get(key)
+        if count is None:
+            count = counted[:limit + 1].count()
+            cache.set(key, count, settings.PAGINATION_TOTAL_TIMEOUT)
+        return count
+
+
+class KeysetPage:
+
+    def __init__(self, paginator, object_list, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_previous = has_previous and bool(object_list)
+        self._has_next = has_next and bool(object_list)
+        self.base_query = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def next_cursor(self):
+        return self.paginator.cursor_of(self.object_list[-1]) if self._has_next else None
+
+    def previous_cursor(self):
+        return self.paginator.cursor_of(self.object_list[0]) if self._has_previous else None
+
+    def _query(self, **params):
+        query = self.base_query.copy()
+        for param, value in params.items():
+            query[param] = value
+        return query.urlencode()
+
+    # Chaînes de requête des liens (filtres conservés), voir paginate()
+    def first_query(self):
+        return self._query()
+
+    def previous_query(self):
+        return self._query(before=self.previous_cursor())
+
+    def next_query(self):
+        return self._query(after=self.next_cursor())
+
+    def last_query(self):
+        return self._query(last=1)
+
+    @property
+    def total(self):
+        return self.paginator.total[0]
+
+    @property
+    def total_is_exact(self):
+        return self.paginator.total[1]
+
+
+def paginate(request, queryset, per_page, key='created_at', descending=True):
+    """Page de `queryset` désignée par ?after= / ?before= / ?last= de la requête."""
+    paginator = KeysetPaginator(queryset, per_page, key=key, descending=descending)
+    page = paginator.page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        last=bool(request.GET.get('last')),
+    )
+    page.base_query = request.GET.copy()
+    for param in CURSOR_PARAMS:
+        page.base_query.pop(param, None)
+    return page
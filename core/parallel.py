@@ -0,0 +1,52 @@
+# core/parallel.py
+"""
+Exécution de tâches de maintenance sur un pool de processus.
+
+Chaque processus ouvre ses propres connexions à la base : les connexions
+du processus parent sont fermées avant la création du pool pour ne pas
+être partagées ; ils héritent de la base répartie courante du parent
+(voir core/sharding.py). Une base SQLite en mémoire (base de test) n'est pas
+visible depuis un autre processus : le travail est alors fait sur place.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _init_worker(shard=None):
+    # Nécessaire quand les processus sont lancés par "spawn" (macOS, Windows)
+    django.setup()
+    from . import sharding
+    sharding.pin(shard)
+
+
+def _in_memory_database():
+    return any(
+        connection.vendor == 'sqlite' and connection.is_in_memory_db()
+        for connection in connections.all()
+    )
+
+
+def run_parallel(func, items, workers=None):
+    """
+    Applique `func` (fonction de module, sérialisable) à chaque élément
+    de `items` et retourne les résultats dans l'ordre des éléments.
+    """
+    items = list(items)
+    workers = default_workers() if workers is None else workers
+    workers = min(workers, len(items))
+
+    if workers <= 1 or _in_memory_database():
+        return [func(item) for item in items]
+
+    from . import sharding
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(sharding.current(),)) as pool:
+        return list(pool.map(func, items))
@@ -0,0 +1,104 @@
+# core/process_cache.py
+"""
+Tables de référence gardées en mémoire par processus.
+
+Une ProcessCache charge sa table en bloc au premier usage, puis la sert
+sans requête tant que sa génération, gardée dans le cache Django, ne
+change pas. invalidate() vide la table du processus courant et, à la
+validation de la transaction en cours, incrémente la génération.
+
+Avec un cache partagé (UNICOM_CACHE_DIR, voir core/settings.py), les
+autres processus rechargent à leur lecture suivante. Avec la mémoire
+locale, chaque processus a sa propre génération et ne voit pas les
+invalidations des autres : une table est donc rechargée au plus tard
+PROCESS_CACHE_MAX_AGE secondes après son chargement, quel que soit le
+cache. Une donnée absente de la table (créée depuis le chargement, dans
+un autre processus) se relit aussitôt par reload(miss) ; toujours absente
+après relecture, elle est retenue comme inconnue jusqu'à l'invalidation
+ou l'expiration de la table : une série de clés inconnues ne relit pas
+la table à chaque appel.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class ProcessCache:
+
+    def __init__(self, key, load, alias='default'):
+        self.key = key
+        self.load = load
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._generation = None
+        self._table = None
+        self._loaded_at = None
+        # Clés absentes de la table après une relecture (voir reload)
+        self._misses = set()
+
+    def _shared_generation(self):
+        cache = caches[self.alias]
+        generation = cache.get(self.key)
+        if generation is None:
+            # Clé absente ou évincée : une valeur neuve force le rechargement
+            cache.add(self.key, time.time_ns(), None)
+            generation = cache.get(self.key)
+        return generation
+
+    def _expired(self):
+        return time.monotonic() - self._loaded_at >= settings.PROCESS_CACHE_MAX_AGE
+
+    def get(self):
+        """La table à jour (rechargée si la génération a changé ou si elle a expiré)."""
+        generation = self._shared_generation()
+        with self._lock:
+            if self._generation != generation or (self._loaded_at is not None and self._expired()):
+                # Table périmée : les clés inconnues peuvent exister désormais
+                self._misses = set()
+            if self._table is None or self._generation != generation or self._expired():
+                # La génération est lue avant le chargement : une modification
+                # validée pendant celui-ci provoquera un nouveau rechargement.
+                # Chargée sur la base principale : une table lue sur une réplique
+                # en retard resterait périmée jusqu'à la génération suivante.
+                from .replica import primary
+                loaded_at = time.monotonic()
+                with primary():
+                    self._table = self.load()
+                self._generation = generation
+                self._loaded_at = loaded_at
+            return self._table
+
+    def reload(self, miss=None):
+        """
+        La table relue en base pour la donnée absente `miss`, peut-être créée
+        depuis le chargement ; sans relecture si `miss` était déjà absente
+        de la table rechargée.
+        """
+        with self._lock:
+            if miss is not None and miss in self._misses and self._table is not None:
+                return self._table
+            self._table = None
+        table = self.get()
+        if miss is not None:
+            with self._lock:
+                if self._table is table:
+                    self._misses.add(miss)
+        return table
+
+    def invalidate(self, using=None):
+        """`using` : base dont la transaction porte la modification."""
+        with self._lock:
+            self._table = None
+            self._misses = set()
+
+        def bump():
+            cache = caches[self.alias]
+            try:
+                cache.incr(self.key)
+            except ValueError:
+                cache.set(self.key, time.time_ns(), None)
+
+        transaction.on_commit(bump, using=using)
@@ -0,0 +1,112 @@
+# core/queryplan.py
+"""
+Capture des requêtes SQL et lecture de leur plan d'exécution.
+
+QueryRecorder enregistre, via connection.execute_wrapper, chaque requête
+avec ses paramètres (et, sur demande, la pile d'appels Python et la ligne
+de gabarit en cours de rendu). explain() rejoue le préfixe EXPLAIN du
+moteur (EXPLAIN QUERY PLAN pour SQLite) sur une requête enregistrée,
+plan_flags() y repère les parcours complets de table et les tris en table
+temporaire, et normalize() ramène une requête à sa forme pour compter
+les répétitions (N+1).
+"""
+import re
+import sys
+import time
+import traceback
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?!CONSTANT ROW)(\S+)(?!.*\bUSING\b)')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\S+)')
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryRecorder:
+    """
+    Enregistre les requêtes exécutées sur `connection` :
+    [{'sql', 'params', 'many', 'duration', 'stack', 'template'}].
+    'template' vaut « gabarit:ligne » si la requête part du rendu d'un gabarit.
+    """
+
+    def __init__(self, connection, stack=False):
+        self.connection = connection
+        self.stack = stack
+        self.queries = []
+        self._wrapper = None
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._wrapper.__exit__(*exc)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            frame = sys._getframe(1) if self.stack else None
+            self.queries.append({
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'duration': time.perf_counter() - start,
+                'stack': traceback.extract_stack(frame) if self.stack else None,
+                'template': _template_position(frame) if self.stack else None,
+            })
+
+
+def _template_position(frame):
+    # Le nœud de gabarit le plus interne en cours de rendu : Node.render_annotated
+    # a le nœud en `self`, qui porte son jeton (ligne) et son origine (fichier).
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token, origin = getattr(node, 'token', None), getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return f"{origin.template_name or origin.name}:{token.lineno}"
+        frame = frame.f_back
+    return None
+
+
+def normalize(sql):
+    """Forme d'une requête, listes IN (...) repliées : deux exécutions de même forme = répétition."""
+    return IN_LIST.sub('IN (...)', ' '.join(sql.split()))
+
+
+def explain(connection, sql, params=None):
+    """Lignes du plan d'exécution de `sql` (liste vide si non applicable)."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}", params or ())
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def plan_flags(vendor, plan):
+    """
+    Repère dans un plan les tables parcourues entièrement ('full_scans')
+    et les tris en structure temporaire ('temp_sorts').
+    """
+    full_scans, temp_sorts = [], []
+    for line in plan:
+        detail = line.strip()
+        if vendor == 'sqlite':
+            match = SQLITE_FULL_SCAN.match(detail)
+            if match:
+                full_scans.append(match.group(1))
+            if 'USE TEMP B-TREE' in detail:
+                temp_sorts.append(detail)
+        elif vendor == 'postgresql':
+            match = POSTGRES_FULL_SCAN.search(detail)
+            if match:
+                full_scans.append(match.group(1))
+            if re.search(r'\bSort\b', detail) and 'Sort Key' not in detail:
+                temp_sorts.append(detail)
+    return {'full_scans': full_scans, 'temp_sorts': temp_sorts}
@@ -0,0 +1,230 @@
+# core/replica.py
+"""
+Lectures de consultation sur une réplique de la base par défaut.
+
+Les pages de consultation lourdes (REPLICA_ROUTES : rapports, listes,
+exports, listes de l'administration) lisent la réplique déclarée dans
+DATABASE_REPLICAS (voir core/settings.py). Tout le reste, et toute
+écriture, reste sur la base principale. Les données des bases réparties
+(voir core/sharding.py) n'ont pas de réplique et restent lues dans leur
+base.
+
+Lecture de ses propres écritures : dès qu'une requête écrit, ses lectures
+suivantes vont à la base principale, et ReplicaMiddleware pose le cookie
+STICKY_COOKIE pour REPLICA_STICKY_SECONDS. La page affichée après une
+redirection (ex. sale_create -> sale_list) lit donc aussi la principale.
+
+Retard : replica_heartbeat (ou copy_replica) écrit l'heure dans
+ReplicaHeartbeat sur la base principale. Une réplique dont l'heure reçue
+date de plus de REPLICA_MAX_LAG secondes, ou qui ne répond pas, est
+écartée ; le retard est relu au plus toutes les REPLICA_LAG_CHECK_SECONDS.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.utils import timezone
+
+from . import sharding
+
+STICKY_COOKIE = 'unicom_primary'
+
+# Pages lues sur la réplique (en plus des listes de l'administration)
+REPLICA_ROUTES = {
+    'sales:rapport_periodique',
+    'sales:mon_rapport_periodique',
+    'sales:rapport_details',
+    'sales:rapport_export',
+    'sales:sale_list',
+    'sales:sale_export',
+    'sales:credit_aging',
+    'expenses:expense_list',
+    'expenses:expense_export',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_request = ContextVar('unicom_replica_request', default=None)
+
+
+class _RequestState:
+    __slots__ = ('eligible', 'wrote')
+
+    def __init__(self):
+        self.eligible = False
+        self.wrote = False
+
+
+def replicas():
+    """{base principale: réplique}."""
+    return dict(getattr(settings, 'DATABASE_REPLICAS', {}))
+
+
+def primary_of(alias):
+    """Base principale d'une réplique (None si `alias` n'en est pas une)."""
+    for primary, replica in replicas().items():
+        if replica == alias:
+            return primary
+    return None
+
+
+# ---------------------------------------------
+# Retard des répliques
+# ---------------------------------------------
+def beat():
+    """Écrit l'heure courante dans le battement de la base principale."""
+    from sales.models import ReplicaHeartbeat
+    now = timezone.now()
+    heartbeats = ReplicaHeartbeat.objects.using(DEFAULT_DB_ALIAS)
+    if not heartbeats.filter(pk=1).update(beat_at=now):
+        heartbeats.create(pk=1, beat_at=now)
+    return now
+
+
+def lag(alias):
+    """Retard de la réplique en secondes (None si elle est illisible ou sans battement)."""
+    from sales.models import ReplicaHeartbeat
+    try:
+        beat_at = ReplicaHeartbeat.objects.using(alias).filter(pk=1).values_list('beat_at', flat=True).first()
+    except DatabaseError:
+        return None
+    if beat_at is None:
+        return None
+    return max((timezone.now() - beat_at).total_seconds(), 0.0)
+
+
+_checks = {}
+_checks_lock = threading.Lock()
+
+
+def available(alias):
+    """La réplique est-elle assez à jour pour être lue ? (retard relu périodiquement)"""
+    now = time.monotonic()
+    with _checks_lock:
+        checked = _checks.get(alias)
+    if checked is None or now - checked[0] >= settings.REPLICA_LAG_CHECK_SECONDS:
+        current_lag = lag(alias)
+        checked = (now, current_lag is not None and current_lag <= settings.REPLICA_MAX_LAG)
+        with _checks_lock:
+            _checks[alias] = checked
+    return checked[1]
+
+
+def forget_lag():
+    """Oublie les retards relus : la prochaine lecture les vérifie de nouveau."""
+    with _checks_lock:
+        _checks.clear()
+
+
+def in_use():
+    """Les lectures de la requête en cours vont-elles à une réplique ?"""
+    state = _request.get()
+    replica = replicas().get(DEFAULT_DB_ALIAS)
+    return bool(state and state.eligible and not state.wrote and replica and available(replica))
+
+
+@contextmanager
+def primary():
+    """Lectures sur la base principale le temps du bloc (ex. tables gardées en mémoire)."""
+    state = _request.get()
+    if state is None or not state.eligible:
+        yield
+        return
+    state.eligible = False
+    try:
+        yield
+    finally:
+        state.eligible = True
+
+
+# ---------------------------------------------
+# Routeur et middleware
+# ---------------------------------------------
+class ReplicaRouter:
+    """Voir la documentation du module. Placé avant ShardRouter."""
+
+    def db_for_read(self, model, **hints):
+        if not (sharding.enabled() and sharding.is_sharded(model)) and in_use():
+            return replicas()[DEFAULT_DB_ALIAS]
+        # Objet lu sur la réplique, relation lue hors d'une page de consultation
+        instance = hints.get('instance')
+        return primary_of(instance._state.db) if instance is not None else None
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        # La session s'enregistre à chaque requête : ce n'est pas une donnée lue ensuite
+        if state is not None and model._meta.app_label != 'sessions':
+            state.wrote = True
+        instance = hints.get('instance')
+        return primary_of(instance._state.db) if instance is not None else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        db1 = primary_of(obj1._state.db) or obj1._state.db
+        db2 = primary_of(obj2._state.db) or obj2._state.db
+        if db1 == db2 and (db1 != obj1._state.db or db2 != obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Une réplique reçoit le schéma de sa base principale
+        if primary_of(db):
+            return False
+        return None
+
+
+def _replica_route(match):
+    if match is None:
+        return False
+    if match.view_name in REPLICA_ROUTES:
+        return True
+    return 'admin' in match.namespaces and (match.url_name or '').endswith('_changelist')
+
+
+class ReplicaMiddleware:
+    """
+    Rend les pages REPLICA_ROUTES (GET) éligibles à la réplique, sauf dans
+    la fenêtre STICKY_COOKIE qui suit une écriture du même navigateur.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas():
+            return self.get_response(request)
+
+        state = _RequestState()
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        elif state.eligible and response.streaming:
+            # Le contenu d'un export est produit après la sortie du middleware
+            response.streaming_content = _with_state(response.streaming_content, state)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request.get()
+        if (state is not None and request.method in ('GET', 'HEAD')
+                and STICKY_COOKIE not in request.COOKIES
+                and _replica_route(request.resolver_match)):
+            state.eligible = True
+        return None
+
+
+def _with_state(iterable, state):
+    token = _request.set(state)
+    try:
+        yield from iterable
+    finally:
+        _request.reset(token)
@@ -0,0 +1,336 @@
+# core/search.py
+"""
+Recherche plein texte : ventes (client), créances (nom, téléphone),
+dépenses (titre, description) et produits (nom).
+
+Chaque objet indexé a une SearchEntry dans sa propre base (voir
+core/sharding.py ; les produits, dans la base par défaut) : son texte
+normalisé (minuscules, sans accents), un libellé et son vendeur ou
+auteur. Les signaux (sales/signals.py, expense/signals.py), la saisie
+groupée et l'archivage la tiennent à jour ; la commande
+rebuild_search_index la reconstruit.
+
+Sous SQLite, la table FTS5 sales_searchentry_fts (migration sales 0008,
+tenue par déclencheurs) répond aux recherches : chaque mot est cherché
+par préfixe et les résultats sont classés par bm25. Sans FTS5 (autre
+moteur, ou SEARCH_FTS5 = False), les mots de chaque entrée sont rangés
+dans SearchTerm, indexée sur (term, entry) : un préfixe y est une plage
+d'index, et les résultats vont du plus récent au plus ancien.
+"""
+import heapq
+import re
+import unicodedata
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.expressions import RawSQL
+from django.shortcuts import render
+from django.urls import reverse
+
+from accounts.permissions import Permissions
+from . import sharding
+
+FTS_TABLE = 'sales_searchentry_fts'
+MAX_TERM_LENGTH = 64
+SEARCH_CANDIDATES = 500
+
+Source = namedtuple('Source', ['kind', 'texts', 'label', 'owner', 'url_name'])
+
+# Objets indexés, par « app_label.model_name »
+SOURCES = {
+    'sales.sale': Source(
+        'sale', lambda sale: [sale.customer],
+        lambda sale: f"Vente n°{sale.pk} : {sale.customer or 'client inconnu'}",
+        lambda sale: sale.created_by_id, 'sales:sale_update',
+    ),
+    'sales.credit': Source(
+        'credit', lambda credit: [credit.nom, credit.telephone],
+        lambda credit: f"Crédit {credit.nom} ({credit.telephone})",
+        lambda credit: None, 'admin:sales_credit_change',
+    ),
+    'expense.expense': Source(
+        'expense', lambda expense: [expense.title, expense.description],
+        lambda expense: expense.title,
+        lambda expense: expense.created_by_id, 'expenses:expense_update',
+    ),
+    'sales.product': Source(
+        'product', lambda product: [product.name],
+        lambda product: product.name,
+        lambda product: None, 'sales:product_update',
+    ),
+}
+KINDS = {source.kind: source for source in SOURCES.values()}
+KIND_LABELS = {'product': "Produits", 'sale': "Ventes", 'credit': "Crédits", 'expense': "Dépenses"}
+
+
+def _source(instance):
+    return SOURCES.get(instance._meta.label_lower)
+
+
+def terms(text):
+    """Mots normalisés d'un texte : minuscules, sans accents."""
+    if not text:
+        return []
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    plain = ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+    # Mêmes séparateurs que le tokenizer unicode61 de FTS5 (le « _ » en est un)
+    return [term[:MAX_TERM_LENGTH] for term in re.findall(r'[^\W_]+', plain)]
+
+
+_fts5 = {}
+
+
+def fts5(using):
+    """La base `using` a-t-elle la table FTS5 ? (sinon : index de repli SearchTerm)"""
+    if not settings.SEARCH_FTS5:
+        return False
+    if using not in _fts5:
+        connection = connections[using]
+        _fts5[using] = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _fts5[using]
+
+
+# ---------------------------------------------
+# Mise à jour de l'index
+# ---------------------------------------------
+def _entry(instance):
+    from sales.models import SearchEntry
+
+    source = _source(instance)
+    words = [term for text in source.texts(instance) for term in terms(text)]
+    if not words:
+        return None
+    return SearchEntry(
+        kind=source.kind, object_id=instance.pk, owner_id=source.owner(instance),
+        label=source.label(instance)[:255], body=' '.join(words),
+    )
+
+
+def index(instance, using, created=False):
+    """Indexe (ou réindexe) un objet dans la base `using`."""
+    from sales.models import SearchEntry
+
+    entry = _entry(instance)
+    if entry is None and created:
+        return None
+    if entry is None or not fts5(using):
+        return index_many([instance], using)
+    # Déclencheurs FTS5 : une seule requête par objet
+    if not created and SearchEntry.objects.using(using).filter(kind=entry.kind, object_id=entry.object_id).update(
+        owner_id=entry.owner_id, label=entry.label, body=entry.body,
+    ):
+        return None
+    entry.save(using=using)
+    return None
+
+
+def index_many(instances, using, replace=True):
+    """Indexe des objets en bloc ; `replace=False` s'ils ne sont pas encore indexés."""
+    from sales.models import SearchEntry, SearchTerm
+
+    instances = [instance for instance in instances if _source(instance)]
+    with transaction.atomic(using=using):
+        if replace:
+            by_kind = {}
+            for instance in instances:
+                by_kind.setdefault(_source(instance).kind, []).append(instance.pk)
+            for kind, ids in by_kind.items():
+                unindex_ids(kind, ids, using)
+
+        entries = SearchEntry.objects.using(using).bulk_create(
+            [entry for entry in map(_entry, instances) if entry is not None]
+        )
+        if not fts5(using):
+            SearchTerm.objects.using(using).bulk_create([
+                SearchTerm(entry=entry, term=term)
+                for entry in entries for term in set(entry.body.split())
+            ])
+    return entries
+
+
+def unindex(instance, using):
+    source = _source(instance)
+    unindex_ids(source.kind, [instance.pk], using)
+
+
+def unindex_ids(kind, ids, using):
+    """Retire de l'index de `using` les objets `ids` du type `kind`."""
+    from sales.models import SearchEntry, SearchTerm
+
+    # Suppression SQL directe : l'index n'a pas de signaux à jouer
+    entries = SearchEntry.objects.using(using).filter(kind=kind, object_id__in=ids)
+    if not fts5(using):
+        SearchTerm.objects.using(using).filter(entry__in=entries.values('pk'))._raw_delete(using)
+    entries._raw_delete(using)
+
+
+def rebuild(kinds=None, batch_size=2000):
+    """
+    Reconstruit l'index de la base courante (sharding.current_alias()),
+    pour les types `kinds` (tous par défaut). Les produits, référentiel
+    recopié, ne sont indexés que dans la base par défaut.
+    Retourne {type: entrées écrites}.
+    """
+    from django.apps import apps
+    from sales.models import SearchEntry, SearchTerm
+
+    using = sharding.current_alias()
+    written = {}
+    for label, source in SOURCES.items():
+        if kinds and source.kind not in kinds:
+            continue
+        if source.kind == 'product' and using != DEFAULT_DB_ALIAS:
+            continue
+        with transaction.atomic(using=using):
+            entries = SearchEntry.objects.using(using).filter(kind=source.kind)
+            SearchTerm.objects.using(using).filter(entry__in=entries.values('pk'))._raw_delete(using)
+            entries._raw_delete(using)
+
+        model = apps.get_model(label)
+        rows = model._base_manager.using(using).order_by('pk').iterator(chunk_size=batch_size)
+        written[source.kind] = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                written[source.kind] += len(index_many(batch, using, replace=False))
+                batch = []
+        if batch:
+            written[source.kind] += len(index_many(batch, using, replace=False))
+
+    if fts5(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return written
+
+
+# ---------------------------------------------
+# Recherche
+# ---------------------------------------------
+def _match_expression(kind, words):
+    # Le type, puis chaque mot du texte en préfixe : tous requis
+    return f'kind : "{kind}" AND ' + ' AND '.join(f'body : "{word}"*' for word in words)
+
+
+def _with_prefixes(entries, words):
+    # Préfixe en plage [mot, mot suivant) : l'index (term, entry) sert sur tout moteur
+    for word in words:
+        following = word[:-1] + chr(ord(word[-1]) + 1)
+        entries = entries.filter(terms__term__gte=word, terms__term__lt=following)
+    return entries.distinct()
+
+
+def matching_ids(kind, text, using):
+    """
+    Sous-requête des identifiants d'objets `kind` dont le texte contient
+    chaque mot de `text` en préfixe, à passer à filter(pk__in=…) sur la
+    même base. None si `text` ne contient aucun mot.
+    """
+    from sales.models import SearchEntry
+
+    words = terms(text)
+    if not words:
+        return None
+    if fts5(using):
+        return RawSQL(
+            f'SELECT e.object_id FROM {FTS_TABLE} CROSS JOIN sales_searchentry e ON e.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s',
+            [_match_expression(kind, words)],
+        )
+    return _with_prefixes(SearchEntry.objects.using(using).filter(kind=kind), words).values('object_id')
+
+
+def filter_queryset(queryset, kind, text):
+    """`queryset` restreint aux objets dont le texte indexé correspond à `text`."""
+    ids = matching_ids(kind, text, queryset.db)
+    return queryset if ids is None else queryset.filter(pk__in=ids)
+
+
+def object_ids(kind, text, using=DEFAULT_DB_ALIAS):
+    """Liste des identifiants correspondants (pour filtrer dans une autre base)."""
+    from sales.models import SearchEntry
+
+    ids = matching_ids(kind, text, using)
+    if ids is None:
+        return None
+    if isinstance(ids, RawSQL):
+        return list(SearchEntry.objects.using(using).filter(kind=kind, object_id__in=ids)
+                    .values_list('object_id', flat=True))
+    return list(ids.values_list('object_id', flat=True))
+
+
+def _hits(alias, kind, words, owner_id, limit):
+    """[(rang, libellé, identifiant)] d'une base, du plus pertinent au moins pertinent."""
+    from sales.models import SearchEntry
+
+    if fts5(alias):
+        # bm25 calculé sur les SEARCH_CANDIDATES correspondances les plus
+        # récentes seulement : un préfixe très courant reste rapide
+        sql = (
+            f'SELECT bm25({FTS_TABLE}, 0.0, 1.0) AS rank, e.label, e.object_id '
+            f'FROM {FTS_TABLE} CROSS JOIN sales_searchentry e ON e.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s'
+        )
+        params = [_match_expression(kind, words)]
+        if owner_id is not None:
+            sql += ' AND e.owner_id = %s'
+            params.append(owner_id)
+        sql = f'SELECT * FROM ({sql} ORDER BY {FTS_TABLE}.rowid DESC LIMIT %s) ORDER BY rank LIMIT %s'
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, params + [SEARCH_CANDIDATES, limit])
+            return [tuple(row) for row in cursor.fetchall()]
+
+    entries = SearchEntry.objects.using(alias).filter(kind=kind)
+    if owner_id is not None:
+        entries = entries.filter(owner_id=owner_id)
+    rows = _with_prefixes(entries, words).order_by('-pk').values_list('pk', 'label', 'object_id')[:limit]
+    return [(-pk, label, object_id) for pk, label, object_id in rows]
+
+
+def visible_kinds(user):
+    """{type: vendeur imposé (None : tous)} des objets que `user` peut retrouver."""
+    kinds = {'product': None, 'sale': None if user.est_admin() else user.pk}
+    if user.has_permission(Permissions.VIEW_DEPENSES):
+        kinds['expense'] = None
+    if user.est_admin():
+        kinds['credit'] = None
+    return kinds
+
+
+def search(user, text, limit=10):
+    """
+    Recherche globale : {type: [{'label', 'url'}]} des `limit` meilleurs
+    résultats par type, sur les bases de l'utilisateur.
+    """
+    from sales.models import SearchEntry
+
+    words = terms(text)
+    if not words:
+        return {}
+    kinds = visible_kinds(user)
+    antenne_id = None if user.est_admin() else user.antenne_id
+    pages = sharding.fan_out(SearchEntry, lambda alias: {
+        kind: _hits(alias, kind, words, owner_id, limit) for kind, owner_id in kinds.items()
+    }, antenne_id)
+
+    results = {}
+    for kind in kinds:
+        merged = heapq.merge(*(page[kind] for page in pages))
+        hits = [{'label': label, 'url': reverse(KINDS[kind].url_name, args=[object_id])}
+                for _, (_, label, object_id) in zip(range(limit), merged)]
+        if hits:
+            results[kind] = hits
+    return results
+
+
+@login_required
+def search_view(request):
+    """Boîte de recherche globale (barre latérale)."""
+    text = request.GET.get('q', '').strip()
+    results = search(request.user, text) if text else {}
+    return render(request, 'search.html', {
+        'q': text,
+        'results': [(KIND_LABELS[kind], hits) for kind, hits in results.items()],
+    })
@@ -42,6 +42,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Latence et requêtes SQL par vue, exposées sur /metrics/ ; placé en tête
+    # pour compter aussi les middlewares suivants (session, utilisateur...)
+    'core.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,6 +54,10 @@ MIDDLEWARE = [
 
     # Notre middleware custom
     'accounts.middleware.BlockedUserMiddleware',
+    # Base répartie de la requête (antenne de l'utilisateur), voir core/sharding.py
+    'core.sharding.ShardMiddleware',
+    # Pages de consultation lues sur la réplique, voir core/replica.py
+    'core.replica.ReplicaMiddleware',
 
 ]
 
@@ -99,6 +106,89 @@ DATABASES = {
     }
 }
 
+# Bases réparties par ville (voir core/sharding.py) : UNICOM_SHARDS=n
+# ajoute n bases shard_0 … shard_{n-1} (fichiers SQLite dans
+# UNICOM_SHARD_DIR, par défaut à côté de db.sqlite3) pour les données
+# d'exploitation des antennes ; la base par défaut garde le référentiel.
+# Sans cette variable, tout reste dans la base par défaut.
+SHARD_DIR = Path(os.environ.get('UNICOM_SHARD_DIR', BASE_DIR))
+SHARDS = [f'shard_{i}' for i in range(int(os.environ.get('UNICOM_SHARDS', 0)))]
+for _alias in SHARDS:
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SHARD_DIR / f'{_alias}.sqlite3',
+    }
+
+# Réplique de lecture de la base par défaut (voir core/replica.py) :
+# UNICOM_REPLICA=chemin du fichier SQLite de la réplique. En local, la
+# commande copy_replica en tient une copie périodique.
+DATABASE_REPLICAS = {}
+if os.environ.get('UNICOM_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['UNICOM_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = {'default': 'replica'}
+
+# Retard maximal admis (secondes) avant de revenir à la base principale
+REPLICA_MAX_LAG = float(os.environ.get('UNICOM_REPLICA_MAX_LAG', 30))
+# Intervalle de relecture du retard, par processus
+REPLICA_LAG_CHECK_SECONDS = 5
+# Après une écriture, le navigateur lit la base principale pendant ce délai
+REPLICA_STICKY_SECONDS = 15
+
+DATABASE_ROUTERS = ['core.replica.ReplicaRouter', 'core.sharding.ShardRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Mémoire locale par défaut ; UNICOM_CACHE_DIR active le cache fichier,
+# partagé entre les processus d'un même serveur.
+
+if os.environ.get('UNICOM_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['UNICOM_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unicom',
+        }
+    }
+
+# Tables de référence en mémoire par processus (voir core/process_cache.py) :
+# rechargées au plus tard après ce délai, en secondes, même sans
+# invalidation visible (cache en mémoire locale, plusieurs processus)
+PROCESS_CACHE_MAX_AGE = 60
+
+# Rapports périodiques en cache (voir sales/report_cache.py). Les versions
+# qui invalident les rapports sont dans ce cache : avec la mémoire locale,
+# un processus ne voit pas les invalidations des autres, et ses rapports
+# ne sont gardés que REPORT_CACHE_LOCAL_TIMEOUT secondes. Avec plusieurs
+# processus, définir UNICOM_CACHE_DIR (cache partagé).
+REPORT_CACHE_ALIAS = 'default'
+REPORT_CACHE_TIMEOUT = 3600
+REPORT_CACHE_LOCAL_TIMEOUT = 60
+
+# Listes paginées par clé (voir core/pagination.py) : total compté au plus
+# jusqu'à cette limite, et gardé en cache
+PAGINATION_TOTAL_LIMIT = 1000
+PAGINATION_TOTAL_TIMEOUT = 60
+
+# Recherche (voir core/search.py) : table FTS5 sous SQLite ; False force
+# l'index de repli SearchTerm (après rebuild_search_index)
+SEARCH_FTS5 = True
+
+# Archivage de l'historique (voir expense/archive.py) : ventes et
+# transactions plus anciennes que l'horizon, déplacées par lots
+ARCHIVE_HORIZON_DAYS = int(os.environ.get('UNICOM_ARCHIVE_HORIZON_DAYS', 365))
+ARCHIVE_BATCH_SIZE = 5000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
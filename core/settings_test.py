@@ -0,0 +1,13 @@
+"""
+Réglages de la suite de tests (manage.py test les prend par défaut).
+
+Deux bases réparties sont déclarées (voir core/sharding.py), pour que
+les tests de répartition tournent sans variable d'environnement ; les
+bases de test SQLite sont en mémoire. UNICOM_SHARDS=0 relance la suite
+sur la seule base par défaut.
+"""
+import os
+
+os.environ.setdefault('UNICOM_SHARDS', '2')
+
+from .settings import *
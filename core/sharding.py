@@ -0,0 +1,443 @@
+# core/sharding.py
+"""
+Répartition des données d'exploitation des antennes sur plusieurs bases.
+
+Les ventes, créances, comptes, transactions et dépenses d'une antenne
+(SHARDED_MODELS) vivent dans la base de sa ville : les villes sont
+réparties entre les bases SHARDS (shard_0 … shard_{n-1}, voir
+core/settings.py) par ville_id modulo n. La base par défaut garde le
+référentiel (utilisateurs, antennes, produits, catégories, barèmes,
+seuils) et les données d'exploitation centrales : comptes sans antenne,
+ventes des utilisateurs centraux, et données antérieures à la
+répartition.
+
+Toutes les bases ont le schéma complet. Le référentiel n'est modifié que
+dans la base par défaut ; chaque modification y est recopiée dans les
+bases réparties à sa validation (voir expense/signals.py, commande
+sync_shards) : les jointures d'une base répartie (produit, catégorie,
+vendeur…) restent donc locales.
+
+Sans base répartie configurée, ShardRouter ne choisit rien : tout reste
+dans la base par défaut, comme avant.
+
+Choix de la base d'un modèle réparti, dans l'ordre :
+1. la base d'où l'objet (ou l'objet parent d'une relation) a été chargé
+   ou dans laquelle il a été enregistré ;
+2. la base courante, fixée par use_shard() : ShardMiddleware la fixe pour
+   la requête (antenne de l'utilisateur, ou objet désigné par l'URL), les
+   récepteurs de signaux la reprennent de l'instance (on_instance_database) ;
+3. la base déduite de l'objet : identifiant (chaque base a sa plage,
+   SHARD_ID_SPAN), vendeur, compte ou antenne ;
+4. la base par défaut.
+
+Les identifiants sont uniques sur l'ensemble des bases : la base n de
+SHARDS numérote à partir de (n + 1) * SHARD_ID_SPAN, la base par défaut
+en dessous. Les rapports toutes antennes interrogent chaque base et
+fusionnent (fan_out) ; les exports et listes toutes antennes fusionnent
+les lignes de chaque base, lues dans le même ordre (merged).
+"""
+import functools
+import heapq
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, transaction
+
+from .process_cache import ProcessCache
+
+SHARD_ID_SPAN = 10 ** 12
+
+SHARDED_MODELS = {
+    'sales': {
+        'sale', 'credit', 'creditpayment', 'dailysalesummary', 'archivedsale', 'archivebatch',
+        # Index de recherche : chaque base indexe ses propres objets
+        'searchentry', 'searchterm',
+        # Clients : une fiche par base où le client a acheté
+        'customer',
+    },
+    'expense': {
+        'accountmoney', 'expense', 'approvalstep', 'transaction',
+        'balancecheckpoint', 'archivedtransaction',
+    },
+}
+
+# Applications dont les autres modèles forment le référentiel recopié
+REFERENCE_APPS = ('accounts', 'sales', 'expense')
+
+_current = ContextVar('unicom_shard', default=None)
+
+
+def shards():
+    return list(getattr(settings, 'SHARDS', []))
+
+
+def enabled():
+    return bool(shards())
+
+
+def is_sharded(model):
+    return model._meta.model_name in SHARDED_MODELS.get(model._meta.app_label, ())
+
+
+def is_reference(model):
+    return model._meta.app_label in REFERENCE_APPS and not is_sharded(model)
+
+
+def current():
+    """Base fixée par use_shard() (None hors contexte)."""
+    return _current.get()
+
+
+def current_alias():
+    """Base courante, pour transaction.atomic(using=…) et on_commit(using=…)."""
+    return _current.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_shard(alias):
+    """Dirige les modèles répartis vers `alias` le temps du bloc (None : sans effet)."""
+    token = _current.set(alias) if alias else None
+    try:
+        yield alias
+    finally:
+        if token is not None:
+            _current.reset(token)
+
+
+def pin(alias):
+    """Fixe la base courante pour le reste du fil d'exécution (processus de travail)."""
+    if alias:
+        _current.set(alias)
+
+
+# ---------------------------------------------
+# Base d'une ville, d'une antenne, d'un vendeur, d'un identifiant
+# ---------------------------------------------
+def _load_antenne_villes():
+    from accounts.models import Antenne
+    return dict(Antenne.objects.using(DEFAULT_DB_ALIAS).values_list('pk', 'lieux_id'))
+
+
+_antenne_villes = ProcessCache('sharding:antennes', _load_antenne_villes)
+
+
+def invalidate_antennes():
+    _antenne_villes.invalidate()
+
+
+def shard_for_ville(ville_id):
+    aliases = shards()
+    if not aliases:
+        return None
+    if ville_id is None:
+        return DEFAULT_DB_ALIAS
+    return aliases[ville_id % len(aliases)]
+
+
+def shard_for_antenne(antenne_id):
+    """Base de l'antenne (la base par défaut pour « pas d'antenne »)."""
+    if not enabled():
+        return None
+    return shard_for_ville(_antenne_villes.get().get(antenne_id))
+
+
+def shard_for_user(user_id):
+    from expense import resolver
+    if not enabled():
+        return None
+    return shard_for_antenne(resolver.seller_antenne(user_id))
+
+
+def shard_for_pk(pk):
+    """Base d'un identifiant d'objet réparti (None s'il n'appartient à aucune plage)."""
+    aliases = shards()
+    if not pk or not aliases:
+        return None
+    index = pk // SHARD_ID_SPAN - 1
+    if index < 0:
+        return DEFAULT_DB_ALIAS
+    return aliases[index] if index < len(aliases) else None
+
+
+def _shard_of_instance(instance):
+    from expense import resolver
+    model = instance._meta.model_name
+    if instance.pk:
+        return shard_for_pk(instance.pk)
+    if model == 'sale':
+        return shard_for_user(instance.created_by_id)
+    if model in ('accountmoney', 'dailysalesummary'):
+        return shard_for_antenne(instance.antenne_id)
+    if model in ('transaction', 'balancecheckpoint', 'archivedtransaction', 'expense'):
+        # Le mouvement (ou la dépense) suit son compte
+        return shard_for_antenne(resolver.account_antenne(instance.account_id))
+    if model == 'credit':
+        return shard_for_pk(instance.sale_id)
+    if model == 'approvalstep':
+        return shard_for_pk(instance.expense_id)
+    return None
+
+
+class ShardRouter:
+    """Voir la documentation du module."""
+
+    def _db(self, model, instance=None, **hints):
+        if not enabled() or not is_sharded(model):
+            return None
+        # Objet déjà enregistré. Un objet neuf reçoit la base de ses objets
+        # liés (l'antenne, venue de la base par défaut) : elle ne compte pas.
+        if instance is not None and is_sharded(type(instance)) and not instance._state.adding:
+            return instance._state.db
+        if current():
+            return current()
+        if isinstance(instance, model):
+            return _shard_of_instance(instance)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not enabled():
+            return None
+        # Le référentiel est présent dans toutes les bases ; un objet neuf
+        # n'a pas encore de base (elle se déduit à l'enregistrement)
+        # _meta.model plutôt que type() : request.user est un SimpleLazyObject
+        if not is_sharded(obj1._meta.model) or not is_sharded(obj2._meta.model):
+            return True
+        if obj1._state.adding or obj2._state.adding:
+            return True
+        return obj1._state.db == obj2._state.db
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet des modèles répartis : sans base imposée, create() laisse
+    ShardRouter la déduire de l'objet créé (vendeur, compte, antenne…).
+    """
+
+    def create(self, **kwargs):
+        if self._db is None and enabled():
+            alias = router.db_for_write(self.model, instance=self.model(**kwargs))
+            return self.using(alias).create(**kwargs)
+        return super().create(**kwargs)
+
+
+def on_instance_database(receiver):
+    """
+    Exécute un récepteur de signal (pre_save, post_save, post_delete…) dans
+    la base de l'instance : les requêtes qu'il fait sur les modèles
+    répartis vont dans la même base qu'elle.
+    """
+    @functools.wraps(receiver)
+    def wrapper(sender, *args, **kwargs):
+        with use_shard(kwargs.get('using') if enabled() else None):
+            return receiver(sender, *args, **kwargs)
+    return wrapper
+
+
+# Routes dont l'URL désigne un objet réparti : (nom de la route, paramètre)
+OBJECT_ROUTES = {
+    'sales:sale_update': 'pk',
+    'sales:sale_validate': 'pk',
+    'sales:sale_reject': 'pk',
+    'sales:customer_ledger': 'pk',
+    'sales:credit_payment': 'pk',
+    'expenses:expense_update': 'pk',
+    'expenses:expense_delete': 'pk',
+    'expenses:approve_expense': 'expense_id',
+    'expenses:reject_expense': 'expense_id',
+}
+
+
+class ShardMiddleware:
+    """
+    Fixe la base courante pour la requête : celle de l'objet désigné par
+    l'URL (OBJECT_ROUTES), sinon celle de l'antenne de l'utilisateur. Les
+    utilisateurs centraux (sans antenne) travaillent dans la base par
+    défaut ; les rapports toutes antennes interrogent toutes les bases.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+
+        user = getattr(request, 'user', None)
+        shard = shard_for_user(user.pk) if user is not None and user.is_authenticated else None
+        # Toujours un jeton, même sans base : process_view peut en fixer une
+        token = _current.set(shard)
+        try:
+            response = self.get_response(request)
+            shard = current()
+        finally:
+            _current.reset(token)
+        if shard and response.streaming:
+            # Le contenu d'un export est produit après la sortie du middleware
+            response.streaming_content = _pinned(response.streaming_content, shard)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        param = OBJECT_ROUTES.get(request.resolver_match.view_name) if enabled() else None
+        if param:
+            shard = shard_for_pk(view_kwargs.get(param))
+            if shard:
+                # Annulé à la sortie de __call__
+                _current.set(shard)
+        return None
+
+
+def _pinned(iterable, alias):
+    with use_shard(alias):
+        yield from iterable
+
+
+# ---------------------------------------------
+# Recopie du référentiel dans les bases réparties
+# ---------------------------------------------
+def _row(instance):
+    """Copie détachée des colonnes de l'instance."""
+    model = type(instance)
+    return model(**{field.attname: getattr(instance, field.attname) for field in model._meta.concrete_fields})
+
+
+def mirror_save(instance, update_fields=None):
+    """Recopie une ligne du référentiel dans chaque base répartie (à la validation)."""
+    model, row = type(instance), _row(instance)
+    if update_fields is not None:
+        fields = [model._meta.get_field(name).attname for name in update_fields]
+    else:
+        fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+
+    def copy():
+        for alias in shards():
+            manager = model._base_manager.using(alias)
+            if not manager.filter(pk=row.pk).update(**{name: getattr(row, name) for name in fields}):
+                manager.bulk_create([_row(row)])
+
+    transaction.on_commit(copy, using=DEFAULT_DB_ALIAS)
+
+
+def mirror_delete(instance):
+    """Supprime une ligne du référentiel dans chaque base répartie, avec ses cascades."""
+    model, pk = type(instance), instance.pk
+
+    def delete():
+        for alias in shards():
+            model._base_manager.using(alias).filter(pk=pk).delete()
+
+    transaction.on_commit(delete, using=DEFAULT_DB_ALIAS)
+
+
+def reference_models():
+    from django.apps import apps
+    return [model for model in apps.get_models() if model._meta.managed and is_reference(model)]
+
+
+def sync_reference(alias, batch_size=1000):
+    """
+    Aligne le référentiel de la base `alias` sur la base par défaut.
+    Retourne {modèle: lignes recopiées}.
+    """
+    copied = {}
+    # Contraintes vérifiées à la validation : l'ordre des tables est libre
+    with transaction.atomic(using=alias):
+        for model in reference_models():
+            source = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+            target = model._base_manager.using(alias)
+            fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+            present = set(target.values_list('pk', flat=True))
+            kept = set()
+            for start in range(0, source.count(), batch_size):
+                rows = [_row(obj) for obj in source[start:start + batch_size]]
+                kept.update(row.pk for row in rows)
+                updates = [row for row in rows if row.pk in present]
+                if updates and fields:
+                    target.bulk_update(updates, fields, batch_size=batch_size)
+                target.bulk_create([row for row in rows if row.pk not in present], batch_size=batch_size)
+            stale = list(present - kept)
+            for start in range(0, len(stale), batch_size):
+                target.filter(pk__in=stale[start:start + batch_size]).delete()
+            copied[model._meta.label] = len(kept)
+    return copied
+
+
+# ---------------------------------------------
+# Plages d'identifiants et interrogation de toutes les bases
+# ---------------------------------------------
+def seed_sequences(models, using):
+    """
+    Fait démarrer la numérotation des modèles répartis de la base `using`
+    au début de sa plage (sans effet si elle l'a déjà dépassé).
+    """
+    if using not in shards():
+        return
+    start = (shards().index(using) + 1) * SHARD_ID_SPAN
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in models:
+            if not is_sharded(model):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start])
+                elif row[0] < start:
+                    cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [start, table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    "GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM " + connection.ops.quote_name(table) + ")))",
+                    [table, start],
+                )
+
+
+def databases_for(model, antenne_id=None):
+    """
+    Bases à interroger pour `model` : la base par défaut et celle de
+    l'antenne, ou toutes.
+    """
+    if not enabled() or not is_sharded(model):
+        return [DEFAULT_DB_ALIAS]
+    if antenne_id is not None:
+        return list(dict.fromkeys([DEFAULT_DB_ALIAS, shard_for_antenne(antenne_id)]))
+    return [DEFAULT_DB_ALIAS] + shards()
+
+
+def fan_out(model, query, antenne_id=None):
+    """
+    Exécute `query(alias)` sur chaque base de `model` (voir databases_for),
+    dans le contexte de cette base, et retourne la liste des résultats.
+    """
+    results = []
+    for alias in databases_for(model, antenne_id):
+        with use_shard(alias):
+            results.append(query(alias))
+    return results
+
+
+def bind(queryset):
+    """
+    `queryset` lié à la base que les routeurs lui donnent maintenant (base
+    courante, réplique…) : il peut être lu plus tard, hors de ce contexte.
+    """
+    return queryset.using(queryset.db)
+
+
+def merged(model, query, key, antenne_id=None, reverse=False):
+    """
+    Lignes de toutes les bases de `model`, fusionnées dans l'ordre de `key` :
+    `query(alias)` retourne un itérable des lignes d'une base, triées selon
+    `key` (décroissant si `reverse`) et liées à leur base (voir bind). Les
+    bases sont lues au fil de la consommation, sans charger tous leurs
+    résultats.
+    """
+    return heapq.merge(*fan_out(model, query, antenne_id), key=key, reverse=reverse)
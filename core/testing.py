@@ -0,0 +1,49 @@
+# core/testing.py
+"""
+Base commune des tests des ventes et des dépenses.
+
+Chaque test part d'un gérant rattaché à l'antenne « Centre » de
+N'Djamena, avec la caisse de l'antenne et un produit « Copie » de la
+catégorie « Impression ». Les tests passent aussi avec des bases
+réparties (voir core/sharding.py) : `self.shard` est la base de
+l'antenne, où lire ses ventes, mouvements et créances.
+"""
+from django.test import TransactionTestCase
+
+from accounts.models import Antenne, User, Ville
+from core import sharding
+from expense.models import AccountMoney
+from sales.models import Category, Product, Sale
+
+
+class AntenneTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    # Prix standard du produit vendu
+    standard_price = 10
+
+    def setUp(self):
+        sharding.invalidate_antennes()
+        self.category = Category.objects.create(name="Impression", type="service")
+        self.product = Product.objects.create(
+            category=self.category, name="Copie", standard_price=self.standard_price, is_validated=True,
+        )
+        self.seller = User.objects.create(username="vendeur", role=User.Role.GERANT)
+        self.antenne = Antenne.objects.create(
+            nom="Centre", lieux=Ville.objects.create(name="N'Djamena"), gerant=self.seller,
+        )
+        self.seller.antenne = self.antenne
+        self.seller.save()
+        self.caisse = AccountMoney.objects.create(name="Caisse", type="CAISSE", antenne=self.antenne)
+        self.shard = self.caisse._state.db
+
+    def _colleague(self, username, role=User.Role.GERANT):
+        """Un autre utilisateur de l'antenne."""
+        return User.objects.create(username=username, role=role, antenne=self.antenne)
+
+    def _sell(self, quantity=1, payment_method="Cash", customer=None, seller=None, product=None):
+        """Une vente validée, de `self.product` par `self.seller` par défaut."""
+        return Sale.objects.create(
+            product=product or self.product, quantity=quantity, created_by=seller or self.seller,
+            payment_method=payment_method, customer=customer, status=Sale.VALIDATED,
+        )
@@ -4,6 +4,9 @@ from django.urls import path, include
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 
+from core.metrics import metrics_view
+from core.search import search_view
+
 @login_required
 def index(request):
     """
@@ -15,6 +18,8 @@ urlpatterns = [
     path("accounts/", include("accounts.urls", namespace="accounts")),  # <--- Ici
     path("sales/", include("sales.urls", namespace="sales")),  # <--- Ici
     path("expenses/", include("expense.urls", namespace="expenses")),  # <--- Ici
+    path('metrics/', metrics_view, name='metrics'),
+    path('recherche/', search_view, name='search'),
     
     path('', index, name='index'),
 ]
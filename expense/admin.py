@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import AccountMoney, ExpenseCategory, ValidationThreshold, Expense, Transaction, ApprovalStep
+from .models import AccountMoney, BalanceCheckpoint, ExpenseCategory, ValidationThreshold, Expense, Transaction, ApprovalStep
 from django.conf import settings
 
 # ---------------------------------------------
@@ -60,10 +60,32 @@ class ExpenseAdmin(admin.ModelAdmin):
 # ---------------------------------------------
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
+    """Journal en écriture seule : ajout possible, ni modification ni suppression."""
     list_display = ('account', 'type', 'amount', 'expense', 'created_at')
     list_filter = ('type', 'account')
     search_fields = ('expense__title',)
 
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+# ---------------------------------------------
+# 5 bis. Points de solde
+# ---------------------------------------------
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('account', 'as_of', 'balance', 'last_transaction_id', 'created_at')
+    list_filter = ('account',)
+    date_hierarchy = 'as_of'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # ---------------------------------------------
 # 6. ApprovalStep (multi-niveaux)
 # ---------------------------------------------
@@ -0,0 +1,126 @@
+# expense/archive.py
+"""
+Archivage de l'historique : ventes (Sale) et transactions (Transaction)
+antérieures à un horizon sont déplacées, par lots, vers ArchivedSale et
+ArchivedTransaction, pour que les tables courantes restent petites.
+
+Ce qui est retiré des tables courantes est remplacé par des lignes de
+report :
+- par compte, un BalanceCheckpoint à l'horizon : le rapprochement et
+  balance_as_of partent de ce solde ;
+- par antenne, l'agrégat journalier DailySaleSummary des jours archivés,
+  reconstruit une dernière fois avant le déplacement puis conservé
+  (rollup.rebuild ne touche plus aux jours antérieurs à l'horizon).
+
+Une vente encore référencée par une créance ou par une transaction
+courante reste dans la table courante. Les suppressions sont faites
+sans signaux : l'agrégat et les soldes ne doivent pas bouger.
+Chaque lot est une transaction ; une passe interrompue reprend là où
+elle s'est arrêtée quand on la relance avec le même horizon.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from core import search, sharding
+from sales import report_cache, rollup
+from sales.models import ArchiveBatch, ArchivedSale, Credit, Sale
+from .ledger import create_checkpoints, end_of_day
+from .models import ArchivedTransaction, Transaction
+
+TRANSACTION_FIELDS = ('id', 'account_id', 'type', 'amount', 'expense_id', 'sale_id', 'created_at')
+SALE_FIELDS = (
+    'id', 'product_id', 'quantity', 'total_price', 'last_total_price', 'date', 'customer',
+    'payment_method', 'created_by_id', 'status', 'client_uuid', 'created_at', 'updated_at',
+    'antenne_id', 'category_id',
+)
+
+
+def default_before():
+    """Dernier jour archivable selon ARCHIVE_HORIZON_DAYS."""
+    return timezone.localdate() - timedelta(days=settings.ARCHIVE_HORIZON_DAYS)
+
+
+def _raw_delete(queryset):
+    # Le journal refuse delete() (écriture seule) et Sale.delete() ferait
+    # jouer les signaux de l'agrégat : suppression SQL directe.
+    return queryset._raw_delete(queryset.db)
+
+
+def _move_transactions(batch, batch_size):
+    moved = 0
+    while True:
+        with transaction.atomic(using=sharding.current_alias()):
+            rows = list(
+                Transaction.objects.filter(created_at__lte=batch.horizon)
+                .order_by('id').values(*TRANSACTION_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return moved
+            ArchivedTransaction.objects.bulk_create([ArchivedTransaction(batch=batch, **row) for row in rows])
+            _raw_delete(Transaction.objects.filter(pk__in=[row['id'] for row in rows]))
+            ArchiveBatch.objects.filter(pk=batch.pk).update(transactions=F('transactions') + len(rows))
+        moved += len(rows)
+
+
+def _move_sales(batch, batch_size):
+    candidates = Sale.objects.filter(date__lte=batch.horizon).filter(
+        ~Exists(Credit.objects.filter(sale=OuterRef('pk'))),
+        ~Exists(Transaction.objects.filter(sale=OuterRef('pk'))),
+    )
+    moved = 0
+    last_id = 0
+    while True:
+        with transaction.atomic(using=sharding.current_alias()):
+            rows = list(candidates.filter(id__gt=last_id).order_by('id').values(*SALE_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            ArchivedSale.objects.bulk_create([ArchivedSale(batch=batch, **row) for row in rows])
+            _raw_delete(Sale.objects.filter(pk__in=[row['id'] for row in rows]))
+            search.unindex_ids('sale', [row['id'] for row in rows], sharding.current_alias())
+            ArchiveBatch.objects.filter(pk=batch.pk).update(sales=F('sales') + len(rows))
+        moved += len(rows)
+        last_id = rows[-1]['id']
+
+
+def archive(before=None, batch_size=None, stdout=None):
+    """
+    Archive les transactions et ventes jusqu'à la fin du jour `before`
+    (par défaut : aujourd'hui moins ARCHIVE_HORIZON_DAYS). Retourne la passe.
+    """
+    before = before or default_before()
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    horizon = end_of_day(before)
+
+    def log(message):
+        if stdout:
+            stdout.write(message)
+
+    batch = ArchiveBatch.objects.filter(horizon=horizon, finished_at__isnull=True).first()
+    if batch is None:
+        current = ArchiveBatch.current_horizon()
+        if current and horizon <= current:
+            raise ValueError(f"L'historique est déjà archivé jusqu'au {timezone.localtime(current):%Y-%m-%d}.")
+
+        # Lignes de report, avant tout déplacement
+        start = timezone.localtime(current).date() + timedelta(days=1) if current else None
+        log("  agrégat journalier des jours archivés…")
+        rollup.rebuild(start=start, end=before)
+        log("  points de solde à l'horizon…")
+        create_checkpoints(horizon)
+        batch = ArchiveBatch.objects.create(horizon=horizon)
+    else:
+        log("  reprise d'une passe interrompue…")
+
+    transactions = _move_transactions(batch, batch_size)
+    log(f"  transactions archivées : {transactions}")
+    sales = _move_sales(batch, batch_size)
+    log(f"  ventes archivées : {sales}")
+
+    ArchiveBatch.objects.filter(pk=batch.pk).update(finished_at=timezone.now())
+    report_cache.invalidate_all()
+    batch.refresh_from_db()
+    return batch
@@ -0,0 +1,170 @@
+# expense/consistency.py
+"""
+Contrôle de cohérence entre ventes, créances, dépenses et mouvements de caisse.
+
+Règles vérifiées :
+- chaque vente Cash a exactement une transaction IN, de même montant ;
+- aucune vente Crédit n'a de transaction IN, chacune a sa créance
+  (Credit.sale est un OneToOne : une créance en double est impossible) ;
+- chaque dépense APPROVED ou PAID a exactement une transaction OUT, de
+  même montant, et aucune autre dépense n'en a ;
+- une dépense n'a qu'une étape d'approbation par niveau.
+
+Les transactions archivées (ArchivedTransaction) comptent pour les
+contrôles d'absence ; doublons et écarts de montant sont contrôlés dans
+le journal courant.
+
+Chaque contrôle est une requête ensembliste (anti-jointure NOT EXISTS ou
+agrégat groupé) sur une tranche d'identifiants : les tranches sont
+indépendantes et se répartissent sur un pool de processus.
+"""
+from collections import Counter
+
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Sum
+from django.utils import timezone
+
+from core.parallel import run_parallel
+from sales.models import Credit, Sale
+from .models import ApprovalStep, ArchivedTransaction, Expense, Transaction
+
+DEFAULT_CHUNK_SIZE = 100_000
+APPROVED_STATUSES = ("APPROVED", "PAID")
+
+
+def _finding(check, model, pk, **details):
+    return {"check": check, "model": model, "id": pk, **details}
+
+
+def _check_sales(lo, hi):
+    findings = []
+    sales = Sale.objects.filter(pk__gte=lo, pk__lt=hi)
+    movements = Transaction.objects.filter(sale__gte=lo, sale__lt=hi, type="IN")
+
+    cash = sales.filter(payment_method="Cash")
+    has_movement = Transaction.objects.filter(sale=OuterRef("pk"), type="IN")
+    has_archived = ArchivedTransaction.objects.filter(sale_id=OuterRef("pk"), type="IN")
+    for row in cash.filter(~Exists(has_movement), ~Exists(has_archived)).values("pk", "total_price"):
+        findings.append(_finding("cash_sale_without_transaction", "sale", row["pk"],
+                                 total_price=row["total_price"]))
+
+    groups = (
+        movements.filter(sale__payment_method="Cash")
+        .values("sale", "sale__total_price")
+        .annotate(count=Count("id"), total=Sum("amount"))
+        .filter(Q(count__gt=1) | ~Q(total=F("sale__total_price")))
+        .order_by()
+    )
+    for row in groups:
+        check = "cash_sale_duplicate_transactions" if row["count"] > 1 else "cash_sale_amount_mismatch"
+        findings.append(_finding(check, "sale", row["sale"], transactions=row["count"],
+                                 total_price=row["sale__total_price"], transactions_total=row["total"]))
+
+    for row in (movements.filter(sale__payment_method="Credit")
+                .values("sale").annotate(count=Count("id"), total=Sum("amount")).order_by()):
+        findings.append(_finding("credit_sale_with_cash_transaction", "sale", row["sale"],
+                                 transactions=row["count"], transactions_total=row["total"]))
+
+    has_credit = Credit.objects.filter(sale=OuterRef("pk"))
+    for row in sales.filter(payment_method="Credit").filter(~Exists(has_credit)).values("pk", "total_price"):
+        findings.append(_finding("credit_sale_without_credit", "sale", row["pk"],
+                                 total_price=row["total_price"]))
+    return findings
+
+
+def _check_expenses(lo, hi):
+    findings = []
+    expenses = Expense.objects.filter(pk__gte=lo, pk__lt=hi)
+    approved = expenses.filter(status__in=APPROVED_STATUSES)
+
+    has_out = Transaction.objects.filter(expense=OuterRef("pk"), type="OUT")
+    has_archived = ArchivedTransaction.objects.filter(expense_id=OuterRef("pk"), type="OUT")
+    for row in approved.filter(~Exists(has_out), ~Exists(has_archived)).values("pk", "amount", "status"):
+        findings.append(_finding("approved_expense_without_transaction", "expense", row["pk"],
+                                 amount=row["amount"], status=row["status"]))
+
+    groups = (
+        Transaction.objects.filter(expense__gte=lo, expense__lt=hi, type="OUT")
+        .values("expense", "expense__amount", "expense__status")
+        .annotate(count=Count("id"), total=Sum("amount"))
+        .filter(
+            Q(count__gt=1) | ~Q(total=F("expense__amount"))
+            | ~Q(expense__status__in=APPROVED_STATUSES)
+        )
+        .order_by()
+    )
+    for row in groups:
+        if row["expense__status"] not in APPROVED_STATUSES:
+            check = "transaction_for_unapproved_expense"
+        elif row["count"] > 1:
+            check = "approved_expense_duplicate_transactions"
+        else:
+            check = "approved_expense_amount_mismatch"
+        findings.append(_finding(check, "expense", row["expense"], amount=row["expense__amount"],
+                                 status=row["expense__status"], transactions=row["count"],
+                                 transactions_total=row["total"]))
+
+    steps = (
+        ApprovalStep.objects.filter(expense__gte=lo, expense__lt=hi)
+        .values("expense", "level")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for row in steps:
+        findings.append(_finding("duplicate_approval_steps", "expense", row["expense"],
+                                 level=row["level"], steps=row["count"]))
+    return findings
+
+
+CHECKS = {
+    "sales": (Sale, _check_sales),
+    "expenses": (Expense, _check_expenses),
+}
+
+
+def run_chunk(task):
+    """Exécute un contrôle sur une tranche : `task` = (nom, premier id, id de fin exclu)."""
+    name, lo, hi = task
+    return CHECKS[name][1](lo, hi)
+
+
+def _chunks(model, chunk_size):
+    bounds = model.objects.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return []
+    return [
+        (lo, min(lo + chunk_size, bounds["last"] + 1))
+        for lo in range(bounds["first"], bounds["last"] + 1, chunk_size)
+    ]
+
+
+def check_consistency(checks=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, limit=None):
+    """
+    Exécute les contrôles demandés (tous par défaut) et retourne le rapport :
+    nombre d'anomalies par contrôle et liste des anomalies (au plus `limit`
+    par contrôle si `limit` est donné).
+    """
+    names = list(CHECKS) if checks is None else list(checks)
+    tasks = [
+        (name, lo, hi)
+        for name in names
+        for lo, hi in _chunks(CHECKS[name][0], chunk_size)
+    ]
+
+    started = timezone.now()
+    counts = Counter()
+    findings = []
+    for chunk in run_parallel(run_chunk, tasks, workers):
+        for finding in chunk:
+            counts[finding["check"]] += 1
+            if limit is None or counts[finding["check"]] <= limit:
+                findings.append(finding)
+
+    return {
+        "generated_at": started,
+        "checks": names,
+        "chunks": len(tasks),
+        "anomalies": sum(counts.values()),
+        "counts": dict(sorted(counts.items())),
+        "findings": findings,
+    }
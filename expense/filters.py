@@ -1,12 +1,13 @@
 import django_filters
 from django import forms
+from core import search
 from .models import Expense
 
 class ExpenseFilter(django_filters.FilterSet):
+    # Titre ou description, par préfixe dans l'index (core/search.py)
     title = django_filters.CharFilter(
-        field_name='title',
-        lookup_expr='icontains',
-        label='Titre',
+        method='filter_text',
+        label='Titre / description',
         widget=forms.TextInput(attrs={'class': 'border border-gray-300 rounded px-2 py-1'})
     )
     
@@ -22,3 +23,6 @@ class ExpenseFilter(django_filters.FilterSet):
     class Meta:
         model = Expense
         fields = ['title', 'status', 'created_at']
+
+    def filter_text(self, queryset, name, value):
+        return search.filter_queryset(queryset, 'expense', value)
@@ -0,0 +1,140 @@
+# expense/ledger.py
+"""
+Opérations sur le journal des transactions et les soldes des comptes.
+
+Les insertions en masse (bulk_create) de Transaction ne déclenchent pas
+le signal post_save qui met à jour le solde : l'appelant applique alors
+une seule variation cumulée par compte avec apply_balance_deltas.
+
+Le journal étant en écriture seule, le solde d'un compte à une date
+passée est un point de solde (BalanceCheckpoint) plus la somme des
+transactions postérieures : une somme sur une plage de l'index
+(account, created_at), quelle que soit la profondeur de l'historique.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Sum, When
+from django.utils import timezone
+
+from core import sharding
+from .models import AccountMoney, ArchivedTransaction, BalanceCheckpoint, Transaction
+
+# Un point de solde n'est posé qu'après ce délai : une transaction encore
+# en cours d'écriture ne peut plus recevoir un created_at antérieur.
+SETTLE_DELAY = timedelta(minutes=5)
+
+
+def signed_amount():
+    """Montant signé d'une transaction : IN positif, OUT négatif."""
+    return Case(
+        When(type="IN", then=F("amount")),
+        default=-F("amount"),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def balance_deltas(transactions):
+    """Variation de solde par compte pour une liste de Transaction (IN +, OUT -)."""
+    deltas = defaultdict(int)
+    for t in transactions:
+        deltas[t.account_id] += t.amount if t.type == "IN" else -t.amount
+    return dict(deltas)
+
+
+def apply_balance_deltas(deltas):
+    """Une requête UPDATE ... SET balance = balance + delta par compte."""
+    for account_id, delta in deltas.items():
+        if delta:
+            AccountMoney.objects.filter(pk=account_id).update(balance=F("balance") + delta)
+
+
+def end_of_day(day):
+    """Dernier instant (heure locale) du jour `day`."""
+    midnight = datetime.combine(day + timedelta(days=1), time.min)
+    return timezone.make_aware(midnight) - timedelta(microseconds=1)
+
+
+def _as_datetime(when):
+    if isinstance(when, datetime):
+        return when if timezone.is_aware(when) else timezone.make_aware(when)
+    if isinstance(when, date):
+        return end_of_day(when)
+    raise TypeError("Une date ou un datetime est attendu.")
+
+
+def _latest_checkpoint(account_id, when):
+    return (
+        BalanceCheckpoint.objects
+        .filter(account_id=account_id, as_of__lte=when)
+        .order_by("-as_of")
+        .values("as_of", "balance", "last_transaction_id")
+        .first()
+    )
+
+
+def _range_total(account_id, after, until):
+    """
+    Somme signée et dernier id des transactions de ]after, until], journal
+    courant et archive confondus.
+    """
+    total, last_id = 0, None
+    for model in (Transaction, ArchivedTransaction):
+        transactions = model.objects.filter(account_id=account_id, created_at__lte=until)
+        if after is not None:
+            transactions = transactions.filter(created_at__gt=after)
+        row = transactions.aggregate(total=Sum(signed_amount()), last_id=Max("id"))
+        total += row["total"] or 0
+        if row["last_id"] is not None:
+            last_id = max(last_id or 0, row["last_id"])
+    return total, last_id
+
+
+def balance_as_of(account, when):
+    """
+    Solde du compte à l'instant `when` (un datetime, ou une date pour la
+    fin de ce jour) : dernier point de solde antérieur + transactions
+    postérieures à ce point.
+    """
+    account_id = getattr(account, "pk", account)
+    when = _as_datetime(when)
+
+    checkpoint = _latest_checkpoint(account_id, when)
+    after = checkpoint["as_of"] if checkpoint else None
+    total, _ = _range_total(account_id, after, when)
+    return (checkpoint["balance"] if checkpoint else 0) + total
+
+
+def create_checkpoints(as_of, accounts=None):
+    """
+    Pose (ou recalcule) un point de solde à l'instant `as_of` pour chaque
+    compte, à partir du point précédent. Retourne les points écrits.
+    """
+    as_of = _as_datetime(as_of)
+    if as_of > timezone.now() - SETTLE_DELAY:
+        raise ValueError("Un point de solde ne peut pas être posé dans le futur ni sur les dernières minutes.")
+
+    if accounts is None:
+        account_ids = list(AccountMoney.objects.values_list("pk", flat=True))
+    else:
+        account_ids = [getattr(account, "pk", account) for account in accounts]
+
+    checkpoints = []
+    with transaction.atomic(using=sharding.current_alias()):
+        for account_id in account_ids:
+            previous = _latest_checkpoint(account_id, as_of - timedelta(microseconds=1))
+            after = previous["as_of"] if previous else None
+            total, last_id = _range_total(account_id, after, as_of)
+            if previous and previous["last_transaction_id"]:
+                last_id = max(last_id or 0, previous["last_transaction_id"])
+
+            checkpoint, _ = BalanceCheckpoint.objects.update_or_create(
+                account_id=account_id, as_of=as_of,
+                defaults={
+                    "balance": (previous["balance"] if previous else 0) + total,
+                    "last_transaction_id": last_id,
+                },
+            )
+            checkpoints.append(checkpoint)
+    return checkpoints
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from expense import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les ventes et transactions antérieures à l'horizon vers les tables "
+        "d'archive, par lots, en laissant des lignes de report (points de solde, "
+        "agrégat journalier)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', help="Dernier jour archivé (AAAA-MM-JJ), par défaut aujourd'hui "
+                             "moins ARCHIVE_HORIZON_DAYS",
+        )
+        parser.add_argument('--batch-size', type=int, help="Lignes déplacées par transaction")
+
+    def handle(self, *args, **options):
+        before = None
+        if options['before']:
+            try:
+                before = date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError(f"Date invalide : {options['before']}")
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError("--batch-size doit être positif.")
+
+        try:
+            batch = archive.archive(before=before, batch_size=options['batch_size'], stdout=self.stdout)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archivé jusqu'au {timezone.localtime(batch.horizon):%Y-%m-%d} : {batch.sales} vente(s), "
+            f"{batch.transactions} transaction(s)."
+        ))
@@ -0,0 +1,57 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.parallel import default_workers
+from expense.consistency import CHECKS, DEFAULT_CHUNK_SIZE, check_consistency
+
+
+class Command(BaseCommand):
+    help = (
+        "Contrôle la cohérence ventes / créances / dépenses / transactions "
+        "(orphelins, doublons, écarts de montant) et écrit un rapport JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='append', dest='checks', choices=sorted(CHECKS),
+                            help="Limiter à ce contrôle (répétable)")
+        parser.add_argument('--workers', type=int, default=default_workers(),
+                            help="Nombre de processus (défaut : nombre de cœurs)")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Identifiants par tranche")
+        parser.add_argument('--limit', type=int, default=1000,
+                            help="Anomalies détaillées par contrôle (0 = toutes)")
+        parser.add_argument('--output', help="Fichier du rapport JSON (défaut : sortie standard)")
+        parser.add_argument('--fail-on-anomaly', action='store_true',
+                            help="Code de sortie 1 si une anomalie est trouvée (tâche planifiée)")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size et --workers doivent être positifs.")
+
+        started = time.perf_counter()
+        report = check_consistency(
+            checks=options['checks'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            limit=options['limit'] or None,
+        )
+        report['duration_seconds'] = round(time.perf_counter() - started, 3)
+
+        payload = json.dumps(report, cls=DjangoJSONEncoder, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(payload + '\n')
+        else:
+            self.stdout.write(payload)
+
+        summary = f"{report['anomalies']} anomalie(s) sur {report['chunks']} tranche(s)."
+        if report['anomalies']:
+            self.stderr.write(self.style.WARNING(summary))
+            if options['fail_on_anomaly']:
+                sys.exit(1)
+        else:
+            self.stderr.write(self.style.SUCCESS(summary))
@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from expense import ledger
+
+
+def _month_ends(start, end):
+    """Derniers jours des mois compris entre `start` et `end` (exclu)."""
+    day = date(start.year, start.month, 1)
+    while True:
+        following = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+        last = following - timedelta(days=1)
+        if last >= end:
+            return
+        if last >= start:
+            yield last
+        day = following
+
+
+class Command(BaseCommand):
+    help = (
+        "Pose un point de solde (BalanceCheckpoint) par compte à la fin d'un jour, "
+        "par défaut hier. À lancer chaque jour (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', dest='as_of', help="Jour arrêté (AAAA-MM-JJ), par défaut hier")
+        parser.add_argument(
+            '--since', help="Pose aussi un point à chaque fin de mois depuis ce jour (AAAA-MM-JJ), "
+                            "pour un historique existant",
+        )
+        parser.add_argument('--account', type=int, action='append', dest='accounts',
+                            help="Limiter à ce compte (répétable)")
+
+    def handle(self, *args, **options):
+        as_of = self._parse_date(options['as_of']) or timezone.localdate() - timedelta(days=1)
+        since = self._parse_date(options['since'])
+        if since and since > as_of:
+            raise CommandError("--since doit précéder --as-of.")
+
+        days = list(_month_ends(since, as_of)) if since else []
+        days.append(as_of)
+
+        for day in days:
+            try:
+                checkpoints = ledger.create_checkpoints(day, accounts=options['accounts'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"{day} : {len(checkpoints)} point(s) de solde.")
+        self.stdout.write(self.style.SUCCESS("Points de solde à jour."))
+
+    def _parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Date invalide : {value}")
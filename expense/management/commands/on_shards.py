@@ -0,0 +1,46 @@
+import argparse
+
+from django.core.management import call_command, get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Lance une commande sur la base par défaut puis sur chaque base répartie "
+        "(voir core/sharding.py), dans le contexte de cette base. "
+        "Ex. : on_shards migrate, on_shards reconcile_ledger --workers 2. "
+        "L'option --database est fournie aux commandes qui l'acceptent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', action='append', dest='shards',
+                            help="Limiter à cette base (répétable)")
+        parser.add_argument('name', help="Commande à lancer")
+        parser.add_argument('command_args', nargs=argparse.REMAINDER, help="Arguments de la commande")
+
+    def handle(self, *args, **options):
+        name = options['name']
+        if name == 'on_shards':
+            raise CommandError("on_shards ne peut pas se lancer lui-même.")
+        commands = get_commands()
+        if name not in commands:
+            raise CommandError(f"Commande inconnue : {name}")
+
+        aliases = [DEFAULT_DB_ALIAS] + sharding.shards()
+        if options['shards']:
+            unknown = set(options['shards']) - set(aliases)
+            if unknown:
+                raise CommandError(f"Base(s) inconnue(s) : {', '.join(sorted(unknown))}")
+            aliases = [alias for alias in aliases if alias in options['shards']]
+
+        parser = load_command_class(commands[name], name).create_parser('manage.py', name)
+        takes_database = any(action.dest == 'database' for action in parser._actions)
+
+        for alias in aliases:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {alias} : {name}"))
+            extra = {'database': alias} if takes_database else {}
+            with sharding.use_shard(alias):
+                call_command(name, *options['command_args'], stdout=self.stdout, stderr=self.stderr, **extra)
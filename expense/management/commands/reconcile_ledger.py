@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.parallel import default_workers
+from expense.reconciliation import DEFAULT_CHUNK_SIZE, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule le solde de chaque compte à partir du journal des transactions, "
+        "le compare au solde enregistré et écrit un rapport d'écarts (JSON)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', dest='accounts',
+                            help="Limiter à ce compte (répétable)")
+        parser.add_argument('--workers', type=int, default=default_workers(),
+                            help="Nombre de processus (défaut : nombre de cœurs)")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Transactions sommées par requête")
+        parser.add_argument('--repair', action='store_true',
+                            help="Corrige les soldes en écart (sous verrou du compte)")
+        parser.add_argument('--output', help="Fichier du rapport JSON (défaut : sortie standard)")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size et --workers doivent être positifs.")
+
+        started = time.perf_counter()
+        report = reconcile(
+            account_ids=options['accounts'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            repair=options['repair'],
+        )
+        report['duration_seconds'] = round(time.perf_counter() - started, 3)
+
+        payload = json.dumps(report, cls=DjangoJSONEncoder, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(payload + '\n')
+        else:
+            self.stdout.write(payload)
+
+        summary = (
+            f"{report['accounts']} compte(s), {report['transactions']} transaction(s) : "
+            f"{report['drifted']} écart(s), {report['repaired']} corrigé(s)."
+        )
+        style = self.style.WARNING if report['drifted'] > report['repaired'] else self.style.SUCCESS
+        self.stderr.write(style(summary))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Recopie le référentiel (utilisateurs, antennes, produits, catégories, barèmes, "
+        "seuils) de la base par défaut dans chaque base répartie (voir core/sharding.py). "
+        "À lancer après la création d'une base répartie ou un import en masse ; "
+        "ensuite, chaque modification est recopiée à sa validation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', action='append', dest='shards',
+                            help="Limiter à cette base (répétable)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        aliases = sharding.shards()
+        if not aliases:
+            raise CommandError("Aucune base répartie configurée (UNICOM_SHARDS).")
+        if options['shards']:
+            unknown = set(options['shards']) - set(aliases)
+            if unknown:
+                raise CommandError(f"Base(s) inconnue(s) : {', '.join(sorted(unknown))}")
+            aliases = [alias for alias in aliases if alias in options['shards']]
+
+        for alias in aliases:
+            copied = sharding.sync_reference(alias, batch_size=options['batch_size'])
+            detail = ', '.join(f"{label} {count}" for label, count in copied.items())
+            self.stdout.write(f"{alias} : {detail}")
+        self.stdout.write(self.style.SUCCESS("Référentiel recopié."))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expense', '0002_accountmoney_antenne_expense_antenne'),
+        ('sales', '0004_sale_client_uuid_productbyantenne_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('last_transaction_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['account', '-as_of'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='expense.accountmoney'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'created_at'], name='transaction_account_date'),
+        ),
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='expense.accountmoney'),
+        ),
+        migrations.AddConstraint(
+            model_name='balancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('account', 'as_of'), name='unique_balance_checkpoint'),
+        ),
+    ]
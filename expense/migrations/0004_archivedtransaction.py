@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expense', '0003_append_only_transaction_balancecheckpoint'),
+        ('sales', '0005_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('IN', 'Entrée'), ('OUT', 'Sortie')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('expense_id', models.BigIntegerField(blank=True, null=True)),
+                ('sale_id', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='expense.accountmoney')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='sales.archivebatch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'created_at'], name='archivedtx_account_date')],
+            },
+        ),
+    ]
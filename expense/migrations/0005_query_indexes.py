@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_antenne'),
+        ('expense', '0004_archivedtransaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['status', '-created_at'], name='expense_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(condition=models.Q(('status__in', ['PENDING', 'IN_REVIEW'])), fields=['-created_at'], name='expense_pending_created'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['-created_at'], name='expense_created'),
+        ),
+    ]
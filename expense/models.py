@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
+from django.core.exceptions import ValidationError
 
 from accounts.models import Antenne, User
-from sales.models import Sale
+from core.sharding import ShardedQuerySet
+from sales.models import ArchiveBatch, Sale
 
 
 
@@ -21,6 +23,8 @@ class AccountMoney(models.Model):
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True,null=True, blank=True)  
 
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.type})"
 
@@ -73,6 +77,22 @@ class Expense(models.Model):
     status = models.CharField(max_length=20, choices=STATUS, default="PENDING")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Rapports (APPROVED sur une période) et filtre par statut
+            models.Index(fields=["status", "-created_at"], name="expense_status_created"),
+            # pending_expenses_list : dépenses à valider, les plus récentes d'abord
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(status__in=["PENDING", "IN_REVIEW"]),
+                name="expense_pending_created",
+            ),
+            # expense_list : toutes les dépenses, les plus récentes d'abord
+            models.Index(fields=["-created_at"], name="expense_created"),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.amount} FCFA"
 
@@ -80,22 +100,122 @@ class Expense(models.Model):
 # ---------------------------------------------
 # 5. TRANSACTION (entrée/sortie dans les comptes)
 # ---------------------------------------------
+APPEND_ONLY_MESSAGE = (
+    "Le journal des transactions est en écriture seule : "
+    "passez une transaction inverse pour corriger une écriture."
+)
+
+
+class TransactionQuerySet(ShardedQuerySet):
+    """Interdit les modifications et suppressions en masse du journal."""
+
+    def update(self, **kwargs):
+        # Seul cas admis : la suppression d'une vente ou d'une dépense
+        # efface la référence (on_delete=SET_NULL), le mouvement reste.
+        if set(kwargs) <= {"sale", "expense"} and all(value is None for value in kwargs.values()):
+            return super().update(**kwargs)
+        raise ValidationError(APPEND_ONLY_MESSAGE)
+
+    def delete(self):
+        raise ValidationError(APPEND_ONLY_MESSAGE)
+
+
 class Transaction(models.Model):
+    """
+    Journal des mouvements de compte, en écriture seule : une transaction
+    enregistrée n'est plus jamais modifiée ni supprimée. Le solde d'un
+    compte à une date donnée se déduit donc d'un BalanceCheckpoint et des
+    transactions postérieures (voir expense.ledger.balance_as_of).
+    """
     TRANSACTION_TYPES = (
         ("IN", "Entrée"),
         ("OUT", "Sortie"),
     )
 
-    account = models.ForeignKey(AccountMoney, on_delete=models.CASCADE)
+    account = models.ForeignKey(AccountMoney, on_delete=models.PROTECT)
     type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     expense = models.ForeignKey(Expense, on_delete=models.SET_NULL, null=True, blank=True)
     sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Sommes par compte sur une plage de dates (balance_as_of)
+            models.Index(fields=["account", "created_at"], name="transaction_account_date"),
+        ]
+
     def __str__(self):
         return f"{self.type} - {self.amount} FCFA"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError(APPEND_ONLY_MESSAGE)
+        # L'insertion et la mise à jour du solde (signal post_save) forment
+        # un tout : un solde insuffisant annule aussi l'insertion.
+        with transaction.atomic(using=kwargs.get("using") or router.db_for_write(Transaction, instance=self)):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError(APPEND_ONLY_MESSAGE)
+
+
+# ---------------------------------------------
+# 5 bis. POINT DE SOLDE (checkpoint du journal)
+# ---------------------------------------------
+class BalanceCheckpoint(models.Model):
+    """
+    Solde d'un compte arrêté à l'instant `as_of` : somme signée de toutes
+    ses transactions dont created_at <= as_of. `last_transaction_id` est la
+    plus grande transaction incluse, pour contrôle.
+    """
+    account = models.ForeignKey(AccountMoney, on_delete=models.CASCADE, related_name="checkpoints")
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    last_transaction_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["account", "as_of"], name="unique_balance_checkpoint"),
+        ]
+        ordering = ["account", "-as_of"]
+
+    def __str__(self):
+        return f"{self.account} au {self.as_of:%Y-%m-%d %H:%M} : {self.balance} FCFA"
+
+
+# ---------------------------------------------
+# 5 ter. TRANSACTION ARCHIVÉE
+# ---------------------------------------------
+class ArchivedTransaction(models.Model):
+    """
+    Transaction déplacée hors du journal courant par l'archivage (même id).
+    Le solde à l'horizon d'archivage est porté par un BalanceCheckpoint.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    account = models.ForeignKey(AccountMoney, on_delete=models.PROTECT, related_name="+")
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    expense_id = models.BigIntegerField(null=True, blank=True)
+    sale_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField()
+    batch = models.ForeignKey(ArchiveBatch, on_delete=models.PROTECT, related_name="+")
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["account", "created_at"], name="archivedtx_account_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.type} - {self.amount} FCFA (archivée)"
+
 
 # ---------------------------------------------
 # 6. APPROBATION MULTI-NIVEAUX
@@ -115,5 +235,7 @@ class ApprovalStep(models.Model):
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True,null=True, blank=True)  
 
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
         return f"Dépense {self.expense.id} — Niveau {self.level} ({self.role})"
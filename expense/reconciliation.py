@@ -0,0 +1,124 @@
+# expense/reconciliation.py
+"""
+Rapprochement des soldes (AccountMoney.balance) avec le journal.
+
+Le solde de chaque compte est recalculé à partir de ses transactions,
+par tranches d'identifiants (une somme en base par tranche, sans charger
+les lignes), puis comparé au solde enregistré. Les comptes sont traités
+indépendamment, ce qui permet de les répartir sur un pool de processus
+(core.parallel.run_parallel).
+
+Le gros du journal est sommé sans verrou jusqu'à `upto_id`, la dernière
+transaction connue au lancement. Seule la fin du journal est relue sous
+verrou du compte (select_for_update), avec le solde : un mouvement posté
+pendant le rapprochement ne peut donc pas apparaître comme un écart.
+
+Après un archivage (expense/archive.py), le calcul part du point de solde
+posé à l'horizon et ne somme que les transactions postérieures.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from core.parallel import run_parallel
+from core import sharding
+from .ledger import signed_amount
+from sales.models import ArchiveBatch
+from .models import AccountMoney, BalanceCheckpoint, Transaction
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def _aggregate(transactions):
+    row = transactions.aggregate(total=Sum(signed_amount()), count=Count('id'))
+    return row['total'] or Decimal('0'), row['count']
+
+
+def reconcile_account(task):
+    """
+    Rapproche un compte. `task` = (account_id, upto_id, chunk_size, repair,
+    horizon d'archivage ou None). Retourne un dict décrivant le compte et
+    son écart éventuel.
+    """
+    account_id, upto_id, chunk_size, repair, horizon = task
+    journal = Transaction.objects.filter(account_id=account_id)
+
+    # --- Report de l'historique archivé ---
+    carried_forward = Decimal('0')
+    if horizon:
+        journal = journal.filter(created_at__gt=horizon)
+        carried_forward = (
+            BalanceCheckpoint.objects.filter(account_id=account_id, as_of=horizon)
+            .values_list('balance', flat=True).first()
+        ) or Decimal('0')
+
+    # --- Sommes par tranches d'identifiants, sans verrou ---
+    total, count = carried_forward, 0
+    last_id = 0
+    while last_id < upto_id:
+        remaining = journal.filter(id__gt=last_id, id__lte=upto_id).order_by('id')
+        boundary = list(remaining.values_list('id', flat=True)[chunk_size - 1:chunk_size])
+        boundary = boundary[0] if boundary else upto_id
+        chunk_total, chunk_count = _aggregate(journal.filter(id__gt=last_id, id__lte=boundary))
+        total += chunk_total
+        count += chunk_count
+        last_id = boundary
+
+    # --- Fin du journal et solde, sous verrou du compte ---
+    with transaction.atomic(using=sharding.current_alias()):
+        account = (
+            AccountMoney.objects.select_for_update()
+            .filter(pk=account_id)
+            .values('name', 'type', 'antenne_id', 'balance')
+            .first()
+        )
+        if account is None:
+            return None
+
+        tail_total, tail_count = _aggregate(journal.filter(id__gt=upto_id))
+        computed = (total + tail_total).quantize(Decimal('0.01'))
+        drift = account['balance'] - computed
+
+        repaired = False
+        if drift and repair:
+            AccountMoney.objects.filter(pk=account_id).update(balance=computed)
+            repaired = True
+
+    return {
+        'account_id': account_id,
+        'name': account['name'],
+        'type': account['type'],
+        'antenne_id': account['antenne_id'],
+        'transactions': count + tail_count,
+        'carried_forward': carried_forward,
+        'stored_balance': account['balance'],
+        'computed_balance': computed,
+        'drift': drift,
+        'repaired': repaired,
+    }
+
+
+def reconcile(account_ids=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, repair=False):
+    """Rapproche les comptes demandés (tous par défaut) et retourne le rapport d'écarts."""
+    if account_ids is None:
+        account_ids = list(AccountMoney.objects.order_by('pk').values_list('pk', flat=True))
+    upto_id = Transaction.objects.aggregate(last=Max('id'))['last'] or 0
+    horizon = ArchiveBatch.current_horizon()
+
+    tasks = [(account_id, upto_id, chunk_size, repair, horizon) for account_id in account_ids]
+    results = [result for result in run_parallel(reconcile_account, tasks, workers) if result]
+    drifted = [result for result in results if result['drift']]
+
+    return {
+        'generated_at': timezone.now(),
+        'upto_transaction_id': upto_id,
+        'archive_horizon': horizon,
+        'accounts': len(results),
+        'transactions': sum(result['transactions'] for result in results),
+        'drifted': len(drifted),
+        'total_drift': sum((result['drift'] for result in drifted), Decimal('0')),
+        'repaired': sum(1 for result in drifted if result['repaired']),
+        'drift': drifted,
+    }
@@ -0,0 +1,79 @@
+# expense/resolver.py
+"""
+Rattachements résolus en mémoire, par processus, pour le chemin
+d'écriture des ventes et des mouvements :
+- vendeur -> antenne ;
+- (antenne, type) -> compte (CAISSE ou BANQUE) ;
+- compte -> antenne.
+
+Les tables sont chargées en bloc (trois requêtes, plus une par base
+répartie, voir core/sharding.py) à la première résolution du processus,
+puis servies sans requête (voir core/process_cache.py). Une sauvegarde ou suppression d'AccountMoney, ou
+un changement d'antenne d'un utilisateur (voir expense/signals.py), les
+invalide dans tous les processus ; sans cache partagé, elles expirent
+après PROCESS_CACHE_MAX_AGE secondes. Un utilisateur, une antenne ou un
+compte absent des tables (créé depuis leur chargement) les fait relire
+une fois avant de répondre None ; s'il est encore absent, il ne les fait
+plus relire avant leur invalidation ou leur expiration.
+"""
+from collections import namedtuple
+
+from core import sharding
+from core.process_cache import ProcessCache
+
+Tables = namedtuple('Tables', ['seller_antenne', 'antennes', 'antenne_accounts', 'account_antenne'])
+
+
+def _load():
+    from accounts.models import Antenne, User
+    from .models import AccountMoney
+
+    # Tous les utilisateurs, None pour ceux sans antenne : seul un inconnu fait relire la table
+    seller_antenne = dict(User._base_manager.values_list('pk', 'antenne_id'))
+    antennes = frozenset(Antenne._base_manager.values_list('pk', flat=True))
+    antenne_accounts, account_antenne = {}, {}
+    for alias in sharding.databases_for(AccountMoney):
+        accounts = AccountMoney.objects.using(alias).order_by('pk').values_list('pk', 'antenne_id', 'type')
+        for pk, antenne_id, kind in accounts:
+            account_antenne[pk] = antenne_id
+            if antenne_id is not None:
+                # Plusieurs comptes du même type : le plus ancien fait foi
+                antenne_accounts.setdefault((antenne_id, kind), pk)
+    return Tables(seller_antenne, antennes, antenne_accounts, account_antenne)
+
+
+_tables = ProcessCache('resolver:generation', _load)
+
+
+def _tables_knowing(miss, known):
+    """Les tables, relues une fois si `known(tables)` est faux (voir ProcessCache.reload)."""
+    tables = _tables.get()
+    return tables if known(tables) else _tables.reload(miss)
+
+
+def seller_antenne(user_id):
+    """Antenne du vendeur `user_id` (None s'il n'est rattaché à aucune)."""
+    if user_id is None:
+        return None
+    tables = _tables_knowing(('seller', user_id), lambda tables: user_id in tables.seller_antenne)
+    return tables.seller_antenne.get(user_id)
+
+
+def account_for(antenne_id, kind='CAISSE'):
+    """Identifiant du compte `kind` (CAISSE ou BANQUE) de l'antenne, ou None."""
+    if antenne_id is None:
+        return None
+    # Une antenne connue sans compte de ce type n'en a pas : pas de relecture
+    tables = _tables_knowing(('antenne', antenne_id), lambda tables: antenne_id in tables.antennes)
+    return tables.antenne_accounts.get((antenne_id, kind))
+
+
+def account_antenne(account_id):
+    """Antenne du compte `account_id` (None pour un compte central)."""
+    tables = _tables_knowing(('account', account_id), lambda tables: account_id in tables.account_antenne)
+    return tables.account_antenne.get(account_id)
+
+
+def invalidate(using=None):
+    """Invalide les tables, ici et (à la validation) dans les autres processus."""
+    _tables.invalidate(using)
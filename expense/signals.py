@@ -1,62 +1,67 @@
-from django.db.models.signals import post_save, pre_save
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
 from django.dispatch import receiver
+from django.db.models import F
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from accounts.models import Antenne, User
+from core import search, sharding
+from sales import report_cache
+from . import resolver, thresholds
 from .models import Expense, Transaction, ApprovalStep, AccountMoney, ValidationThreshold
 
 # ------------------------------
 # SIGNAL 1 : Gestion du solde sur Transaction
 # ------------------------------
 @receiver(post_save, sender=Transaction)
+@sharding.on_instance_database
 def update_account_balance_on_transaction(sender, instance, created, **kwargs):
     """
     Met à jour le solde du compte associé lors de la création d'une transaction.
     IN -> augmente le solde
     OUT -> diminue le solde
+
+    La mise à jour est faite en base (UPDATE ... SET balance = balance ± montant)
+    et non à partir de l'instance en mémoire : deux transactions simultanées
+    sur le même compte ne peuvent plus s'écraser. Pour une sortie, la condition
+    balance >= montant fait partie de l'UPDATE, le contrôle ne peut donc pas
+    être franchi deux fois.
     """
     if not created:
         return  # On ne fait rien si la transaction est modifiée
 
-    account = instance.account
+    accounts = AccountMoney.objects.filter(pk=instance.account_id)
 
     if instance.type == "IN":
-        account.balance += instance.amount
+        accounts.update(balance=F("balance") + instance.amount)
     elif instance.type == "OUT":
-        if account.balance < instance.amount:
-            instance.delete()
-            
-            raise ValidationError(f"Solde insuffisant dans le compte {account.name}")
-        
-        account.balance -= instance.amount
-
-    account.save(update_fields=["balance"])
+        updated = accounts.filter(balance__gte=instance.amount).update(
+            balance=F("balance") - instance.amount
+        )
+        if not updated:
+            # Transaction.save est atomique : l'exception annule l'insertion
+            raise ValidationError(f"Solde insuffisant dans le compte {instance.account.name}")
 
 # ------------------------------
 # SIGNAL 2 : Création d'étapes d'approbation pour une dépense
 # ------------------------------
 @receiver(post_save, sender=Expense)
+@sharding.on_instance_database
 def create_approval_steps(sender, instance, created, **kwargs):
     if not created:
         return
 
-    # Chercher les seuils correspondant
-    thresholds = ValidationThreshold.objects.filter(
-        min_amount__lte=instance.amount,
-        max_amount__gte=instance.amount
-    ).order_by("level")
-
-    # Créer les étapes de validation
-    for t in thresholds:
-        ApprovalStep.objects.create(
-            expense=instance,
-            level=t.level,
-            role=t.role,
-            approved=False,
-            rejected=False
-        )
+    # Seuils correspondant au montant, en mémoire (voir expense/thresholds.py)
+    steps = thresholds.steps_for(instance.amount)
+
+    # Créer les étapes de validation, en une insertion
+    ApprovalStep.objects.bulk_create([
+        ApprovalStep(expense=instance, level=step.level, role=step.role, approved=False, rejected=False)
+        for step in steps
+    ])
 
     # Si aucun seuil, auto-approbation
-    if not thresholds.exists():
+    if not steps:
         instance.status = "APPROVED"
     else:
         instance.status = "IN_REVIEW"
@@ -66,6 +71,7 @@ def create_approval_steps(sender, instance, created, **kwargs):
 # SIGNAL 3 : Créer transaction OUT après approbation de toutes les étapes
 # ------------------------------
 @receiver(post_save, sender=ApprovalStep)
+@sharding.on_instance_database
 def create_transaction_when_expense_approved(sender, instance, **kwargs):
     expense = instance.expense
     steps = expense.steps.all()
@@ -102,3 +108,94 @@ def create_transaction_when_expense_approved(sender, instance, **kwargs):
                 expense=expense
             )
 
+
+# ------------------------------
+# SIGNAL 4 : Invalidation du cache des rapports
+# ------------------------------
+@receiver([post_save, post_delete], sender=Expense)
+@sharding.on_instance_database
+def bump_report_version_on_expense(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    antenne_ids = (instance.antenne_id, resolver.seller_antenne(instance.created_by_id))
+    transaction.on_commit(lambda: report_cache.bump(*antenne_ids), using=sharding.current_alias())
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+@sharding.on_instance_database
+def bump_report_version_on_transaction(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    antenne_id = resolver.account_antenne(instance.account_id)
+    transaction.on_commit(lambda: report_cache.bump(antenne_id), using=sharding.current_alias())
+
+
+# ------------------------------
+# SIGNAL 5 : Invalidation des tables en mémoire (resolver, seuils)
+# ------------------------------
+@receiver([post_save, post_delete], sender=AccountMoney)
+@sharding.on_instance_database
+def invalidate_resolver_on_account(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    resolver.invalidate(using=sharding.current_alias())
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_resolver_on_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Seul un changement d'antenne compte (pas la connexion, le blocage…)."""
+    if raw or (update_fields is not None and 'antenne' not in update_fields):
+        return
+    resolver.invalidate()
+
+
+@receiver([post_save, post_delete], sender=ValidationThreshold)
+def invalidate_thresholds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    thresholds.invalidate()
+
+
+# ------------------------------
+# SIGNAL 6 : Bases réparties (voir core/sharding.py)
+# ------------------------------
+@receiver([post_save, post_delete], sender=Antenne)
+def invalidate_shard_map_on_antenne(sender, instance, raw=False, **kwargs):
+    """La base d'une antenne dépend de sa ville."""
+    if raw:
+        return
+    sharding.invalidate_antennes()
+
+
+@receiver(post_save)
+def mirror_reference_on_save(sender, instance, using, update_fields=None, **kwargs):
+    """Le référentiel, modifié dans la base par défaut, est recopié dans chaque base répartie."""
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS and sharding.is_reference(sender):
+        sharding.mirror_save(instance, update_fields)
+
+
+@receiver(post_delete)
+def mirror_reference_on_delete(sender, instance, using, **kwargs):
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS and sharding.is_reference(sender):
+        sharding.mirror_delete(instance)
+
+
+@receiver(post_migrate)
+def seed_shard_sequences(sender, using, **kwargs):
+    """Chaque base répartie numérote dans sa propre plage d'identifiants."""
+    sharding.seed_sequences(sender.get_models(), using)
+
+
+# ------------------------------
+# SIGNAL 7 : Index de recherche (voir core/search.py)
+# ------------------------------
+@receiver(post_save, sender=Expense)
+def index_expense_for_search(sender, instance, created, using, update_fields=None, **kwargs):
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    search.index(instance, using, created)
+
+
+@receiver(post_delete, sender=Expense)
+def unindex_expense_for_search(sender, instance, using, **kwargs):
+    search.unindex(instance, using)
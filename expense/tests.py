@@ -1,3 +1,415 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connections, transaction
+from django.db.models import Count, F, Sum
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Antenne, User
+from core import sharding
+from core.testing import AntenneTestCase
+from sales import rollup
+from sales.models import ArchivedSale, Category, Credit, DailySaleSummary, Sale
+from sales.reporting import sale_lines
+from . import ledger, reconciliation, resolver, thresholds
+from .models import (
+    AccountMoney, ArchivedTransaction, BalanceCheckpoint, Expense, ExpenseCategory, Transaction, ValidationThreshold,
+)
+from .views import EXPENSE_EXPORT_COLUMNS
+
+
+class ConcurrentBalanceTests(AntenneTestCase):
+    """
+    Des ventes au comptant enregistrées depuis plusieurs threads à la fois
+    ne doivent perdre aucune mise à jour : le solde final de la caisse est
+    toujours égal à la somme des ventes.
+    """
+
+    THREADS = 8
+    SALES_PER_THREAD = 25
+
+    def _post(self, quantity):
+        # Réessaie si SQLite signale un verrou : la vente entière (insertion,
+        # mouvement, solde, agrégat) est alors annulée puis rejouée.
+        for _ in range(200):
+            try:
+                with transaction.atomic(using=self.shard):
+                    return self._sell(quantity)
+            except OperationalError:
+                time.sleep(0.005)
+        raise AssertionError("Base verrouillée trop longtemps")
+
+    def _worker(self, index, errors):
+        try:
+            for i in range(self.SALES_PER_THREAD):
+                self._post(1 + (index + i) % 3)
+        except Exception as exc:  # remonté dans le thread principal
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    def test_balance_equals_sum_of_sales(self):
+        errors = []
+        threads = [
+            threading.Thread(target=self._worker, args=(index, errors))
+            for index in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with sharding.use_shard(self.shard):
+            sales = Sale.objects.aggregate(count=Count('pk'), total=Sum('total_price'))
+            self.assertEqual(sales['count'], self.THREADS * self.SALES_PER_THREAD)
+            self.assertEqual(AccountMoney.objects.get(pk=self.caisse.pk).balance, sales['total'])
+            self.assertEqual(DailySaleSummary.objects.aggregate(total=Sum('amount'))['total'], sales['total'])
+
+
+class ResolverTests(AntenneTestCase):
+    """Rattachements vendeur -> antenne -> compte résolus en mémoire (expense/resolver.py)."""
+
+    def test_cash_sale_resolves_its_account_without_reading(self):
+        self._sell()
+        with CaptureQueriesContext(connections[self.shard]) as queries:
+            self._sell()
+        reads = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(reads, [])
+
+    def test_seller_moving_antenne_posts_to_the_new_account(self):
+        self._sell()
+        nord = Antenne.objects.create(nom="Nord", gerant=self.seller)
+        caisse_nord = AccountMoney.objects.create(name="Caisse nord", type="CAISSE", antenne=nord)
+        self.seller.antenne = nord
+        self.seller.save()
+        sale = self._sell()
+        with sharding.use_shard(caisse_nord._state.db):
+            self.assertEqual(Transaction.objects.get(sale_id=sale.pk).account_id, caisse_nord.pk)
+
+    def test_missing_rows_are_read_again(self):
+        resolver.seller_antenne(self.seller.pk)
+        # Créés sans signal, comme par un autre processus
+        nord = Antenne.objects.bulk_create([Antenne(nom="Nord", gerant=self.seller)])[0]
+        vendeur = User.objects.bulk_create([User(username="nouveau", role=User.Role.GERANT, antenne=nord)])[0]
+        self.assertEqual(resolver.seller_antenne(vendeur.pk), nord.pk)
+        self.assertIsNone(resolver.account_for(nord.pk, 'BANQUE'))
+        self.assertIsNone(resolver.seller_antenne(vendeur.pk + 1000))
+
+    def test_unknown_ids_are_read_again_once_per_load(self):
+        resolver.seller_antenne(self.seller.pk)
+        with mock.patch.object(resolver._tables, 'load', side_effect=resolver._load) as load:
+            for _ in range(3):
+                self.assertIsNone(resolver.seller_antenne(self.seller.pk + 1000))
+                self.assertIsNone(resolver.account_antenne(self.caisse.pk + 1000))
+            self.assertEqual(load.call_count, 2)
+
+            # Au rechargement suivant, l'inconnu est relu de nouveau
+            resolver.invalidate()
+            self.assertIsNone(resolver.seller_antenne(self.seller.pk + 1000))
+            self.assertEqual(load.call_count, 4)
+
+
+class LedgerTests(AntenneTestCase):
+    """
+    Journal en écriture seule et soldes à date par points de solde
+    (expense/ledger.py) ; aussi avec des bases réparties.
+    """
+
+    def _balance(self):
+        return AccountMoney.objects.using(self.shard).get(pk=self.caisse.pk).balance
+
+    def test_journal_is_append_only(self):
+        entry = Transaction.objects.create(account=self.caisse, type="IN", amount=100)
+        with self.assertRaises(ValidationError):
+            Transaction.objects.create(account=self.caisse, type="OUT", amount=500)
+        self.assertEqual(self._balance(), 100)
+
+        entry.amount = 1
+        for forbidden in (entry.save, entry.delete):
+            with self.assertRaises(ValidationError):
+                forbidden()
+        with sharding.use_shard(self.shard):
+            with self.assertRaises(ValidationError):
+                Transaction.objects.all().delete()
+            with self.assertRaises(ValidationError):
+                Transaction.objects.update(amount=1)
+            self.assertEqual(Transaction.objects.get().amount, 100)
+
+    def test_deleted_sale_keeps_its_movement(self):
+        self._sell(2).delete()
+        movement = Transaction.objects.using(self.shard).get()
+        self.assertEqual((movement.sale_id, movement.amount), (None, 20))
+        self.assertEqual(self._balance(), 20)
+
+    def test_balance_as_of_reads_the_latest_checkpoint(self):
+        today = timezone.localdate()
+        history = [(40, "IN", 100), (20, "OUT", 30), (10, "IN", 50)]
+        created_at = Transaction._meta.get_field('created_at')
+        with mock.patch.object(created_at, 'auto_now_add', False), sharding.use_shard(self.shard):
+            entries = Transaction.objects.bulk_create([
+                Transaction(account_id=self.caisse.pk, type=kind, amount=amount,
+                            created_at=ledger.end_of_day(today - timedelta(days=days)) - timedelta(hours=1))
+                for days, kind, amount in history
+            ])
+            ledger.apply_balance_deltas(ledger.balance_deltas(entries))
+
+        expected = {40: 100, 20: 70, 10: 120, 0: 120}
+        with sharding.use_shard(self.shard):
+            for days, balance in expected.items():
+                self.assertEqual(ledger.balance_as_of(self.caisse, today - timedelta(days=days)), balance)
+            self.assertEqual(self._balance(), 120)
+
+            call_command('checkpoint_balances', since=str(today - timedelta(days=70)), stdout=StringIO())
+            self.assertGreaterEqual(BalanceCheckpoint.objects.filter(account=self.caisse).count(), 3)
+            with CaptureQueriesContext(connections[self.shard]) as queries:
+                for days, balance in expected.items():
+                    self.assertEqual(ledger.balance_as_of(self.caisse, today - timedelta(days=days)), balance)
+        # Un point de solde, puis le journal courant et l'archive après ce point
+        self.assertEqual(len(queries), 3 * len(expected))
+
+
+class ReconciliationTests(AntenneTestCase):
+    """Rapprochement des soldes avec le journal (commande reconcile_ledger)."""
+
+    def setUp(self):
+        super().setUp()
+        self.banque = AccountMoney.objects.create(name="Banque", type="BANQUE", antenne=self.antenne)
+        for account, amounts in ((self.caisse, (100, 40, 60)), (self.banque, (500, 250))):
+            for amount in amounts:
+                Transaction.objects.create(account=account, type="IN", amount=amount)
+        Transaction.objects.create(account=self.caisse, type="OUT", amount=50)
+
+    def _reconcile(self, *args):
+        out = StringIO()
+        with sharding.use_shard(self.shard):
+            call_command('reconcile_ledger', '--chunk-size', '2', '--workers', '2', *args, stdout=out, stderr=StringIO())
+        return json.loads(out.getvalue())
+
+    def test_drift_is_reported_then_repaired(self):
+        AccountMoney.objects.using(self.shard).filter(pk=self.caisse.pk).update(balance=F('balance') + 7)
+
+        report = self._reconcile()
+        self.assertEqual((report['accounts'], report['transactions'], report['drifted']), (2, 6, 1))
+        [drift] = report['drift']
+        self.assertEqual((drift['account_id'], Decimal(drift['computed_balance']), Decimal(drift['drift'])),
+                         (self.caisse.pk, 150, 7))
+        self.assertEqual(AccountMoney.objects.using(self.shard).get(pk=self.caisse.pk).balance, 157)
+
+        self.assertEqual(self._reconcile('--repair')['repaired'], 1)
+        self.assertEqual(AccountMoney.objects.using(self.shard).get(pk=self.caisse.pk).balance, 150)
+        self.assertEqual(self._reconcile()['drifted'], 0)
+
+
+class ConsistencyTests(AntenneTestCase):
+    """Contrôle croisé ventes / créances / dépenses / mouvements (commande check_consistency)."""
+
+    def setUp(self):
+        super().setUp()
+        self.sales = [
+            self._sell(quantity, payment_method, customer="Client,0600")
+            for quantity, payment_method in ((1, "Cash"), (2, "Cash"), (3, "Credit"))
+        ]
+
+    def _check(self, *args):
+        out = StringIO()
+        with sharding.use_shard(self.shard):
+            call_command('check_consistency', '--chunk-size', '2', '--workers', '2', *args,
+                         stdout=out, stderr=StringIO())
+        return json.loads(out.getvalue())
+
+    def test_anomalies_are_found_in_every_chunk(self):
+        self.assertEqual(self._check()['anomalies'], 0)
+
+        cash, _, credit = self.sales
+        with sharding.use_shard(self.shard):
+            Sale.objects.bulk_create([Sale(product=self.product, quantity=1, total_price=10, payment_method="Cash",
+                                           created_by=self.seller, status=Sale.VALIDATED)])
+            Expense.objects.bulk_create([Expense(title="Loyer", account=self.caisse, amount=1000,
+                                                 created_by=self.seller, status="APPROVED")])
+        Transaction.objects.create(account=self.caisse, type="IN", amount=10, sale=cash)
+        Transaction.objects.create(account=self.caisse, type="IN", amount=30, sale=credit)
+
+        report = self._check()
+        self.assertEqual(report['counts'], {
+            'approved_expense_without_transaction': 1,
+            'cash_sale_duplicate_transactions': 1,
+            'cash_sale_without_transaction': 1,
+            'credit_sale_with_cash_transaction': 1,
+        })
+        self.assertEqual(self._check('--check', 'expenses')['anomalies'], 1)
+        with self.assertRaises(SystemExit):
+            self._check('--fail-on-anomaly')
+
+
+class ArchiveTests(AntenneTestCase):
+    """
+    Archivage de l'historique (commande archive_history) : les totaux lus
+    après déplacement (soldes, agrégat, détail des ventes) ne changent pas.
+    """
+
+    def test_history_moves_to_the_archive_with_carried_totals(self):
+        past = timezone.now() - timedelta(days=400)
+        with mock.patch('django.utils.timezone.now', return_value=past):
+            for quantity in (1, 2):
+                self._sell(quantity)
+            credit_sale = self._sell(3, "Credit", customer="Client,0600")
+        self._sell(4)
+        past_day = timezone.localtime(past).date()
+
+        with sharding.use_shard(self.shard):
+            call_command('archive_history', before=str(timezone.localdate() - timedelta(days=365)),
+                         batch_size=1, stdout=StringIO())
+
+            # La vente à crédit, encore liée à sa créance, reste dans la table courante
+            self.assertEqual(ArchivedSale.objects.count(), 2)
+            self.assertEqual(list(Sale.objects.order_by('pk').values_list('quantity', flat=True)), [3, 4])
+            self.assertEqual((ArchivedTransaction.objects.count(), Transaction.objects.count()), (2, 1))
+            self.assertEqual(ledger.balance_as_of(self.caisse, timezone.localdate()), 70)
+            self.assertEqual(reconciliation.reconcile(workers=1)['drifted'], 0)
+
+            rollup.rebuild()
+            summary = DailySaleSummary.objects.filter(day=past_day).values_list('payment_method', 'amount')
+            self.assertEqual(sorted(summary), [("Cash", 30), ("Credit", 30)])
+
+            lignes, _ = sale_lines(past - timedelta(days=1), timezone.now(), self.category.pk)
+            self.assertEqual([ligne['quantity'] for ligne in lignes], [1, 2, 3, 4])
+
+            with self.assertRaises(CommandError):
+                call_command('archive_history', before=str(past_day), stdout=StringIO())
+
+        # L'export fusionne archive et table courante dans l'ordre des id
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('sales:sale_export'), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['quantite'] for row in rows], [1, 2, 3, 4])
+        self.assertEqual(credit_sale.credit.status, Credit.PENDING)
+
+    def test_archived_sales_keep_their_category(self):
+        past = timezone.now() - timedelta(days=400)
+        with mock.patch('django.utils.timezone.now', return_value=past):
+            self._sell(2)
+        with sharding.use_shard(self.shard):
+            call_command('archive_history', before=str(timezone.localdate() - timedelta(days=365)), stdout=StringIO())
+            self.assertEqual(list(ArchivedSale.objects.values_list('antenne', 'category')),
+                             [(self.antenne.pk, self.category.pk)])
+
+        self.product.category = Category.objects.create(name="Reliure", type="service")
+        self.product.save()
+        lignes, _ = sale_lines(past - timedelta(days=1), timezone.now(), self.category.pk)
+        self.assertEqual([ligne['quantity'] for ligne in lignes], [2])
+
+
+class ValidationThresholdTests(AntenneTestCase):
+    """
+    Étapes d'approbation tirées des seuils en mémoire (expense/thresholds.py) ;
+    aussi avec des bases réparties (les seuils sont recopiés dans chacune).
+    """
+
+    def setUp(self):
+        ValidationThreshold.objects.bulk_create([
+            ValidationThreshold(level=1, min_amount=0, max_amount=50_000, role=User.Role.GERANT),
+            ValidationThreshold(level=2, min_amount=50_000, max_amount=500_000, role=User.Role.DIRECTEUR),
+            ValidationThreshold(level=3, min_amount=500_000, max_amount=None, role=User.Role.ADMIN),
+        ])
+        thresholds.invalidate()
+        super().setUp()
+        self.expense_category = ExpenseCategory.objects.create(name="Équipement")
+
+    def _levels(self, amount):
+        return [step.level for step in thresholds.steps_for(Decimal(amount))]
+
+    def test_bounds_are_inclusive_and_last_range_is_open(self):
+        self.assertEqual(self._levels(0), [1])
+        self.assertEqual(self._levels("49999.99"), [1])
+        self.assertEqual(self._levels(50_000), [1, 2])
+        self.assertEqual(self._levels(120_000), [2])
+        self.assertEqual(self._levels(500_000), [2, 3])
+        self.assertEqual(self._levels(10_000_000), [3])
+        self.assertEqual(self._levels(-1), [])
+
+    def test_lookup_is_served_from_memory_and_invalidated_on_save(self):
+        thresholds.steps_for(Decimal(1))
+        with self.assertNumQueries(0):
+            self.assertEqual(self._levels(750_000), [3])
+
+        ValidationThreshold.objects.create(level=4, min_amount=1_000_000, max_amount=None, role=User.Role.ADMIN)
+        self.assertEqual(self._levels(2_000_000), [3, 4])
+        ValidationThreshold.objects.filter(level=4).get().delete()
+        self.assertEqual(self._levels(2_000_000), [3])
+
+    def test_each_matching_threshold_makes_a_step(self):
+        ValidationThreshold.objects.create(level=2, min_amount=100_000, max_amount=None, role=User.Role.SUPERVISEUR)
+        steps = thresholds.steps_for(Decimal(200_000))
+        self.assertEqual(list(steps), [(2, User.Role.DIRECTEUR), (2, User.Role.SUPERVISEUR)])
+        self.assertEqual(list(thresholds.steps_for(Decimal(600_000))),
+                         [(2, User.Role.SUPERVISEUR), (3, User.Role.ADMIN)])
+
+    def test_expense_create_makes_each_step_once(self):
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('expenses:expense_create'), {
+            'title': "Groupe électrogène", 'category': self.expense_category.pk, 'account': self.caisse.pk,
+            'amount': '800000', 'status': 'PENDING',
+        })
+        self.assertEqual(response.status_code, 302)
+        expense = Expense.objects.using(self.shard).get()
+        self.assertEqual(expense.status, "IN_REVIEW")
+        self.assertEqual(list(expense.steps.values_list('level', 'role')),
+                         [(3, User.Role.ADMIN)])
+
+
+class ExpenseExportTests(AntenneTestCase):
+    """Export en flux des dépenses (core/exports.py)."""
+
+    def setUp(self):
+        super().setUp()
+        category = ExpenseCategory.objects.create(name="Équipement")
+        for title, amount in (("Ramettes", 5000), ("Encre", 12000)):
+            Expense.objects.create(title=title, category=category, account=self.caisse,
+                                   amount=amount, created_by=self.seller)
+
+    def _export(self, **params):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('expenses:expense_export'), params)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_csv_and_ndjson_exports(self):
+        lines = self._export()
+        self.assertEqual(lines[0].split(','), [label for label, _ in EXPENSE_EXPORT_COLUMNS])
+        self.assertEqual([line.split(',')[2] for line in lines[1:]], ["Ramettes", "Encre"])
+
+        rows = [json.loads(line) for line in self._export(format='ndjson')]
+        self.assertEqual([(row['titre'], Decimal(row['montant'])) for row in rows],
+                         [("Ramettes", 5000), ("Encre", 12000)])
+
+
+class PendingExpenseListTests(AntenneTestCase):
+    """File des dépenses à valider, paginée par clé sur toutes les bases."""
+
+    def test_pending_expenses_are_paginated(self):
+        ValidationThreshold.objects.create(level=1, min_amount=0, max_amount=None, role=User.Role.ADMIN)
+        category = ExpenseCategory.objects.create(name="Équipement")
+        for n in range(12):
+            Expense.objects.create(title=f"Ramettes {n}", category=category, account=self.caisse,
+                                   amount=1000, created_by=self.seller)
+        rejected = Expense.objects.create(title="Refusée", category=category, account=self.caisse, amount=1000,
+                                          created_by=self.seller)
+        rejected.status = "REJECTED"
+        rejected.save(update_fields=['status'])
+        self.client.force_login(self._colleague("admin", role=User.Role.ADMIN))
+
+        response = self.client.get(reverse('expenses:pending_expenses'))
+        page = response.context['expenses']
+        self.assertEqual([expense.title for expense in page], [f"Ramettes {n}" for n in range(11, 1, -1)])
+        self.assertContains(response, "Suivante")
+        response = self.client.get(f"{reverse('expenses:pending_expenses')}?{page.next_query()}")
+        self.assertEqual([expense.title for expense in response.context['expenses']], ["Ramettes 1", "Ramettes 0"])
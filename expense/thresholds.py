@@ -0,0 +1,69 @@
+# expense/thresholds.py
+"""
+Seuils de validation des dépenses, gardés en mémoire par processus.
+
+Un seuil couvre les montants de min_amount à max_amount, bornes
+incluses ; sans max_amount, il n'a pas de limite haute. Une dépense
+reçoit une étape d'approbation par seuil qui couvre son montant, par
+niveau croissant (deux seuils d'un même niveau : deux étapes, le plus
+ancien d'abord).
+
+Les bornes de tous les seuils découpent les montants en points (une
+borne) et intervalles ouverts (entre deux bornes consécutives, avant la
+première, après la dernière) ; les étapes de chacun sont calculées au
+chargement. Trouver les étapes d'un montant est alors une recherche
+dichotomique (bisect) dans les bornes, sans requête. La table est
+invalidée par les sauvegardes et suppressions de ValidationThreshold
+(voir expense/signals.py).
+"""
+from bisect import bisect_left
+from collections import namedtuple
+
+from core.process_cache import ProcessCache
+
+Step = namedtuple('Step', ['level', 'role'])
+Intervals = namedtuple('Intervals', ['bounds', 'at_bound', 'between'])
+
+
+def _steps(thresholds, covers):
+    # `thresholds` est dans l'ordre des id : le tri stable garde cet ordre à niveau égal
+    matching = sorted((t for t in thresholds if covers(t)), key=lambda t: t.level)
+    return tuple(Step(t.level, t.role) for t in matching)
+
+
+def _load():
+    from .models import ValidationThreshold
+
+    thresholds = list(ValidationThreshold.objects.order_by('pk'))
+    bounds = sorted({t.min_amount for t in thresholds} | {t.max_amount for t in thresholds if t.max_amount is not None})
+
+    # at_bound[i] : montant égal à bounds[i] ; between[i] : montant
+    # strictement entre bounds[i - 1] et bounds[i] (i = 0 : sous la première
+    # borne, i = len(bounds) : au-delà de la dernière)
+    at_bound = [
+        _steps(thresholds, lambda t: t.min_amount <= bound and (t.max_amount is None or bound <= t.max_amount))
+        for bound in bounds
+    ]
+    between = [()]  # aucun seuil ne commence sous la première borne
+    for low, high in zip(bounds, bounds[1:]):
+        between.append(_steps(thresholds, lambda t: t.min_amount <= low and (t.max_amount is None or high <= t.max_amount)))
+    if bounds:
+        between.append(_steps(thresholds, lambda t: t.max_amount is None))
+    return Intervals(bounds, at_bound, between)
+
+
+_intervals = ProcessCache('thresholds:generation', _load)
+
+
+def steps_for(amount):
+    """Étapes (niveau, rôle) requises pour une dépense de `amount`, par niveau croissant."""
+    intervals = _intervals.get()
+    index = bisect_left(intervals.bounds, amount)
+    if index < len(intervals.bounds) and intervals.bounds[index] == amount:
+        return intervals.at_bound[index]
+    return intervals.between[index]
+
+
+def invalidate(using=None):
+    """Invalide la table, ici et (à la validation) dans les autres processus."""
+    _intervals.invalidate(using)
@@ -6,6 +6,7 @@ app_name = 'expenses'
 urlpatterns = [
 
     path('', views.expense_list, name='expense_list'),
+    path('export/', views.expense_export, name='expense_export'),
     path('create/', views.expense_create, name='expense_create'),
     path('<int:pk>/update/', views.expense_update, name='expense_update'),
     path('<int:pk>/delete/', views.expense_delete, name='expense_delete'),
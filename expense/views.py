@@ -1,3 +1,5 @@
+from operator import itemgetter
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.utils import timezone
@@ -5,7 +7,7 @@ from django.contrib.auth.decorators import login_required
 from accounts.models import User
 from accounts.permissions import ROLE_PER_LEVEL, Permissions
 from expense.filters import ExpenseFilter
-from .models import Expense, ApprovalStep, ValidationThreshold, Transaction
+from .models import Expense, ApprovalStep, Transaction
 from accounts.decorators import permission_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
@@ -13,7 +15,9 @@ from expense.models import Expense, AccountMoney, ExpenseCategory
 from expense.forms import ExpenseForm
 from accounts.decorators import permission_required
 from django.db import models
-from django.core.paginator import Paginator
+from core import sharding
+from core.exports import CHUNK_SIZE, export_options, stream_rows
+from core.pagination import paginate
 
 # -------------------------
 # Liste des dépenses
@@ -21,18 +25,53 @@ from django.core.paginator import Paginator
 @login_required
 @permission_required(Permissions.VIEW_DEPENSES)
 def expense_list(request):
-    qs = Expense.objects.all().order_by('-created_at')
-    expense_filter = ExpenseFilter(request.GET, queryset=qs)
-    paginator = Paginator(expense_filter.qs, 10)  # 10 par page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Toutes les bases (voir core/sharding.py) : chaque page fusionne les leurs
+    def filtered(alias):
+        expense_filter = ExpenseFilter(request.GET, queryset=Expense.objects.all())
+        return expense_filter, sharding.bind(expense_filter.qs)
+
+    filters, querysets = zip(*sharding.fan_out(Expense, filtered))
+    page_obj = paginate(request, querysets, 10)  # 10 par page, les plus récentes d'abord
 
     context = {
-        'filter': expense_filter,
+        'filter': filters[0],
         'expenses': page_obj
     }
     return render(request, 'expenses/expenses_list.html', context)
 
+# -------------------------
+# Export des dépenses (CSV / NDJSON en flux)
+# -------------------------
+EXPENSE_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('date', 'created_at'),
+    ('titre', 'title'),
+    ('categorie', 'category__name'),
+    ('compte', 'account__name'),
+    ('antenne', 'antenne__nom'),
+    ('montant', 'amount'),
+    ('statut', 'status'),
+    ('auteur', 'created_by__username'),
+)
+
+
+@login_required
+@permission_required(Permissions.VIEW_DEPENSES)
+def expense_export(request):
+    """Export en flux des dépenses filtrées, de toutes les bases fusionnées par id."""
+    fields = [field for _, field in EXPENSE_EXPORT_COLUMNS]
+
+    def shard_rows(alias):
+        expense_filter = ExpenseFilter(request.GET, queryset=Expense.objects.order_by('id'))
+        return sharding.bind(expense_filter.qs).values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+    return stream_rows(
+        sharding.merged(Expense, shard_rows, key=itemgetter(0)),
+        header=[label for label, _ in EXPENSE_EXPORT_COLUMNS],
+        filename='depenses',
+        **export_options(request),
+    )
+
 # -------------------------
 # Ajouter une dépense
 # -------------------------
@@ -45,28 +84,10 @@ def expense_create(request):
             expense = form.save(commit=False)
             expense.created_by = request.user
             expense.status = "PENDING"
+            # Les étapes d'approbation sont créées par le signal post_save
+            # (expense/signals.py), d'après les seuils en mémoire
             expense.save()
 
-            amount = expense.amount
-
-            # On récupère tous les niveaux configurés
-            thresholds = ValidationThreshold.objects.all()
-
-            print(thresholds)
-
-            for t in thresholds:
-                # Est-ce que le montant appartient à ce niveau ?
-                if amount >= t.min_amount and (t.max_amount is None or amount <= t.max_amount):
-
-                    # On crée l'étape correspondante à ce niveau
-                    ApprovalStep.objects.create(
-                        expense=expense,
-                        level=t.level,
-                        role=t.role,
-                        approved=False,
-                        rejected=False
-                    )
-
             messages.success(
                 request,
                 "Dépense créée avec succès. Le workflow d’approbation va commencer."
@@ -120,9 +141,14 @@ def pending_expenses_list(request):
     """
     Affiche les dépenses en attente ou en cours de validation
     """
-    expenses = Expense.objects.filter(status__in=['PENDING', 'IN_REVIEW']).order_by('-created_at')
+    def pending(alias):
+        expenses = Expense.objects.filter(status__in=['PENDING', 'IN_REVIEW']).select_related('account', 'created_by')
+        return sharding.bind(expenses)
+
+    # Toutes les bases (voir core/sharding.py) : chaque page fusionne les leurs
+    page_obj = paginate(request, sharding.fan_out(Expense, pending), 10)  # les plus récentes d'abord
     context = {
-        'expenses': expenses
+        'expenses': page_obj
     }
     return render(request, 'expenses/pending_list.html', context)
 
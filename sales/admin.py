@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import reverse
-from .models import Category, Credit, Product, Sale
+from . import credits
+from .models import ArchiveBatch, Category, Credit, CreditPayment, Customer, Product, Sale
 from django.utils.html import format_html
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -13,43 +14,52 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ("category__type", "category")
     search_fields = ("name",)
 
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ("nom", "telephone", "created_at")
+    search_fields = ("=telephone", "nom")
+
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
     list_display = ("product", "quantity", "total_price", "last_total_price","payment_method", "date","created_by")
     list_filter = ("product__category",)
     search_fields = ("product__name",)
+    list_select_related = ("product", "created_by")
+
 
+def _settle(modeladmin, request, queryset, kind):
+    """Solde les créances sélectionnées : encaissement sur le compte `kind` de l'antenne du vendeur."""
+    result = credits.settle(queryset, kind, user=request.user)
+    modeladmin.message_user(
+        request, f"{result['settled']} créance(s) payée(s), {result['total']} FCFA encaissés ({kind}).",
+        level='success',
+    )
+    if result['skipped']:
+        modeladmin.message_user(
+            request, f"{len(result['skipped'])} créance(s) ignorée(s) : aucun compte {kind} pour l'antenne.",
+            level='warning',
+        )
 
-@admin.action(description='Marquer les crédits sélectionnés comme Payés')
+
+@admin.action(description='Marquer les crédits sélectionnés comme Payés (encaissement en caisse)')
 def make_paid(modeladmin, request, queryset):
-    """Marque les créances comme 'Payées' et met à jour le solde si l'argent est reçu."""
-    
-    # NOTE: Dans un système complet, l'action de paiement devrait idéalement 
-    # se faire via un formulaire dédié pour choisir le compte de réception (Caisse/Banque)
-    # et créer la Transaction. Pour l'Admin, nous faisons une action simple.
-    
-    # 1. Mettre à jour le statut
-    queryset.update(status=Credit.PAID)
-    
-    # 2. Logique simplifiée de réception d'argent (nécessite AccountMoney et Transaction)
-    # Ceci est un exemple simpliste. Il faudra le compléter si vous voulez la mise à jour réelle du solde.
-    # try:
-    #     caisse = AccountMoney.objects.get(type="CAISSE")
-    #     for credit in queryset:
-    #         # Créer la transaction IN (Entrée)
-    #         Transaction.objects.create(
-    #             account=caisse,
-    #             type="IN",
-    #             amount=credit.amount, 
-    #             sale=credit.sale # Utiliser le lien vers la vente originale
-    #         )
-    #         caisse.balance += credit.amount
-    #     caisse.save()
-    #     modeladmin.message_user(request, f"{queryset.count()} créances marquées comme payées et caisse mise à jour.", level='success')
-    # except Exception as e:
-    #     modeladmin.message_user(request, f"Erreur lors de la mise à jour du compte: {e}", level='error')
-    
-    modeladmin.message_user(request, f"{queryset.count()} créances marquées comme Payées.", level='success')
+    _settle(modeladmin, request, queryset, "CAISSE")
+
+
+@admin.action(description='Marquer les crédits sélectionnés comme Payés (encaissement en banque)')
+def make_paid_bank(modeladmin, request, queryset):
+    _settle(modeladmin, request, queryset, "BANQUE")
+
+
+class CreditPaymentInline(admin.TabularInline):
+    model = CreditPayment
+    fields = ('paid_at', 'amount', 'account', 'received_by')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Credit)
@@ -58,22 +68,25 @@ class CreditAdmin(admin.ModelAdmin):
         'nom', 
         'telephone', 
         'montant_du', 
+        'reste_du',
         'date_creance',
         'status', 
         'lien_vers_la_vente'
     )
     list_filter = ('status', 'date')
     search_fields = ('nom', 'telephone', 'sale__product__name')
-    readonly_fields = ('date',)
-    actions = [make_paid] # Ajouter l'action de masse
+    readonly_fields = ('date', 'amount', 'balance')
+    actions = [make_paid, make_paid_bank] # Ajouter l'action de masse
+    inlines = [CreditPaymentInline]
 
     def montant_du(self, obj):
-        if obj.sale:
-            return f"{obj.sale.total_price} FCFA"
-        
-        return "Montant Non Défini" # Ou 0.00 FCFA
+        return f"{obj.amount} FCFA"
     montant_du.short_description = "Montant Dû"
 
+    def reste_du(self, obj):
+        return f"{obj.balance} FCFA"
+    reste_du.short_description = "Reste à payer"
+
     def date_creance(self, obj):
         # Afficher la date formatée
         return obj.date.strftime("%d %b %Y")
@@ -81,14 +94,29 @@ class CreditAdmin(admin.ModelAdmin):
 
     def lien_vers_la_vente(self, obj):
         """Crée un lien vers la vente associée dans l'interface Admin."""
-        if obj.sale:
-            url = reverse("admin:sales_sale_change", args=[obj.sale.id]) # Assurez-vous que 'sales' est le nom de l'app de Sale
-            return format_html('<a href="{}">Voir Vente #{}</a>', url, obj.sale.id)
+        if obj.sale_id:
+            url = reverse("admin:sales_sale_change", args=[obj.sale_id]) # Assurez-vous que 'sales' est le nom de l'app de Sale
+            return format_html('<a href="{}">Voir Vente #{}</a>', url, obj.sale_id)
         return "-"
     lien_vers_la_vente.short_description = "Vente Source"
     
     # Définir l'appartenance à un Fieldset pour la vue détaillée (optionnel)
     fieldsets = (
         (None, {'fields': ('nom', 'telephone', 'date', 'status')}),
-        ('Détails de la Créance', {'fields': ('sale',)}),
-    )
\ No newline at end of file
+        ('Détails de la Créance', {'fields': ('sale', 'amount', 'balance')}),
+    )
+
+
+@admin.register(ArchiveBatch)
+class ArchiveBatchAdmin(admin.ModelAdmin):
+    """Passes d'archivage, en lecture seule (commande archive_history)."""
+    list_display = ("horizon", "started_at", "finished_at", "sales", "transactions")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,183 @@
+# sales/credits.py
+"""
+Encaissement et suivi des créances.
+
+Un paiement, total ou partiel, diminue le reste à payer de la créance
+(Credit.balance) : une ligne CreditPayment, un mouvement IN sur le compte
+qui reçoit l'argent (CAISSE ou BANQUE de l'antenne du vendeur), et la
+créance passe au statut Payé quand elle est soldée.
+
+Le règlement en masse (settle) écrit tout dans une seule transaction par
+base : une lecture des créances, un bulk_create des mouvements puis des
+paiements, une mise à jour des créances et une variation de solde par
+compte (voir expense/ledger.py).
+
+Le mouvement n'est pas rattaché à la vente (Transaction.sale) : une vente
+à crédit n'a pas de mouvement propre (voir expense/consistency.py) ;
+l'encaissement se retrouve par CreditPayment.transaction.
+
+La balance âgée regroupe les restes à payer par vendeur et par
+ancienneté (AGING_BUCKETS) en une requête groupée par base, puis par
+antenne du vendeur (résolue en mémoire, voir expense/resolver.py).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from accounts.models import Antenne
+from core import replica, sharding
+from expense import resolver
+from expense.ledger import apply_balance_deltas, balance_deltas
+from expense.models import Transaction
+from .models import Credit, CreditPayment
+
+ACCOUNT_KINDS = ('CAISSE', 'BANQUE')
+
+# (clé, libellé, ancienneté maximale en jours ; None : sans limite)
+AGING_BUCKETS = (
+    ('days_0_30', "0 – 30 jours", 30),
+    ('days_31_60', "31 – 60 jours", 60),
+    ('days_61_90', "61 – 90 jours", 90),
+    ('days_90_plus', "Plus de 90 jours", None),
+)
+
+
+# ---------------------------------------------
+# Paiements
+# ---------------------------------------------
+def _record(payments, kind, user, using):
+    """
+    Enregistre des paiements [(créance, montant)] lus dans `using`, dans la
+    transaction en cours. Retourne les id des créances sans compte de
+    réception (ignorées).
+    """
+    movements, recorded, skipped = [], [], []
+    for credit, amount in payments:
+        seller_id = credit['sale__created_by_id']
+        account_id = resolver.account_for(resolver.seller_antenne(seller_id), kind)
+        if account_id is None:
+            skipped.append(credit['pk'])
+            continue
+        movements.append(Transaction(account_id=account_id, type="IN", amount=amount))
+        recorded.append((credit, amount))
+
+    Transaction.objects.using(using).bulk_create(movements)
+    CreditPayment.objects.using(using).bulk_create([
+        CreditPayment(credit_id=credit['pk'], amount=amount, account_id=movement.account_id,
+                      transaction_id=movement.pk, received_by=user)
+        for (credit, amount), movement in zip(recorded, movements)
+    ])
+
+    credits = Credit.objects.using(using)
+    settled = [credit['pk'] for credit, amount in recorded if amount == credit['balance']]
+    if settled:
+        credits.filter(pk__in=settled).update(balance=0, status=Credit.PAID)
+    for credit, amount in recorded:
+        if amount != credit['balance']:
+            credits.filter(pk=credit['pk']).update(balance=F('balance') - amount)
+
+    apply_balance_deltas(balance_deltas(movements))
+    return skipped
+
+
+def _database(credit):
+    # Une créance lue sur une réplique s'encaisse dans sa base principale
+    db = credit._state.db or sharding.current_alias()
+    return replica.primary_of(db) or db
+
+
+def _pending(credits, using):
+    return (
+        Credit.objects.using(using).select_for_update(of=('self',))
+        .filter(pk__in=credits, status=Credit.PENDING, balance__gt=0)
+        .values('pk', 'balance', 'sale__created_by_id')
+    )
+
+
+def pay(credit, amount, kind='CAISSE', user=None):
+    """
+    Paiement de `amount` sur la créance, encaissé sur le compte `kind` de
+    l'antenne du vendeur. ValidationError si le montant dépasse le reste à
+    payer ou si l'antenne n'a pas ce compte.
+    """
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValidationError("Le montant du paiement doit être positif.")
+    using = _database(credit)
+    with sharding.use_shard(using), transaction.atomic(using=using):
+        row = _pending([credit.pk], using).first()
+        if row is None:
+            raise ValidationError("Cette créance est déjà payée.")
+        if amount > row['balance']:
+            raise ValidationError(f"Le montant dépasse le reste à payer ({row['balance']} FCFA).")
+        if _record([(row, amount)], kind, user, using):
+            raise ValidationError(f"Aucun compte {kind} pour l'antenne du vendeur.")
+
+
+def settle(credits, kind='CAISSE', user=None):
+    """
+    Solde les créances `credits` (objets ou queryset) pour leur reste à
+    payer : une transaction par base. Retourne {'settled', 'total',
+    'skipped'} ; `skipped` liste les créances dont l'antenne n'a pas de
+    compte `kind`. Les créances déjà payées sont ignorées.
+    """
+    by_database = defaultdict(list)
+    for credit in credits:
+        by_database[_database(credit)].append(credit.pk)
+
+    result = {'settled': 0, 'total': Decimal(0), 'skipped': []}
+    for using, ids in by_database.items():
+        with sharding.use_shard(using), transaction.atomic(using=using):
+            rows = list(_pending(ids, using))
+            skipped = _record([(row, row['balance']) for row in rows], kind, user, using)
+        result['skipped'] += skipped
+        result['settled'] += len(rows) - len(skipped)
+        result['total'] += sum(row['balance'] for row in rows if row['pk'] not in skipped)
+    return result
+
+
+# ---------------------------------------------
+# Balance âgée
+# ---------------------------------------------
+def aging(now=None):
+    """
+    Restes à payer des créances impayées par antenne du vendeur et par
+    ancienneté : [{'antenne', 'count', 'total', <clé de AGING_BUCKETS>…}],
+    une ligne 'antenne' None pour les créances sans vente ni antenne.
+    """
+    now = now or timezone.now()
+    buckets, younger = {}, None
+    for key, _, max_days in AGING_BUCKETS:
+        # Ancienneté en jours entiers : `max_days` jours au plus
+        condition = Q() if younger is None else Q(date__lte=younger)
+        if max_days is not None:
+            younger = now - timedelta(days=max_days + 1)
+            condition &= Q(date__gt=younger)
+        buckets[key] = Sum('balance', filter=condition)
+
+    # Groupé par vendeur ; l'antenne du vendeur est résolue en mémoire
+    def query(alias):
+        return list(
+            Credit.objects.filter(status=Credit.PENDING)
+            .values('sale__created_by_id')
+            .annotate(count=Count('pk'), total=Sum('balance'), **buckets)
+            .order_by()
+        )
+
+    merged = {}
+    for rows in sharding.fan_out(Credit, query):
+        for row in rows:
+            antenne_id = resolver.seller_antenne(row['sale__created_by_id'])
+            line = merged.setdefault(antenne_id, dict.fromkeys(['count', 'total', *buckets], 0))
+            for field in line:
+                line[field] += row[field] or 0
+
+    antennes = Antenne.objects.in_bulk([pk for pk in merged if pk is not None])
+    lines = [dict(line, antenne=antennes.get(pk)) for pk, line in merged.items()]
+    lines.sort(key=lambda line: (line['antenne'] is None, line['antenne'].nom if line['antenne'] else ''))
+    return lines
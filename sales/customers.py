@@ -0,0 +1,143 @@
+# sales/customers.py
+"""
+Clients identifiés par leur numéro de téléphone normalisé.
+
+Sale.customer reste le texte saisi au comptoir (« Nom, téléphone ») ;
+Customer en est la forme normalisée, retrouvée par l'index unique de
+Customer.telephone. Deux saisies d'un même numéro (« 66 12 34 56 »,
+« +235 66123456 ») désignent le même client. Une saisie sans numéro
+exploitable (moins de MIN_DIGITS chiffres, ou plus que n'en tient
+Customer.telephone) ne désigne aucun client.
+
+Les clients sont enregistrés dans la base de leurs ventes (voir
+core/sharding.py) : un client servi dans deux villes a une fiche par
+base, avec le même numéro.
+"""
+import re
+
+from django.db import connections, transaction
+
+from core import sharding
+from .models import Credit, Customer, Sale
+
+# Indicatif du Tchad, retiré des numéros saisis au format international
+COUNTRY_CODE = '235'
+MIN_DIGITS = 6
+MAX_DIGITS = Customer._meta.get_field('telephone').max_length
+UNKNOWN_NAME = "Client Inconnu"
+
+
+def split_customer(customer):
+    """'Nom, téléphone' -> (nom, téléphone), sans échouer sur une chaîne sans virgule."""
+    if not customer:
+        return UNKNOWN_NAME, "N/A"
+    name, _, phone = customer.partition(',')
+    return name.strip() or UNKNOWN_NAME, phone.strip() or "N/A"
+
+
+def normalize_phone(phone):
+    """Chiffres du numéro, sans préfixe international ; '' s'il est inexploitable."""
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    if len(digits) > 8 and digits.startswith(COUNTRY_CODE):
+        digits = digits[len(COUNTRY_CODE):]
+    return digits if MIN_DIGITS <= len(digits) <= MAX_DIGITS else ''
+
+
+def parse(customer):
+    """Texte saisi -> (nom, téléphone normalisé) ; le téléphone vaut '' s'il manque."""
+    name, phone = split_customer(customer)
+    return name[:150], normalize_phone(phone)
+
+
+def resolve_many(texts, using):
+    """
+    {texte saisi: id du client} pour les saisies portant un numéro, dans la
+    base `using` : une lecture par l'index du téléphone, une insertion
+    groupée des clients nouveaux.
+    """
+    parsed = {}
+    for text in set(texts):
+        name, phone = parse(text)
+        if phone:
+            parsed[text] = (name, phone)
+    if not parsed:
+        return {}
+
+    names = {}
+    for name, phone in parsed.values():
+        names.setdefault(phone, name)
+    customers = Customer.objects.using(using)
+    with transaction.atomic(using=using):
+        known = dict(customers.filter(telephone__in=names).values_list('telephone', 'pk'))
+        missing = [Customer(nom=names[phone], telephone=phone) for phone in names if phone not in known]
+        if missing:
+            # Un client créé entre-temps par une autre saisie est relu ensuite
+            customers.bulk_create(missing, ignore_conflicts=True)
+            known.update(customers.filter(telephone__in=[c.telephone for c in missing]).values_list('telephone', 'pk'))
+    return {text: known[phone] for text, (_, phone) in parsed.items()}
+
+
+def resolve(customer, using):
+    """Id du client désigné par le texte saisi (créé au besoin), ou None."""
+    return resolve_many([customer], using).get(customer)
+
+
+def _link(model, pairs, using):
+    """
+    Écrit client_id pour des (id, client_id) : une requête préparée exécutée
+    en série (bulk_update construirait un CASE de la taille du lot).
+    """
+    quote = connections[using].ops.quote_name
+    sql = 'UPDATE {} SET {} = %s WHERE {} = %s'.format(
+        quote(model._meta.db_table), quote(model._meta.get_field('client').column), quote(model._meta.pk.column),
+    )
+    with connections[using].cursor() as cursor:
+        cursor.executemany(sql, [(client_id, pk) for pk, client_id in pairs])
+
+
+def backfill(batch_size=2000, log=None):
+    """
+    Rattache à leur client les ventes et créances de la base courante qui
+    n'en ont pas, par lots de `batch_size` lus dans l'ordre des id : une
+    transaction et une mise à jour groupée par lot. Peut être relancée :
+    les lignes déjà rattachées ne sont plus relues.
+    """
+    using = sharding.current_alias()
+    counts = {'sales': 0, 'credits': 0}
+
+    def batches(queryset, fields):
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', *fields)[:batch_size])
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    sales = Sale.objects.using(using).filter(client__isnull=True, customer__isnull=False).exclude(customer='')
+    for rows in batches(sales, ['customer']):
+        with transaction.atomic(using=using):
+            clients = resolve_many([customer for _, customer in rows], using)
+            linked = [(pk, clients[customer]) for pk, customer in rows if customer in clients]
+            _link(Sale, linked, using)
+        counts['sales'] += len(linked)
+        if log:
+            log(f"Ventes : {counts['sales']} rattachée(s) (jusqu'à l'id {rows[-1][0]})")
+
+    # Une créance prend le client de sa vente, à défaut celui de ses propres nom et téléphone
+    credits = Credit.objects.using(using).filter(client__isnull=True)
+    for rows in batches(credits, ['nom', 'telephone', 'sale__client_id']):
+        with transaction.atomic(using=using):
+            clients = resolve_many([f"{nom},{telephone}" for _, nom, telephone, sale_client in rows if not sale_client], using)
+            linked = []
+            for pk, nom, telephone, sale_client in rows:
+                client_id = sale_client or clients.get(f"{nom},{telephone}")
+                if client_id:
+                    linked.append((pk, client_id))
+            _link(Credit, linked, using)
+        counts['credits'] += len(linked)
+        if log:
+            log(f"Créances : {counts['credits']} rattachée(s) (jusqu'à l'id {rows[-1][0]})")
+    return counts
@@ -1,9 +1,11 @@
 import django_filters
+from core import search
 from .models import Sale
 
 class SaleFilter(django_filters.FilterSet):
-    product = django_filters.CharFilter(field_name='product__name', lookup_expr='icontains', label="Produit")
-    customer = django_filters.CharFilter(lookup_expr='icontains', label="Client")
+    # Recherche par préfixe dans l'index (core/search.py), sans LIKE '%…%'
+    product = django_filters.CharFilter(method='filter_product', label="Produit")
+    customer = django_filters.CharFilter(method='filter_customer', label="Client")
     status = django_filters.ChoiceFilter(choices=Sale.SALE_STATUS_CHOICES, label="Statut")
     created_at = django_filters.DateFromToRangeFilter(label="Date (du ... au ...)")
 
@@ -12,3 +14,11 @@ class SaleFilter(django_filters.FilterSet):
     class Meta:
         model = Sale
         fields = ['product', 'customer', 'status', 'created_at']
+
+    def filter_product(self, queryset, name, value):
+        # Produits indexés dans la base par défaut, ventes éventuellement ailleurs
+        product_ids = search.object_ids('product', value)
+        return queryset if product_ids is None else queryset.filter(product_id__in=product_ids)
+
+    def filter_customer(self, queryset, name, value):
+        return search.filter_queryset(queryset, 'sale', value)
@@ -1,6 +1,10 @@
 # sales/forms.py
+from decimal import Decimal
+
 from django import forms
+from expense import resolver
 from .models import Category, Product, Sale
+from . import pricing
 from accounts.permissions import Permissions
 
 class CategoryForm(forms.ModelForm):
@@ -38,7 +42,7 @@ class ProductForm(forms.ModelForm):
         # Limiter l'accès selon permissions
         if self.user:
             if not self.user.has_permission(Permissions.MANAGE_TREASURY):
-                self.fields['price'].disabled = True
+                self.fields['standard_price'].disabled = True
             if not self.user.has_permission(Permissions.MANAGE_USERS):
                 self.fields['category'].queryset = Category.objects.filter(type='Bien', is_validated=True)
             else:
@@ -61,6 +65,7 @@ class SaleForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
+        self.user = user
         super().__init__(*args, **kwargs)
 
         # Afficher uniquement les produits validés
@@ -81,16 +86,18 @@ class SaleForm(forms.ModelForm):
             raise forms.ValidationError("La quantité doit être un nombre positif.")
         return quantity
 
-    def clean_total_price(self):
-        """ Calcul automatique du prix total """
-        product = self.cleaned_data.get('product')
-        quantity = self.cleaned_data.get('quantity')
+    def clean(self):
+        """ Calcul automatique du prix total, au barème de l'antenne du vendeur """
+        cleaned_data = super().clean()
+        product = cleaned_data.get('product')
+        quantity = cleaned_data.get('quantity')
 
         # Vérification que le produit et la quantité sont valides
         if product and quantity:
-            total_price = product.price * quantity
-            return total_price
-        return 0  # Si aucun produit ou quantité n'est sélectionné, on retourne 0
+            seller_id = self.instance.created_by_id or (self.user.pk if self.user else None)
+            self.instance.total_price = pricing.total_for(
+                product.pk, resolver.seller_antenne(seller_id), quantity)
+        return cleaned_data
 
     def clean_status(self):
         """ Validation du champ status : ne peut être modifié par l'utilisateur non admin """
@@ -121,4 +128,20 @@ class ReportingPeriodForm(forms.Form):
         label="Période de rapport",
         # Utilisez une classe Tailwind/Bootstrap pour le style si nécessaire
         widget=forms.Select(attrs={'class': 'form-select p-2 border rounded-md'})
-    )
\ No newline at end of file
+    )
+
+class CreditPaymentForm(forms.Form):
+    """Paiement (total ou partiel) d'une créance, voir sales/credits.py."""
+    ACCOUNT_CHOICES = (
+        ('CAISSE', 'Caisse'),
+        ('BANQUE', 'Banque'),
+    )
+
+    amount = forms.DecimalField(
+        label="Montant", max_digits=12, decimal_places=2, min_value=Decimal('0.01'),
+        widget=forms.NumberInput(attrs={'class': 'w-32 px-2 py-1 border rounded', 'step': '0.01'})
+    )
+    account = forms.ChoiceField(
+        choices=ACCOUNT_CHOICES, label="Compte",
+        widget=forms.Select(attrs={'class': 'px-2 py-1 border rounded'})
+    )
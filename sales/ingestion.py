@@ -0,0 +1,272 @@
+# sales/ingestion.py
+"""
+Saisie groupée de ventes (tickets de caisse saisis en lot).
+
+Toutes les lignes sont validées en une passe contre les produits et les
+prix de l'antenne du vendeur (barème en mémoire, sales/pricing.py), puis les lignes valides sont écrites dans
+une seule transaction : Sale, Transaction et Credit par bulk_create,
+une seule variation de solde pour la caisse, une mise à jour de
+l'agrégat journalier par ligne d'agrégat.
+
+Une ligne peut porter un identifiant `uuid` généré par le poste de
+saisie : une ligne déjà enregistrée sous cet identifiant est signalée
+comme doublon au lieu d'être créée une seconde fois, ce qui permet au
+client de renvoyer un lot sans risque après une coupure réseau.
+"""
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import search, sharding
+from expense.ledger import apply_balance_deltas, balance_deltas
+from expense import resolver
+from expense.models import Transaction
+from . import customers, pricing, report_cache, rollup
+from .models import ArchivedSale, Credit, Product, Sale
+
+MAX_BATCH_SIZE = 1000
+PAYMENT_METHODS = {choice for choice, _ in Sale._meta.get_field('payment_method').choices}
+# Avance tolérée de l'horloge du poste de saisie sur celle du serveur
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+def _client_uuid(line):
+    """UUID de la ligne ; None s'il est absent, ValueError s'il est invalide."""
+    value = line.get('uuid') if isinstance(line, dict) else None
+    if value in (None, ''):
+        return None
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise ValueError("Identifiant uuid invalide.")
+
+
+def _client_date(line, now):
+    """Date de saisie hors ligne ; None si absente, ValueError si invalide."""
+    value = line.get('date')
+    if value in (None, ''):
+        return None
+    try:
+        date = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValueError("Date invalide (format ISO 8601 attendu).")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    if date > now + CLOCK_SKEW:
+        raise ValueError("La date de la vente est dans le futur.")
+    return min(date, now)
+
+
+def _parse_line(line, products, antenne_id, now):
+    """Retourne (données validées, erreurs) pour une ligne du lot."""
+    if not isinstance(line, dict):
+        return None, ["Ligne invalide : objet attendu."]
+
+    errors = []
+    try:
+        client_uuid = _client_uuid(line)
+    except ValueError as exc:
+        client_uuid = None
+        errors.append(str(exc))
+
+    try:
+        date = _client_date(line, now)
+    except ValueError as exc:
+        date = None
+        errors.append(str(exc))
+
+    try:
+        product = products.get(int(line.get('product')))
+    except (TypeError, ValueError):
+        product = None
+    if product is None:
+        errors.append("Produit inconnu ou non validé.")
+
+    try:
+        quantity = int(line.get('quantity'))
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity <= 0:
+        errors.append("La quantité doit être un nombre positif.")
+
+    payment_method = line.get('payment_method')
+    if payment_method not in PAYMENT_METHODS:
+        errors.append("Mode de paiement invalide.")
+
+    customer = line.get('customer') or None
+    if customer is not None and (not isinstance(customer, str) or len(customer) > 255):
+        errors.append("Client invalide.")
+
+    if errors:
+        return None, errors
+
+    return {
+        'product': product,
+        'quantity': quantity,
+        'total_price': pricing.total_for(product.pk, antenne_id, quantity),
+        'payment_method': payment_method,
+        'customer': customer,
+        'client_uuid': client_uuid,
+        'date': date,
+    }, []
+
+
+def _result(index, sale, status):
+    return {
+        'index': index,
+        'status': status,
+        'id': sale['pk'],
+        'total_price': str(sale['total_price'].quantize(Decimal('0.01'))),
+    }
+
+
+def ingest_sales(lines, user):
+    """
+    Enregistre un lot de ventes pour `user`. Retourne un résultat par ligne,
+    dans l'ordre du lot : {'index', 'status': 'created'|'duplicate', 'id',
+    'total_price'} ou {'index', 'status': 'error', 'errors': [...]}.
+    """
+    antenne_id = user.antenne_id
+    now = timezone.now()
+
+    # --- Référentiel : une requête pour tout le lot, les prix viennent du barème ---
+    product_ids = set()
+    for line in lines:
+        try:
+            product_ids.add(int(line.get('product')))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    products = Product.objects.filter(pk__in=product_ids, is_validated=True).in_bulk()
+
+    results = []
+    valid = []
+    line_uuids = {}
+    for index, line in enumerate(lines):
+        data, errors = _parse_line(line, products, antenne_id, now)
+        if errors:
+            results.append({'index': index, 'status': 'error', 'errors': errors})
+            try:
+                client_uuid = _client_uuid(line)
+            except ValueError:
+                client_uuid = None
+            if client_uuid:
+                line_uuids[index] = client_uuid
+        else:
+            valid.append((index, data))
+            results.append(None)
+            if data['client_uuid']:
+                line_uuids[index] = data['client_uuid']
+
+    caisse = resolver.account_for(antenne_id, "CAISSE")
+
+    # Un conflit sur client_uuid signifie qu'un envoi concurrent du même lot
+    # vient d'être enregistré : on refait alors le dédoublonnage.
+    for attempt in range(3):
+        try:
+            return _write(valid, list(results), line_uuids, user, caisse)
+        except IntegrityError:
+            if attempt == 2:
+                raise
+
+
+def _write(valid, results, line_uuids, user, caisse):
+    # --- Dédoublonnage : une requête pour tous les identifiants du lot ---
+    # Une ligne déjà enregistrée reste un doublon même si elle ne serait
+    # plus valide aujourd'hui (produit retiré du catalogue entre-temps).
+    known = {}
+    for model in (Sale, ArchivedSale):
+        missing = set(line_uuids.values()) - set(known)
+        if missing:
+            known.update(
+                (row['client_uuid'], row)
+                for row in model.objects.filter(client_uuid__in=missing).values('client_uuid', 'pk', 'total_price')
+            )
+    for index, client_uuid in line_uuids.items():
+        if client_uuid in known:
+            results[index] = _result(index, known[client_uuid], 'duplicate')
+
+    pending = []
+    repeated = []  # lignes répétant un uuid déjà présent plus haut dans le lot
+    first = {}
+    for index, data in valid:
+        client_uuid = data['client_uuid']
+        if client_uuid in known:
+            continue
+        if client_uuid in first:
+            repeated.append((index, first[client_uuid]))
+        else:
+            if client_uuid:
+                first[client_uuid] = index
+            pending.append((index, data))
+
+    if caisse is None:
+        message = "Configuration manquante : aucune caisse pour l'antenne du vendeur."
+        for index, data in pending:
+            if data['payment_method'] == 'Cash':
+                results[index] = {'index': index, 'status': 'error', 'errors': [message]}
+        pending = [(index, data) for index, data in pending if data['payment_method'] != 'Cash']
+
+    if pending:
+        sales = _create(pending, user, caisse)
+        for (index, _), sale in zip(pending, sales):
+            results[index] = _result(index, {'pk': sale.pk, 'total_price': sale.total_price}, 'created')
+
+    for index, original in repeated:
+        results[index] = dict(results[original], index=index)
+        if results[index]['status'] == 'created':
+            results[index]['status'] = 'duplicate'
+    return results
+
+
+def _create(pending, user, caisse):
+    """Écrit les lignes validées : une transaction pour tout le lot."""
+    antenne_id = user.antenne_id
+    with transaction.atomic(using=sharding.current_alias()):
+        # bulk_create n'émet pas pre_save : clients du lot résolus en bloc
+        clients = customers.resolve_many(
+            [data['customer'] for _, data in pending if data['customer']], sharding.current_alias()
+        )
+        sales = Sale.objects.bulk_create([
+            Sale(created_by=user, status=Sale.VALIDATED, client_id=clients.get(data['customer']),
+                 antenne_id=antenne_id, category_id=data['product'].category_id,
+                 **{field: value for field, value in data.items() if field != 'date'})
+            for _, data in pending
+        ])
+
+        # Date de saisie hors ligne : `date` est en auto_now_add, on la
+        # rétablit en une seule requête pour les lignes qui la fournissent
+        backdated = []
+        for (_, data), sale in zip(pending, sales):
+            if data['date']:
+                sale.date = data['date']
+                backdated.append(sale)
+        if backdated:
+            Sale.objects.bulk_update(backdated, ['date'])
+
+        movements = []
+        credits = []
+        for sale in sales:
+            if sale.payment_method == 'Cash':
+                movements.append(Transaction(account_id=caisse, type="IN", amount=sale.total_price, sale=sale))
+            else:
+                nom, telephone = customers.split_customer(sale.customer)
+                credits.append(Credit(
+                    nom=nom, telephone=telephone, date=sale.date or timezone.now(),
+                    sale=sale, client_id=sale.client_id, status=Credit.PENDING,
+                    amount=sale.total_price, balance=sale.total_price,
+                ))
+
+        Transaction.objects.bulk_create(movements)
+        Credit.objects.bulk_create(credits)
+        # bulk_create n'émet pas post_save : indexation en bloc
+        search.index_many(sales + credits, sharding.current_alias(), replace=False)
+        apply_balance_deltas(balance_deltas(movements))
+        rollup.apply_created(sales)
+        transaction.on_commit(lambda: report_cache.bump(antenne_id), using=sharding.current_alias())
+    return sales
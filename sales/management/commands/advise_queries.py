@@ -0,0 +1,260 @@
+import json
+import logging
+import sys
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from accounts.models import User
+from core.exports import consume
+from core.queryplan import QueryRecorder, explain, normalize, plan_flags
+from expense.models import Expense
+from sales import synthetic
+from sales.models import Category, Product, Sale
+
+# Espaces de noms d'URL parcourus
+NAMESPACES = ('sales', 'expenses', 'accounts')
+
+# Paramètres GET des vues qui en attendent
+QUERY_STRINGS = {
+    'sales:rapport_periodique': 'period=year',
+    'sales:mon_rapport_periodique': 'period=year',
+    'sales:rapport_details': 'period=year',
+    'sales:rapport_export': 'period=year',
+}
+
+ROLES = [role for role, _ in User.Role.choices]
+
+
+def _username(role):
+    # Utilisateurs créés par sales.synthetic
+    return 'bench_gerant_0' if role == User.Role.GERANT else f'bench_{role}'
+
+
+def _routes():
+    """(nom qualifié, motif) des URL des espaces de noms parcourus."""
+    for resolver in get_resolver().url_patterns:
+        if isinstance(resolver, URLResolver) and resolver.namespace in NAMESPACES:
+            for pattern in resolver.url_patterns:
+                if pattern.name:
+                    yield f"{resolver.namespace}:{pattern.name}", pattern
+
+
+def _samples():
+    """Objet d'exemple pour les URL à identifiant, selon le nom de la route."""
+    gerant = User.objects.get(username=_username(User.Role.GERANT))
+    return {
+        'category': Category.objects.order_by('pk').first(),
+        'product': Product.objects.order_by('pk').first(),
+        'sale': Sale.objects.filter(created_by=gerant).order_by('pk').first(),
+        'expense': (Expense.objects.filter(status='PENDING').order_by('pk').first()
+                    or Expense.objects.order_by('pk').first()),
+        'user': gerant,
+    }
+
+
+def _url(name, pattern, samples):
+    kwargs = {}
+    for param in pattern.pattern.converters:
+        sample = next((obj for key, obj in samples.items() if key in name), None)
+        if sample is None:
+            return None
+        kwargs[param] = sample.pk
+    url = reverse(name, kwargs=kwargs)
+    query = QUERY_STRINGS.get(name)
+    return f"{url}?{query}" if query else url
+
+
+def _origin(stack, root):
+    """Dernier appel du code du projet avant la requête (« fichier:ligne fonction »)."""
+    for frame in reversed(stack or []):
+        filename = frame.filename
+        if (filename.startswith(root) and '/site-packages/' not in filename
+                and not filename.endswith(('queryplan.py', 'advise_queries.py'))):
+            return f"{filename[len(root):].lstrip('/')}:{frame.lineno} {frame.name}"
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Passe chaque URL des applications sales, expenses et accounts au client de test, "
+        "pour chaque rôle, sur une base de test remplie de données synthétiques, et signale "
+        "les parcours complets de table, les tris temporaires et les requêtes répétées (N+1), "
+        "avec la vue et la ligne de gabarit qui les déclenchent. La base configurée n'est pas modifiée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10_000, help="Nombre de ventes générées")
+        parser.add_argument('--role', action='append', dest='roles', choices=ROLES,
+                            help="Limiter à ce rôle (répétable)")
+        parser.add_argument('--url', action='append', dest='urls',
+                            help="Limiter à cette route, ex. sales:sale_list (répétable)")
+        parser.add_argument('--repeat-threshold', type=int, default=5,
+                            help="Exécutions d'une même requête dans une page à partir desquelles on signale un N+1")
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help="Tables plus petites ignorées pour les parcours complets et les tris")
+        parser.add_argument('--output', default='query_advice.json')
+        parser.add_argument('--fail-on-finding', action='store_true',
+                            help="Code de sortie 1 si un problème est signalé (intégration continue)")
+
+    def handle(self, *args, **options):
+        if options['repeat_threshold'] < 2:
+            raise CommandError("--repeat-threshold doit être au moins 2.")
+        routes = list(_routes())
+        if options['urls']:
+            unknown = set(options['urls']) - {name for name, _ in routes}
+            if unknown:
+                raise CommandError(f"Route(s) inconnue(s) : {', '.join(sorted(unknown))}")
+            routes = [(name, pattern) for name, pattern in routes if name in options['urls']]
+        roles = options['roles'] or ROLES
+
+        # DEBUG désactivé comme en production : la page d'erreur de débogage
+        # ferait ses propres requêtes en affichant les variables locales.
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.stdout.write(f"Génération de {options['size']} ventes…")
+            synthetic.generate(sales=options['size'], products=max(50, min(options['size'] // 500, 1000)))
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.large_tables = {
+                model._meta.db_table for model in apps.get_models()
+                if model._meta.managed and model.objects.count() >= options['min_rows']
+            }
+            pages, findings = self.run_routes(routes, roles, options['repeat_threshold'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'size': options['size'],
+                'roles': roles,
+                'repeat_threshold': options['repeat_threshold'],
+                'min_rows': options['min_rows'],
+                'large_tables': sorted(self.large_tables),
+            },
+            'pages': pages,
+            'findings': findings,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+
+        self.summarize(pages, findings)
+        summary = f"{len(findings)} problème(s) sur {len(pages)} page(s). Rapport : {options['output']}"
+        if findings:
+            self.stderr.write(self.style.WARNING(summary))
+            if options['fail_on_finding']:
+                sys.exit(1)
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def run_routes(self, routes, roles, repeat_threshold):
+        # Une vue en erreur est signalée (statut 500 et exception dans la page),
+        # sans interrompre le parcours ni afficher sa trace
+        client = Client(raise_request_exception=False)
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            return self._run_routes(client, routes, roles, repeat_threshold)
+        finally:
+            request_logger.setLevel(level)
+
+    def _run_routes(self, client, routes, roles, repeat_threshold):
+        samples = _samples()
+        users = {role: User.objects.get(username=_username(role)) for role in roles}
+        plans = {}
+        pages, findings = [], []
+
+        for name, pattern in routes:
+            url = _url(name, pattern, samples)
+            if url is None:
+                self.stdout.write(self.style.WARNING(f"  {name} : pas d'objet d'exemple, ignorée"))
+                continue
+            view = f"{pattern.callback.__module__}.{pattern.callback.__name__}"
+
+            for role in roles:
+                caches['default'].clear()
+                client.force_login(users[role])
+                # Chaque page est annulée : une vue qui écrit (validation,
+                # suppression…) ne change pas les données des suivantes.
+                with transaction.atomic():
+                    with QueryRecorder(connection, stack=True) as recorder:
+                        response = client.get(url)
+                        consume(response)
+                    transaction.set_rollback(True)
+
+                page = {'url': name, 'path': url, 'role': role, 'view': view,
+                        'status': response.status_code, 'queries': len(recorder.queries)}
+                if response.exc_info:
+                    page['error'] = repr(response.exc_info[1])
+                pages.append(page)
+                page_findings = self.analyse(page, recorder.queries, plans, repeat_threshold)
+                findings.extend(page_findings)
+                self.stdout.write(
+                    f"  {name:<36} {role:<12} {page['status']}  {page['queries']:>4} req.  "
+                    f"{len(page_findings)} problème(s)"
+                )
+        return pages, findings
+
+    def analyse(self, page, queries, plans, repeat_threshold):
+        root = str(settings.BASE_DIR)
+        findings = []
+
+        def finding(kind, query, **details):
+            findings.append({
+                **{key: page[key] for key in ('url', 'role', 'view', 'status')},
+                'kind': kind,
+                'sql': query['sql'],
+                'origin': query['origin'],
+                'template': query['template'],
+                **details,
+            })
+
+        # Une répétition (N+1) = même forme de requête, lancée du même endroit
+        groups = defaultdict(list)
+        for query in queries:
+            query['origin'] = _origin(query['stack'], root)
+            groups[normalize(query['sql']), query['origin'], query['template']].append(query)
+
+        for (shape, _, _), runs in groups.items():
+            query = runs[0]
+            if len(runs) >= repeat_threshold:
+                finding('n_plus_one', query, executions=len(runs))
+
+            tables = {table for table in self.large_tables if f'"{table}"' in query['sql']}
+            if not tables:
+                continue
+            if shape not in plans:
+                plans[shape] = explain(connection, query['sql'], query['params'])
+            flags = plan_flags(connection.vendor, plans[shape])
+            for table in flags['full_scans']:
+                if table in self.large_tables:
+                    finding('full_scan', query, table=table, plan=plans[shape])
+            for detail in flags['temp_sorts']:
+                finding('temp_sort', query, detail=detail, plan=plans[shape])
+        return findings
+
+    def summarize(self, pages, findings):
+        errors = [page for page in pages if page.get('error')]
+        if errors or findings:
+            self.stdout.write("")
+        for page in errors:
+            self.stdout.write(f"[erreur] {page['url']} ({page['role']}) {page['status']} — {page['error']}")
+        for item in findings:
+            what = item.get('table') or item.get('detail') or f"{item.get('executions')} exécutions"
+            where = ' — '.join(filter(None, [item['origin'], item['template']]))
+            self.stdout.write(f"[{item['kind']}] {item['url']} ({item['role']}) {what} — {where or item['view']}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sales import customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Rattache les ventes et créances historiques de la base courante à leur client "
+        "(voir sales/customers.py), en lisant le texte saisi par lots. Avec des bases "
+        "réparties : on_shards backfill_customers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Lignes lues et mises à jour par transaction")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size doit être strictement positif.")
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        counts = customers.backfill(batch_size=options['batch_size'], log=log)
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['sales']} vente(s) et {counts['credits']} créance(s) rattachées à leur client."
+        ))
@@ -0,0 +1,138 @@
+import json
+import platform
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.utils import timezone
+
+from accounts.models import User
+from core.queryplan import QueryRecorder, explain, plan_flags
+from expense import ledger
+from expense.models import AccountMoney, Expense, Transaction
+from sales import synthetic
+from sales.models import Category, DailySaleSummary, Sale
+from sales.reporting import build_period_report, period_bounds, sale_lines
+
+# Modèles dont les Meta.indexes sont retirés pour la mesure « avant »
+INDEXED_MODELS = (Sale, Expense, Transaction, DailySaleSummary)
+
+
+def _shapes(context):
+    """(nom, appel) : les accès des vues, tels que les vues les font."""
+    gerant, category, account = context['gerant'], context['category'], context['account']
+    start, end = period_bounds('year')
+    return [
+        ('sale_list', lambda: (
+            list(Sale.objects.filter(created_by=gerant).order_by('-created_at')[:10]),
+            Sale.objects.filter(created_by=gerant).count(),
+        )),
+        ('sale_pending_queue', lambda: list(
+            Sale.objects.filter(status=Sale.PENDING).order_by('date')[:50]
+        )),
+        ('rapport_details', lambda: sale_lines(start, end, category.pk)),
+        ('rapport_periodique', lambda: build_period_report(start, end)),
+        ('mon_rapport_periodique', lambda: build_period_report(start, end, seller=gerant)),
+        ('pending_expenses_list', lambda: list(
+            Expense.objects.filter(status__in=['PENDING', 'IN_REVIEW']).order_by('-created_at')
+        )),
+        ('expense_list', lambda: list(Expense.objects.order_by('-created_at')[:10])),
+        ('balance_as_of', lambda: ledger.balance_as_of(account, timezone.localdate() - timedelta(days=90))),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le plan d'exécution (EXPLAIN) et le temps des accès des vues principales "
+        "sans puis avec les index déclarés dans Meta.indexes, sur une base de test "
+        "remplie de données synthétiques. La base configurée n'est pas modifiée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100_000, help="Nombre de ventes générées")
+        parser.add_argument('--repeat', type=int, default=5, help="Répétitions chronométrées par accès")
+        parser.add_argument('--output', default='query_plans.json')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.stdout.write(f"Génération de {options['size']} ventes…")
+            synthetic.generate(sales=options['size'], products=max(50, min(options['size'] // 500, 1000)))
+            context = {
+                'gerant': User.objects.get(username='bench_gerant_0'),
+                'category': Category.objects.order_by('pk').first(),
+                'account': AccountMoney.objects.filter(type='CAISSE').order_by('pk').first(),
+            }
+
+            indexes = [(model, index) for model in INDEXED_MODELS for index in model._meta.indexes]
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+            before = self.run_shapes('before', context, options['repeat'])
+
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+            after = self.run_shapes('after', context, options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'size': options['size'],
+                'repeat': options['repeat'],
+                'indexes': [index.name for _, index in indexes],
+            },
+            'results': before + after,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+        self.summarize(before, after)
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
+
+    def run_shapes(self, phase, context, repeat):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        results = []
+        for name, call in _shapes(context):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - start) * 1000)
+
+            with QueryRecorder(connection) as recorder:
+                call()
+            queries = []
+            for query in recorder.queries:
+                plan = explain(connection, query['sql'], query['params'])
+                queries.append({'sql': query['sql'], 'plan': plan, **plan_flags(connection.vendor, plan)})
+
+            results.append({
+                'phase': phase,
+                'shape': name,
+                'wall_ms_median': round(statistics.median(timings), 2),
+                'queries': queries,
+            })
+        return results
+
+    def summarize(self, before, after):
+        self.stdout.write(f"\n{'accès':<26} {'avant (ms)':>11} {'après (ms)':>11}  parcours complets après")
+        for old, new in zip(before, after):
+            scans = sorted({table for query in new['queries'] for table in query['full_scans']})
+            self.stdout.write(
+                f"{new['shape']:<26} {old['wall_ms_median']:>11.2f} {new['wall_ms_median']:>11.2f}  "
+                f"{', '.join(scans) or '-'}"
+            )
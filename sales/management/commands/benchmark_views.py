@@ -0,0 +1,160 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from core.exports import consume
+from sales import synthetic
+
+# (nom, url, paramètres GET, utilisateur)
+VIEWS = [
+    ('sale_list', 'sales:sale_list', '', 'bench_gerant_0'),
+    ('product_list', 'sales:product_list', '', 'bench_gerant_0'),
+    ('expense_list', 'expenses:expense_list', '', 'bench_admin'),
+    ('pending_expenses_list', 'expenses:pending_expenses', '', 'bench_admin'),
+    ('rapport_periodique', 'sales:rapport_periodique', 'period=year', 'bench_admin'),
+    ('mon_rapport_periodique', 'sales:mon_rapport_periodique', 'period=year', 'bench_gerant_0'),
+    ('admin_sale_changelist', 'admin:sales_sale_changelist', '', 'bench_admin'),
+    ('admin_credit_changelist', 'admin:sales_credit_changelist', '', 'bench_admin'),
+    ('admin_expense_changelist', 'admin:expense_expense_changelist', '', 'bench_admin'),
+    ('admin_transaction_changelist', 'admin:expense_transaction_changelist', '', 'bench_admin'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure les vues principales (temps, nombre de requêtes SQL, pic mémoire) sur des "
+        "bases de test remplies de données synthétiques, pour plusieurs volumes. "
+        "La base configurée n'est pas modifiée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help="Nombres de ventes, séparés par des virgules")
+        parser.add_argument('--repeat', type=int, default=5, help="Répétitions chronométrées par vue")
+        parser.add_argument('--output', default='benchmarks.json')
+        parser.add_argument('--compare', help="Résultats précédents (JSON) à comparer")
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help="Écart en %% au-delà duquel une mesure est signalée")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes attend des entiers séparés par des virgules.")
+
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = []
+            for size in sizes:
+                self.stdout.write(f"Volume : {size} ventes")
+                call_command('flush', interactive=False, verbosity=0)
+                synthetic.generate(sales=size, products=max(50, min(size // 500, 1000)))
+                results.extend(self.run_views(size, options['repeat']))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
+
+        if previous:
+            self.compare(previous, report, options['threshold'])
+
+    def run_views(self, size, repeat):
+        # Une vue en erreur est mesurée et signalée (statut 500), sans interrompre la série
+        client = Client(raise_request_exception=False)
+        users = {u.username: u for u in User.objects.filter(username__in={v[3] for v in VIEWS})}
+        results = []
+
+        for name, url_name, query, username in VIEWS:
+            client.force_login(users[username])
+            url = reverse(url_name) + (f"?{query}" if query else '')
+
+            timings = []
+            for _ in range(repeat):
+                caches['default'].clear()
+                start = time.perf_counter()
+                response = client.get(url)
+                consume(response)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            # Passage séparé pour le nombre de requêtes et la mémoire :
+            # tracemalloc fausserait les temps.
+            caches['default'].clear()
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+                consume(response)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            result = {
+                'size': size,
+                'view': name,
+                'status': response.status_code,
+                'wall_ms_median': round(statistics.median(timings), 2),
+                'wall_ms_min': round(min(timings), 2),
+                'queries': len(queries),
+                'peak_kib': round(peak / 1024, 1),
+            }
+            results.append(result)
+            self.stdout.write(
+                f"  {name:<30} {result['status']}  {result['wall_ms_median']:>9.2f} ms  "
+                f"{result['queries']:>4} req.  {result['peak_kib']:>10.1f} KiB"
+            )
+        return results
+
+    def compare(self, previous, current, threshold):
+        before = {(r['size'], r['view']): r for r in previous.get('results', [])}
+        self.stdout.write(f"\nComparaison (seuil {threshold} %) :")
+        regressions = 0
+        for result in current['results']:
+            old = before.get((result['size'], result['view']))
+            if not old:
+                continue
+            for metric in ('wall_ms_median', 'queries', 'peak_kib'):
+                if not old[metric]:
+                    continue
+                delta = (result[metric] - old[metric]) / old[metric] * 100
+                if abs(delta) >= threshold:
+                    flag = 'RÉGRESSION' if delta > 0 else 'amélioration'
+                    regressions += delta > 0
+                    self.stdout.write(
+                        f"  [{flag}] {result['view']} @ {result['size']} : {metric} "
+                        f"{old[metric]} -> {result[metric]} ({delta:+.1f} %)"
+                    )
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"{regressions} régression(s) détectée(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Aucune régression au-delà du seuil."))
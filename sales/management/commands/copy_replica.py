@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core import replica
+
+
+class Command(BaseCommand):
+    help = (
+        "Réplique locale pour les essais : écrit le battement sur la base principale "
+        "puis copie son fichier SQLite vers celui de la réplique (UNICOM_REPLICA), "
+        "une fois ou toutes les --interval secondes. La copie remplace le fichier "
+        "d'un coup : les lecteurs voient l'ancienne ou la nouvelle version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Recommencer toutes les N secondes (0 : une seule fois)")
+
+    def handle(self, *args, **options):
+        alias = replica.replicas().get(DEFAULT_DB_ALIAS)
+        if alias is None:
+            raise CommandError("Aucune réplique configurée (UNICOM_REPLICA).")
+        source, target = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[alias]
+        if 'sqlite3' not in source['ENGINE'] or 'sqlite3' not in target['ENGINE']:
+            raise CommandError("copy_replica ne sait copier qu'une base SQLite vers une réplique SQLite.")
+        if options['interval'] < 0:
+            raise CommandError("--interval doit être positif.")
+
+        while True:
+            beat_at = replica.beat()
+            self._copy(str(source['NAME']), str(target['NAME']))
+            self.stdout.write(f"Réplique copiée (battement {beat_at.isoformat()}).")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def _copy(self, source_path, target_path):
+        partial = f"{target_path}.partial"
+        source = sqlite3.connect(source_path)
+        try:
+            copy = sqlite3.connect(partial)
+            try:
+                source.backup(copy)
+            finally:
+                copy.close()
+        finally:
+            source.close()
+        os.replace(partial, target_path)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from sales import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Remplit la base avec des données synthétiques (villes, antennes, utilisateurs, "
+        "produits, ventes, créances, dépenses, transactions) pour les mesures de performance. "
+        "À lancer sur une base vide."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--villes', type=int, default=5)
+        parser.add_argument('--antennes', type=int, default=20)
+        parser.add_argument('--sellers-per-antenne', type=int, default=3)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--sales', type=int, default=100_000)
+        parser.add_argument('--expenses', type=int, default=None,
+                            help="Nombre de dépenses (par défaut : ventes / 20)")
+        parser.add_argument('--days', type=int, default=365, help="Profondeur de l'historique en jours")
+        parser.add_argument('--credit-ratio', type=float, default=0.2)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        counts = synthetic.generate(
+            villes=options['villes'],
+            antennes=options['antennes'],
+            sellers_per_antenne=options['sellers_per_antenne'],
+            products=options['products'],
+            sales=options['sales'],
+            expenses=options['expenses'],
+            days=options['days'],
+            credit_ratio=options['credit_ratio'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None,
+        )
+        for model, count in counts.items():
+            self.stdout.write(f"{model:>18} : {count}")
+        self.stdout.write(self.style.SUCCESS("Données synthétiques générées."))
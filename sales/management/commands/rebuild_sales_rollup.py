@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales import rollup
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'agrégat journalier des ventes (DailySaleSummary) à partir des ventes validées."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help="Premier jour à reconstruire (AAAA-MM-JJ)")
+        parser.add_argument('--to', dest='end', help="Dernier jour à reconstruire (AAAA-MM-JJ)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = self._parse_date(options['start'])
+        end = self._parse_date(options['end'])
+        if start and end and start > end:
+            raise CommandError("--from doit précéder --to.")
+
+        written = rollup.rebuild(start=start, end=end, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{written} ligne(s) d'agrégat reconstruite(s)."))
+
+    def _parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Date invalide : {value}")
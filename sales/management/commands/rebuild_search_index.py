@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit l'index de recherche (voir core/search.py) de la base courante : "
+        "ventes, crédits, dépenses et produits. Avec des bases réparties : "
+        "on_shards rebuild_search_index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=sorted(search.KINDS),
+                            help="Type à reconstruire (répétable ; tous par défaut)")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = search.rebuild(kinds=options['kind'], batch_size=options['batch_size'])
+        for kind, count in written.items():
+            self.stdout.write(f"{search.KIND_LABELS[kind]} : {count} entrée(s)")
+        self.stdout.write(self.style.SUCCESS("Index de recherche reconstruit."))
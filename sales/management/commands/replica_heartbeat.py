@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import replica
+
+
+class Command(BaseCommand):
+    help = (
+        "Écrit l'heure courante dans le battement (ReplicaHeartbeat) de la base principale ; "
+        "avec --check, affiche le retard de chaque réplique (voir core/replica.py). "
+        "À lancer en continu (--interval) là où une vraie réplication est en place."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Recommencer toutes les N secondes (0 : une seule fois)")
+        parser.add_argument('--check', action='store_true',
+                            help="Afficher le retard des répliques, sans écrire ; "
+                                 "erreur (code de sortie 1) si l'une dépasse REPLICA_MAX_LAG")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_replicas()
+            return
+        if options['interval'] < 0:
+            raise CommandError("--interval doit être positif.")
+
+        while True:
+            beat_at = replica.beat()
+            self.stdout.write(f"Battement : {beat_at.isoformat()}")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def check_replicas(self):
+        from django.conf import settings
+
+        replicas = replica.replicas()
+        if not replicas:
+            raise CommandError("Aucune réplique configurée (UNICOM_REPLICA).")
+        late = False
+        for primary, alias in replicas.items():
+            lag = replica.lag(alias)
+            if lag is None:
+                late = True
+                self.stdout.write(self.style.ERROR(f"{alias} (réplique de {primary}) : illisible ou sans battement"))
+            elif lag > settings.REPLICA_MAX_LAG:
+                late = True
+                self.stdout.write(self.style.WARNING(f"{alias} (réplique de {primary}) : {lag:.1f} s de retard"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{alias} (réplique de {primary}) : {lag:.1f} s de retard"))
+        if late:
+            raise CommandError("Au moins une réplique dépasse REPLICA_MAX_LAG ou est illisible.")
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_sale_client_uuid_productbyantenne_timestamps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horizon', models.DateTimeField(unique=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('sales', models.PositiveIntegerField(default=0)),
+                ('transactions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-horizon'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSale',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('last_total_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('date', models.DateTimeField()),
+                ('customer', models.CharField(blank=True, max_length=255, null=True)),
+                ('payment_method', models.CharField(choices=[('Cash', 'Cash'), ('Credit', 'Credit')], max_length=100)),
+                ('status', models.CharField(choices=[('Pending', 'En attente de validation'), ('Validated', 'Validée'), ('Rejected', 'Rejetée')], max_length=10)),
+                ('client_uuid', models.UUIDField(blank=True, null=True, unique=True)),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='sales.archivebatch')),
+                ('created_by', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='sales.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'id'], name='archivedsale_date')],
+            },
+        ),
+    ]
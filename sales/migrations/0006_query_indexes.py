@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_antenne'),
+        ('sales', '0005_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailysalesummary',
+            index=models.Index(fields=['seller', 'day'], name='dailysale_seller_day'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['created_by', '-created_at'], name='sale_seller_created'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['status', 'date'], name='sale_status_date'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['date'], name='sale_pending_date'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:26
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models
+
+FTS_STATEMENTS = [
+    # Table FTS5 à contenu externe : le texte reste dans sales_searchentry.
+    # Le type est indexé pour filtrer dans MATCH ; index de préfixes de 2 et
+    # 3 lettres pour les saisies courtes.
+    """CREATE VIRTUAL TABLE sales_searchentry_fts USING fts5(
+        kind, body, content='sales_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER sales_searchentry_fts_insert AFTER INSERT ON sales_searchentry BEGIN
+        INSERT INTO sales_searchentry_fts(rowid, kind, body) VALUES (new.id, new.kind, new.body);
+    END""",
+    """CREATE TRIGGER sales_searchentry_fts_delete AFTER DELETE ON sales_searchentry BEGIN
+        INSERT INTO sales_searchentry_fts(sales_searchentry_fts, rowid, kind, body) VALUES ('delete', old.id, old.kind, old.body);
+    END""",
+    """CREATE TRIGGER sales_searchentry_fts_update AFTER UPDATE OF kind, body ON sales_searchentry BEGIN
+        INSERT INTO sales_searchentry_fts(sales_searchentry_fts, rowid, kind, body) VALUES ('delete', old.id, old.kind, old.body);
+        INSERT INTO sales_searchentry_fts(rowid, kind, body) VALUES (new.id, new.kind, new.body);
+    END""",
+]
+
+
+def create_fts(apps, schema_editor):
+    """Index FTS5 sous SQLite (s'il est compilé) ; ailleurs, SearchTerm sert de repli."""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(FTS_STATEMENTS[0])
+        except OperationalError:
+            return
+        for statement in FTS_STATEMENTS[1:]:
+            cursor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS sales_searchentry_fts_{name}')
+        cursor.execute('DROP TABLE IF EXISTS sales_searchentry_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_replicaheartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('owner_id', models.BigIntegerField(blank=True, null=True)),
+                ('label', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='searchentry_object')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='sales.searchentry')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'entry'], name='searchterm_term')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_searchentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('nom', models.CharField(max_length=150)),
+                ('telephone', models.CharField(max_length=20, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='client',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='credits', to='sales.customer'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='client',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='sales.customer'),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(fields=['client', 'status'], name='credit_client_status'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['client', '-created_at'], name='sale_client_created'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_amounts(apps, schema_editor):
+    """Montant = total de la vente ; reste à payer nul pour une créance payée."""
+    Credit = apps.get_model('sales', 'Credit')
+    Sale = apps.get_model('sales', 'Sale')
+    credits = Credit.objects.using(schema_editor.connection.alias)
+    total = Sale.objects.filter(pk=OuterRef('sale_id')).values('total_price')[:1]
+    credits.update(amount=Coalesce(Subquery(total), Value(0)))
+    credits.filter(status='Pending').update(balance=models.F('amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expense', '0005_query_indexes'),
+        ('sales', '0009_customer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('paid_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['date'], name='credit_pending_date'),
+        ),
+        migrations.AddField(
+            model_name='creditpayment',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='expense.accountmoney'),
+        ),
+        migrations.AddField(
+            model_name='creditpayment',
+            name='credit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='sales.credit'),
+        ),
+        migrations.AddField(
+            model_name='creditpayment',
+            name='received_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='creditpayment',
+            name='transaction',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='expense.transaction'),
+        ),
+        migrations.RunPython(fill_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_antenne'),
+        ('sales', '0011_sale_rollup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('categories', 'Catégorie'), ('products', 'Produit'), ('prices', "Prix d'antenne")], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('antenne', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='accounts.antenne')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at'], name='cataloguedeletion_deleted')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_rollup_keys(apps, schema_editor):
+    """
+    Ventes archivées avant l'ajout des colonnes : antenne actuelle du
+    vendeur et catégorie actuelle du produit, comme 0011 pour Sale.
+    """
+    ArchivedSale = apps.get_model('sales', 'ArchivedSale')
+    Product = apps.get_model('sales', 'Product')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    ArchivedSale.objects.using(schema_editor.connection.alias).update(
+        antenne_id=Subquery(User.objects.filter(pk=OuterRef('created_by_id')).values('antenne_id')[:1]),
+        category_id=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('category_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_antenne'),
+        ('sales', '0012_cataloguedeletion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedsale',
+            name='antenne',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='accounts.antenne'),
+        ),
+        migrations.AddField(
+            model_name='archivedsale',
+            name='category',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='sales.category'),
+        ),
+        migrations.RunPython(fill_rollup_keys, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,10 @@ from django.conf import settings
 from django.db import models
 
 from accounts.models import Antenne, User
+from core.sharding import ShardedQuerySet
 from core.timestamps import TimeStampedModel
+from expense import resolver
+from . import pricing
 
 class Category(TimeStampedModel):
     TYPE_CHOICES = [
@@ -31,6 +34,21 @@ class Product(TimeStampedModel):
         return self.name
 
 
+class Customer(TimeStampedModel):
+    """
+    Client identifié par son téléphone normalisé (voir sales/customers.py),
+    extrait du texte libre Sale.customer.
+    """
+    nom = models.CharField(max_length=150)
+    telephone = models.CharField(max_length=20, unique=True)  # chiffres seuls, sans indicatif
+    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.nom} ({self.telephone})"
+
+
 class Sale(TimeStampedModel):
     PENDING = 'Pending'
     VALIDATED = 'Validated'
@@ -58,17 +76,66 @@ class Sale(TimeStampedModel):
     )
     created_at = models.DateTimeField(auto_now_add=True,null=True, blank=True)  
 
+    # Identifiant généré par le poste de saisie (mode hors ligne) : une vente
+    # renvoyée plusieurs fois n'est enregistrée qu'une seule fois
+    client_uuid = models.UUIDField(unique=True, null=True, blank=True, editable=False)
+
+    # Client désigné par `customer`, renseigné à l'enregistrement (voir signals.py)
+    client = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True,
+                               editable=False, db_index=False, related_name='sales')
+
+    # Clés de la vente dans DailySaleSummary (voir sales/rollup.py) : antenne
+    # du vendeur et catégorie du produit à la dernière sauvegarde. Une
+    # modification ou une suppression retire la vente de la ligne où elle a
+    # été comptée, même si le vendeur a changé d'antenne ou le produit de
+    # catégorie depuis.
+    antenne = models.ForeignKey(Antenne, on_delete=models.SET_NULL, null=True, blank=True,
+                                editable=False, db_index=False, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True,
+                                 editable=False, db_index=False, related_name='+')
+
+    objects = ShardedQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            # sale_list : ventes d'un vendeur, les plus récentes d'abord
+            models.Index(fields=['created_by', '-created_at'], name='sale_seller_created'),
+            # Fiche client : ventes du client, les plus récentes d'abord
+            models.Index(fields=['client', '-created_at'], name='sale_client_created'),
+            # Rapports et détail par catégorie : statut + plage de dates
+            models.Index(fields=['status', 'date'], name='sale_status_date'),
+            # File des ventes à valider
+            models.Index(fields=['date'], condition=models.Q(status='Pending'), name='sale_pending_date'),
+        ]
 
     def __str__(self):
         return f"Vente de {self.product.name} pour {self.quantity} au client {self.customer}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        sale = super().from_db(db, field_names, values)
+        sale._priced = (sale.__dict__.get('product_id'), sale.__dict__.get('quantity'))
+        return sale
+
     def save(self, *args, **kwargs):
-        self.total_price = self.product.price * self.quantity
+        # Antenne du vendeur et catégorie du produit, lues en mémoire (sans requête)
+        antenne_id = resolver.seller_antenne(self.created_by_id)
+        self.antenne_id = antenne_id
+        self.category_id = pricing.category_of(self.product_id)
+        changed = {'antenne', 'category'}
+        # Chiffrée à la création, puis seulement si le produit ou la quantité
+        # change : valider ou rejeter la vente ne touche pas à son montant
+        priced = (self.product_id, self.quantity)
+        if self._state.adding or getattr(self, '_priced', None) != priced:
+            self.total_price = pricing.total_for(self.product_id, antenne_id, self.quantity)
+            changed.add('total_price')
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *changed}
         super().save(*args, **kwargs)
+        self._priced = priced
 
 
-class ProductByAntenne(models.Model):
+class ProductByAntenne(TimeStampedModel):
     product  = models.ForeignKey(Product, on_delete=models.CASCADE)
     antenne = models.ForeignKey(Antenne, on_delete=models.CASCADE, blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -79,6 +146,34 @@ class ProductByAntenne(models.Model):
         return f"{self.product.name} - {self.antenne.nom} - {self.price}"
 
 
+class CatalogueDeletion(models.Model):
+    """
+    Ligne du catalogue supprimée (catégorie, produit ou prix d'antenne),
+    enregistrée par signals.py : une suppression ne laisse aucune ligne
+    modifiée, c'est cette trace que sales/sync.py renvoie aux postes hors
+    ligne pour qu'ils retirent la ligne.
+    """
+    KIND_CHOICES = [
+        ('categories', 'Catégorie'),
+        ('products', 'Produit'),
+        ('prices', "Prix d'antenne"),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # Antenne du prix supprimé : seuls les postes de l'antenne le reçoivent
+    antenne = models.ForeignKey(Antenne, on_delete=models.DO_NOTHING, db_constraint=False,
+                                null=True, blank=True, related_name='+')
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='cataloguedeletion_deleted'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id} supprimé(e) le {self.deleted_at:%Y-%m-%d}"
+
+
 class Credit(models.Model):
     PENDING = 'Pending'
     PAID = 'Paid'
@@ -96,6 +191,195 @@ class Credit(models.Model):
         choices=STATUS,
         default=PENDING
     )
+    client = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True,
+                               db_index=False, related_name='credits')
+    # Montant dû à la création (total de la vente) et reste à payer,
+    # diminué par les paiements (voir sales/credits.py)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Fiche client : encours (créances impayées) du client
+            models.Index(fields=['client', 'status'], name='credit_client_status'),
+            # Balance âgée : créances impayées par date
+            models.Index(fields=['date'], condition=models.Q(status='Pending'), name='credit_pending_date'),
+        ]
     
     def __str__(self):
-        return f"Crédit {self.nom} - {self.sale.total_price if self.sale else 0} FCFA"
+        return f"Crédit {self.nom} - {self.amount} FCFA"
+
+
+class CreditPayment(models.Model):
+    """
+    Paiement (total ou partiel) d'une créance, encaissé sur un compte : le
+    mouvement IN correspondant est `transaction`. Le journal pouvant être
+    archivé (voir expense/archive.py), le lien n'est pas contraint.
+    """
+    credit = models.ForeignKey(Credit, on_delete=models.CASCADE, related_name='payments')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    account = models.ForeignKey('expense.AccountMoney', on_delete=models.PROTECT, related_name='+')
+    transaction = models.ForeignKey('expense.Transaction', on_delete=models.DO_NOTHING, db_constraint=False,
+                                    null=True, blank=True, related_name='+')
+    received_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='+')
+    paid_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Paiement de {self.amount} FCFA sur le crédit {self.credit_id}"
+
+
+class DailySaleSummary(models.Model):
+    """
+    Agrégat journalier des ventes validées, maintenu par les signaux de Sale
+    (voir sales/rollup.py). Une ligne par (jour, antenne, vendeur, produit,
+    catégorie, mode de paiement) : les rapports périodiques lisent cette
+    table au lieu de parcourir chaque vente.
+    """
+    day = models.DateField()
+    antenne = models.ForeignKey(Antenne, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    payment_method = models.CharField(max_length=100)
+    quantity = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'antenne', 'seller', 'product', 'category', 'payment_method'],
+                name='unique_daily_sale_summary',
+            ),
+        ]
+        indexes = [
+            # mon_rapport_periodique : agrégat d'un vendeur sur une période
+            models.Index(fields=['seller', 'day'], name='dailysale_seller_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.product_id} ({self.payment_method}) : {self.amount}"
+
+
+class ArchiveBatch(models.Model):
+    """
+    Passe d'archivage : les ventes et transactions antérieures à `horizon`
+    ont été (ou sont en cours d'être) déplacées vers ArchivedSale et
+    ArchivedTransaction. Les lectures qui couvrent une période antérieure
+    à l'horizon le plus récent consultent aussi les tables d'archive.
+    """
+    horizon = models.DateTimeField(unique=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    sales = models.PositiveIntegerField(default=0)
+    transactions = models.PositiveIntegerField(default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-horizon']
+
+    def __str__(self):
+        return f"Archivage jusqu'au {self.horizon:%Y-%m-%d}"
+
+    @classmethod
+    def current_horizon(cls):
+        """Horizon d'archivage le plus récent (None si rien n'est archivé)."""
+        return cls.objects.aggregate(horizon=models.Max('horizon'))['horizon']
+
+
+class ArchivedSale(models.Model):
+    """
+    Vente archivée, copie à l'identique d'une ligne de Sale (même id).
+    Les références sont conservées sans contrainte : l'archive ne bloque
+    ni ne suit la suppression d'un produit ou d'un utilisateur.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantity = models.PositiveIntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    last_total_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    date = models.DateTimeField()
+    customer = models.CharField(max_length=255, null=True, blank=True)
+    payment_method = models.CharField(max_length=100, choices=[('Cash', 'Cash'), ('Credit', 'Credit')])
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+                                   null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=10, choices=Sale.SALE_STATUS_CHOICES)
+    client_uuid = models.UUIDField(unique=True, null=True, blank=True)
+    # Clés de l'agrégat enregistrées avec la vente (voir Sale.antenne)
+    antenne = models.ForeignKey(Antenne, on_delete=models.DO_NOTHING, db_constraint=False,
+                                null=True, blank=True, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, db_constraint=False,
+                                 null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    batch = models.ForeignKey(ArchiveBatch, on_delete=models.PROTECT, related_name='+')
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='archivedsale_date'),
+        ]
+
+    def __str__(self):
+        return f"Vente archivée {self.id} ({self.date:%Y-%m-%d})"
+
+
+class ReplicaHeartbeat(models.Model):
+    """
+    Heure écrite périodiquement sur la base principale (commandes
+    replica_heartbeat et copy_replica) : lue sur une réplique, elle en
+    donne le retard (voir core/replica.py). Une seule ligne.
+    """
+    beat_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Battement du {self.beat_at:%Y-%m-%d %H:%M:%S}"
+
+
+class SearchEntry(models.Model):
+    """
+    Ligne de l'index de recherche (voir core/search.py) : texte normalisé
+    d'un objet (vente, créance, dépense, produit), dans la base de l'objet.
+    Sous SQLite, la table FTS5 sales_searchentry_fts en est tenue à jour
+    par des déclencheurs ; ailleurs, SearchTerm sert d'index par préfixe.
+    """
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    # Vendeur ou auteur de l'objet, pour restreindre les résultats
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    label = models.CharField(max_length=255)
+    body = models.TextField()
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='searchentry_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} : {self.label}"
+
+
+class SearchTerm(models.Model):
+    """Mot d'une SearchEntry, cherché par préfixe (index de repli hors SQLite)."""
+    entry = models.ForeignKey(SearchEntry, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'entry'], name='searchterm_term'),
+        ]
+
+    def __str__(self):
+        return self.term
@@ -0,0 +1,78 @@
+# sales/pricing.py
+"""
+Barème de prix par antenne.
+
+Le prix effectif d'un produit dans une antenne est celui de sa ligne
+ProductByAntenne active ; à défaut, le prix standard du produit. Le
+barème complet est gardé en mémoire par processus (voir
+core/process_cache.py) : une table prix standard et catégorie par
+produit, et les seules lignes d'antenne, par (produit, antenne). Il est
+invalidé par les sauvegardes de Product et ProductByAntenne (voir
+sales/signals.py) ; chiffrer une vente ne coûte donc aucune requête. Un
+produit absent du barème (créé depuis son chargement) le fait relire une
+fois, puis plus jusqu'à son invalidation ou son expiration.
+"""
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+
+from core.process_cache import ProcessCache
+
+PriceBook = namedtuple('PriceBook', ['standard', 'by_antenne', 'category'])
+
+
+def _load():
+    from .models import Product, ProductByAntenne
+
+    standard, category = {}, {}
+    for pk, standard_price, category_id in Product.objects.values_list('pk', 'standard_price', 'category_id'):
+        standard[pk] = standard_price
+        category[pk] = category_id
+    # Plusieurs lignes actives pour le même couple : la plus récente fait foi
+    by_antenne = {
+        (product_id, antenne_id): price
+        for product_id, antenne_id, price in ProductByAntenne.objects.filter(
+            is_active=True, antenne__isnull=False,
+        ).order_by('pk').values_list('product_id', 'antenne_id', 'price')
+    }
+    return PriceBook(standard, by_antenne, category)
+
+
+_book = ProcessCache('pricebook:generation', _load)
+
+
+def _book_knowing(product_id):
+    """Le barème, relu une fois si le produit y est absent (voir ProcessCache.reload)."""
+    book = _book.get()
+    return book if product_id in book.standard else _book.reload(product_id)
+
+
+def price_for(product_id, antenne_id=None):
+    """Prix unitaire effectif du produit dans l'antenne (None si le produit est inconnu)."""
+    book = _book_knowing(product_id)
+    if antenne_id is not None:
+        price = book.by_antenne.get((product_id, antenne_id))
+        if price is not None:
+            return price
+    return book.standard.get(product_id)
+
+
+def category_of(product_id):
+    """Catégorie du produit (None si le produit est inconnu)."""
+    return _book_knowing(product_id).category.get(product_id)
+
+
+def total_for(product_id, antenne_id, quantity):
+    """
+    Montant d'une vente de `quantity` unités du produit dans l'antenne.
+    ValidationError si le produit est inconnu.
+    """
+    price = price_for(product_id, antenne_id)
+    if price is None:
+        raise ValidationError("Produit inconnu.")
+    return price * quantity
+
+
+def invalidate(using=None):
+    """Invalide le barème, ici et (à la validation) dans les autres processus."""
+    _book.invalidate(using)
@@ -0,0 +1,136 @@
+# sales/report_cache.py
+"""
+Cache des rapports périodiques.
+
+Une entrée est identifiée par (bornes de la période, antenne, vendeur) et
+par la version des données de l'antenne concernée. Les signaux de Sale,
+Expense et Transaction incrémentent cette version (bump) : les anciennes
+entrées ne sont plus jamais lues et expirent d'elles-mêmes, sans parcours
+du cache. Fonctionne avec les backends locmem et fichier de Django.
+
+Les versions vivent dans le cache lui-même : elles ne sont partagées
+entre les processus que si le cache l'est (cache fichier via
+UNICOM_CACHE_DIR, ou tout autre backend partagé). Avec le cache mémoire
+local (LocMemCache, par défaut), l'incrément fait par un processus
+n'atteint pas les autres, qui continuent de servir leurs entrées ; leur
+durée de vie est alors ramenée à REPORT_CACHE_LOCAL_TIMEOUT, qui borne ce
+retard. Plusieurs processus de production doivent donc partager le cache.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from core import replica
+
+ALL = 'all'
+EPOCH_KEY = 'reports:epoch'
+HITS_KEY = 'reports:hits'
+MISSES_KEY = 'reports:misses'
+
+
+def _cache():
+    return caches[getattr(settings, 'REPORT_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    if isinstance(_cache(), LocMemCache):
+        # Versions propres au processus : entrées gardées peu de temps
+        return getattr(settings, 'REPORT_CACHE_LOCAL_TIMEOUT', 60)
+    return getattr(settings, 'REPORT_CACHE_TIMEOUT', 3600)
+
+
+def _version_key(antenne_id):
+    return f"reports:version:{antenne_id if antenne_id is not None else ALL}"
+
+
+def _new_version():
+    # Une version initiale unique : si la clé est évincée du cache,
+    # elle ne peut pas retomber sur une valeur déjà utilisée.
+    return time.time_ns()
+
+
+def _incr(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def bump(*antenne_ids):
+    """
+    Signale que les données des antennes données ont changé.
+    La version globale (rapports toutes antennes) est toujours incrémentée.
+    """
+    for antenne_id in {ALL, *(a for a in antenne_ids if a is not None)}:
+        _incr(_version_key(None if antenne_id == ALL else antenne_id))
+
+
+def invalidate_all():
+    """Rend toutes les entrées obsolètes (après une reconstruction de l'agrégat)."""
+    _incr(EPOCH_KEY)
+
+
+def _versions(antenne_id):
+    cache = _cache()
+    keys = [EPOCH_KEY, _version_key(antenne_id)]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+
+def _count(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def cached(start_date, end_date, compute, antenne_id=None, seller_id=None):
+    """
+    Retourne le rapport en cache pour cette période et ce périmètre,
+    ou l'obtient via `compute()` et le met en cache.
+    """
+    cache = _cache()
+    epoch, version = _versions(antenne_id)
+    key = (
+        f"reports:{start_date:%Y%m%d}-{end_date:%Y%m%d}"
+        f":a{antenne_id if antenne_id is not None else ALL}"
+        f":s{seller_id if seller_id is not None else ALL}"
+        f":{epoch}.{version}"
+    )
+
+    report = cache.get(key)
+    if report is not None:
+        _count(HITS_KEY)
+        return report
+
+    _count(MISSES_KEY)
+    report = compute()
+    # Calculé sur une réplique, le rapport peut ignorer les dernières
+    # écritures de cette version : il n'est gardé que le temps du retard admis.
+    timeout = min(_timeout(), settings.REPLICA_MAX_LAG) if replica.in_use() else _timeout()
+    cache.set(key, report, timeout)
+    return report
+
+
+def stats():
+    """Compteurs de succès/échecs du cache des rapports."""
+    found = _cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = found.get(HITS_KEY, 0)
+    misses = found.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
@@ -0,0 +1,233 @@
+# sales/reporting.py
+"""
+Moteur commun des rapports périodiques (rapport_periodique et
+mon_rapport_periodique).
+
+Le rapport est produit en un nombre fixe de requêtes :
+- une requête groupée sur DailySaleSummary donnant les totaux
+  type -> catégorie et la répartition Cash/Crédit ;
+- une requête groupée sur Expense pour les dépenses par catégorie.
+La mémoire utilisée dépend du nombre de catégories, pas du nombre de ventes.
+Avec des bases réparties (voir core/sharding.py), ces requêtes sont
+lancées sur chaque base concernée et leurs résultats additionnés.
+
+Les lignes de vente d'une catégorie sont servies à part, page par page,
+avec une pagination par clé (date, id) : voir sale_lines. Une période qui
+commence avant l'horizon d'archivage lit aussi ArchivedSale.
+"""
+import base64
+import heapq
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from core import sharding
+from expense import resolver
+from expense.models import Expense
+from .models import ArchiveBatch, ArchivedSale, Category, DailySaleSummary, Sale
+
+
+def period_bounds(period, now=None):
+    """
+    Retourne (start_date, end_date) pour une période du ReportingPeriodForm.
+    Les bornes sont alignées sur des journées entières (heure locale).
+    """
+    now = timezone.localtime(now or timezone.now())
+    end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+    start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if period == 'week':
+        # Les 7 derniers jours (la semaine passée)
+        start_date = start_date - timedelta(days=7)
+    elif period == 'month':
+        start_date = start_date.replace(day=1)
+    elif period == 'quarter':
+        start_month = ((start_date.month - 1) // 3) * 3 + 1
+        start_date = start_date.replace(month=start_month, day=1)
+    elif period == 'year':
+        start_date = start_date.replace(month=1, day=1)
+
+    return start_date, end_date
+
+
+def build_period_report(start_date, end_date, seller=None):
+    """
+    Calcule les données du rapport entre deux dates (incluses).
+    `seller` restreint le rapport aux ventes et dépenses d'un utilisateur
+    (et aux bases de son antenne).
+    """
+    antenne_id = resolver.seller_antenne(seller.pk) if seller is not None else None
+
+    def aggregates(alias):
+        summaries = DailySaleSummary.objects.using(alias).filter(
+            day__range=[start_date.date(), end_date.date()]
+        )
+        expenses = Expense.objects.using(alias).filter(
+            created_at__range=[start_date, end_date],
+            status='APPROVED',
+        )
+        if seller is not None:
+            summaries = summaries.filter(seller=seller)
+            expenses = expenses.filter(created_by=seller)
+
+        # --- Ventes : une seule requête groupée, par catégorie ---
+        # Le détail des ventes d'une catégorie est chargé à la demande
+        # (voir sale_lines), la page de synthèse reste de taille constante.
+        ventes = summaries.values(
+            'category', 'category__type', 'category__name'
+        ).annotate(
+            quantite=Sum('quantity'),
+            montant=Sum('amount'),
+            montant_cash=Sum('amount', filter=Q(payment_method='Cash')),
+            montant_credit=Sum('amount', filter=Q(payment_method='Credit')),
+        ).order_by()
+        depenses = expenses.values('category__name').annotate(total_depense=Sum('amount')).order_by()
+        return list(ventes), list(depenses)
+
+    parts = sharding.fan_out(DailySaleSummary, aggregates, antenne_id)
+    lignes_par_categorie = _merge_sums(
+        (ligne for ventes, _ in parts for ligne in ventes),
+        key=('category', 'category__type', 'category__name'),
+        sums=('quantite', 'montant', 'montant_cash', 'montant_credit'),
+        order=lambda ligne: (ligne['category__type'], ligne['category__name']),
+    )
+
+    libelles_types = dict(Category.TYPE_CHOICES)
+    ventes_cash = 0
+    ventes_credit = 0
+
+    ventes_par_type = defaultdict(lambda: {
+        'total_par_type': 0,
+        'categories': {},
+    })
+
+    for ligne in lignes_par_categorie:
+        category_type = libelles_types.get(ligne['category__type'], ligne['category__type'])
+        montant = ligne['montant'] or 0
+        cash = ligne['montant_cash'] or 0
+        credit = ligne['montant_credit'] or 0
+
+        ventes_par_type[category_type]['categories'][ligne['category__name']] = {
+            'id': ligne['category'],
+            'quantite': ligne['quantite'],
+            'total': montant,
+            'total_cash': cash,
+            'total_credit': credit,
+        }
+        ventes_par_type[category_type]['total_par_type'] += montant
+        ventes_cash += cash
+        ventes_credit += credit
+
+    ventes_detaillees_par_categorie = dict(ventes_par_type)
+
+    # --- Dépenses : une requête groupée, le total en découle ---
+    depenses_par_section = _merge_sums(
+        (ligne for _, depenses in parts for ligne in depenses),
+        key=('category__name',),
+        sums=('total_depense',),
+        # Comme ORDER BY : la section sans catégorie en premier
+        order=lambda ligne: (ligne['category__name'] is not None, ligne['category__name'] or ''),
+    )
+    total_depenses_global = sum(d['total_depense'] or 0 for d in depenses_par_section)
+
+    return {
+        'ventes_detaillees_par_categorie': ventes_detaillees_par_categorie,
+        'ventes_cash': ventes_cash,
+        'ventes_credit': ventes_credit,
+        'total_ventes': ventes_cash + ventes_credit,
+        'depenses_par_section': depenses_par_section,
+        'total_depenses_global': total_depenses_global,
+        # Le solde net n'inclut que les ventes qui ont été encaissées (Cash)
+        'solde_net': ventes_cash - total_depenses_global,
+    }
+
+
+def _merge_sums(lignes, key, sums, order):
+    """Additionne les lignes groupées de plusieurs bases ayant la même clé."""
+    merged = {}
+    for ligne in lignes:
+        k = tuple(ligne[field] for field in key)
+        if k not in merged:
+            merged[k] = dict(ligne)
+            continue
+        for field in sums:
+            if ligne[field] is not None:
+                merged[k][field] = (merged[k][field] or 0) + ligne[field]
+    return sorted(merged.values(), key=order)
+
+
+# ---------------------------------------------
+# Détail des ventes (chargement à la demande)
+# ---------------------------------------------
+def encode_cursor(date, pk):
+    """Curseur opaque désignant la position (date, id) d'une vente."""
+    raw = f"{date.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """Retourne (date, id) ou None si le curseur est absent ou invalide."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def sale_lines(start_date, end_date, category_id, seller=None, after=None, page_size=50):
+    """
+    Une page des ventes validées d'une catégorie, triées par (date, id).
+
+    La page suivante commence strictement après le curseur `after`, ce qui
+    évite tout OFFSET : la page N coûte autant que la première. Avec des
+    bases réparties, chaque base fournit sa page et les pages sont fusionnées.
+    Retourne (lignes, curseur_suivant) ; curseur_suivant vaut None à la fin.
+    """
+    position = decode_cursor(after)
+
+    def lines_of(model, alias):
+        # Catégorie enregistrée avec la vente, comme dans l'agrégat journalier :
+        # le détail garde les mêmes ventes si le produit change de catégorie
+        sales = model.objects.using(alias).filter(
+            date__range=[start_date, end_date],
+            status=Sale.VALIDATED,
+            category_id=category_id,
+        )
+        if seller is not None:
+            sales = sales.filter(created_by=seller)
+        if position:
+            date, pk = position
+            sales = sales.filter(Q(date__gt=date) | Q(date=date, id__gt=pk))
+        return sales.values(
+            'id', 'date', 'product__name', 'quantity', 'total_price',
+            'payment_method', 'customer',
+        )
+
+    def page_of(alias):
+        sales = lines_of(Sale, alias)
+        horizon = ArchiveBatch.current_horizon()
+        if horizon and start_date <= horizon:
+            sales = sales.union(lines_of(ArchivedSale, alias), all=True)
+        return list(sales.order_by('date', 'id')[:page_size + 1])
+
+    antenne_id = resolver.seller_antenne(seller.pk) if seller is not None else None
+    pages = sharding.fan_out(Sale, page_of, antenne_id)
+    # Identifiants uniques sur l'ensemble des bases : (date, id) reste un ordre total
+    merged = heapq.merge(*pages, key=lambda ligne: (ligne['date'], ligne['id']))
+    lignes = [ligne for _, ligne in zip(range(page_size + 1), merged)]
+
+    next_cursor = None
+    if len(lignes) > page_size:
+        lignes = lignes[:page_size]
+        next_cursor = encode_cursor(lignes[-1]['date'], lignes[-1]['id'])
+
+    for ligne in lignes:
+        quantite = ligne['quantity']
+        ligne['prix_unitaire'] = ligne['total_price'] / quantite if quantite else 0
+
+    return lignes, next_cursor
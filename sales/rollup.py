@@ -0,0 +1,179 @@
+# sales/rollup.py
+"""
+Maintenance de l'agrégat journalier des ventes (DailySaleSummary).
+
+Chaque vente validée contribue (quantité, montant) à une ligne
+(jour, antenne, vendeur, produit, catégorie, mode de paiement).
+Les signaux de Sale appliquent la différence entre l'ancienne et la
+nouvelle contribution, de sorte que validation, rejet et modification
+restent cohérents sans jamais relire l'historique.
+
+L'antenne et la catégorie de la ligne sont celles enregistrées sur la
+vente (Sale.antenne, Sale.category, fixées par Sale.save) et non celles
+du vendeur et du produit au moment de la lecture : la contribution
+retirée est toujours celle qui avait été ajoutée.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core import sharding
+from . import report_cache
+from .models import ArchiveBatch, DailySaleSummary, Sale
+
+Contribution = namedtuple('Contribution', ['key', 'quantity', 'amount'])
+
+
+def _make_key(date, antenne_id, seller_id, product_id, category_id, payment_method):
+    return {
+        'day': timezone.localdate(date),
+        'antenne_id': antenne_id,
+        'seller_id': seller_id,
+        'product_id': product_id,
+        'category_id': category_id,
+        'payment_method': payment_method,
+    }
+
+
+def contribution_of(sale):
+    """Contribution d'une instance de vente (None si elle n'est pas validée)."""
+    if sale.status != Sale.VALIDATED or sale.date is None:
+        return None
+
+    key = _make_key(
+        sale.date, sale.antenne_id, sale.created_by_id,
+        sale.product_id, sale.category_id, sale.payment_method,
+    )
+    return Contribution(key, sale.quantity, sale.total_price)
+
+
+def stored_contribution(pk):
+    """Contribution de la vente telle qu'elle est enregistrée en base."""
+    if pk is None:
+        return None
+
+    row = Sale.objects.filter(pk=pk, status=Sale.VALIDATED).values(
+        'date', 'antenne', 'created_by', 'product',
+        'category', 'payment_method', 'quantity', 'total_price',
+    ).first()
+    if row is None:
+        return None
+
+    key = _make_key(
+        row['date'], row['antenne'], row['created_by'],
+        row['product'], row['category'], row['payment_method'],
+    )
+    return Contribution(key, row['quantity'], row['total_price'])
+
+
+def _add(key, quantity, amount):
+    """Ajoute (quantity, amount) à la ligne `key`, en la créant au besoin."""
+    if not quantity and not amount:
+        return
+
+    changes = {'quantity': F('quantity') + quantity, 'amount': F('amount') + amount}
+    if DailySaleSummary.objects.filter(**key).update(**changes):
+        return
+
+    try:
+        with transaction.atomic(using=sharding.current_alias()):
+            DailySaleSummary.objects.create(quantity=quantity, amount=amount, **key)
+    except IntegrityError:
+        # Une autre requête a créé la ligne entre-temps
+        DailySaleSummary.objects.filter(**key).update(**changes)
+
+
+def apply_change(previous, current):
+    """Remplace la contribution `previous` par `current` dans l'agrégat."""
+    if previous and current and previous.key == current.key:
+        _add(current.key, current.quantity - previous.quantity, current.amount - previous.amount)
+        return
+
+    if previous:
+        _add(previous.key, -previous.quantity, -previous.amount)
+    if current:
+        _add(current.key, current.quantity, current.amount)
+
+
+def apply_created(sales):
+    """
+    Ajoute à l'agrégat des ventes insérées en masse (bulk_create), avec une
+    seule mise à jour par ligne d'agrégat concernée.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for sale in sales:
+        contribution = contribution_of(sale)
+        if contribution:
+            total = totals[tuple(contribution.key.items())]
+            total[0] += contribution.quantity
+            total[1] += contribution.amount
+
+    for key, (quantity, amount) in totals.items():
+        _add(dict(key), quantity, amount)
+
+
+def rebuild(start=None, end=None, batch_size=1000):
+    """
+    Reconstruit l'agrégat à partir des ventes validées, pour les jours
+    compris entre `start` et `end` (dates incluses, None = sans borne).
+    Les jours archivés (voir expense/archive.py) ne sont jamais reconstruits :
+    leurs lignes tiennent lieu de report pour les ventes déplacées.
+    Retourne le nombre de lignes écrites.
+    """
+    horizon = ArchiveBatch.current_horizon()
+    if horizon:
+        first_hot_day = timezone.localtime(horizon).date() + timedelta(days=1)
+        if start is None or start < first_hot_day:
+            start = first_hot_day
+
+    summaries = DailySaleSummary.objects.all()
+    sales = Sale.objects.filter(status=Sale.VALIDATED).annotate(
+        day=TruncDate('date', tzinfo=timezone.get_current_timezone())
+    )
+    if start:
+        summaries = summaries.filter(day__gte=start)
+        sales = sales.filter(day__gte=start)
+    if end:
+        summaries = summaries.filter(day__lte=end)
+        sales = sales.filter(day__lte=end)
+
+    rows = sales.values(
+        'day', 'antenne', 'created_by', 'product',
+        'category', 'payment_method',
+    ).annotate(
+        quantity_sum=Sum('quantity'),
+        amount_sum=Sum('total_price'),
+    ).order_by()
+
+    written = 0
+    with transaction.atomic(using=sharding.current_alias()):
+        summaries.delete()
+
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(DailySaleSummary(
+                day=row['day'],
+                antenne_id=row['antenne'],
+                seller_id=row['created_by'],
+                product_id=row['product'],
+                category_id=row['category'],
+                payment_method=row['payment_method'],
+                quantity=row['quantity_sum'],
+                amount=row['amount_sum'],
+            ))
+            if len(batch) >= batch_size:
+                DailySaleSummary.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+
+        if batch:
+            DailySaleSummary.objects.bulk_create(batch)
+            written += len(batch)
+
+        transaction.on_commit(report_cache.invalidate_all, using=sharding.current_alias())
+
+    return written
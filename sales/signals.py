@@ -1,96 +1,40 @@
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
-from expense.models import AccountMoney, Expense, Transaction
-from .models import Credit, Sale
+from core import search, sharding
+from expense import resolver
+from expense.models import Transaction
+from . import customers, pricing, report_cache, rollup
+from .models import CatalogueDeletion, Category, Credit, Customer, Product, ProductByAntenne, Sale
 
 
 # -----------------------------
 # SIGNAL POUR LES VENTES
 # -----------------------------
 @receiver(post_save, sender=Sale)
-def update_account_on_sale(sender, instance, created, **kwargs):
-    """
-    Gère la création d'une Transaction (Cash) ou d'une Créance (Crédit) 
-    lorsqu'une nouvelle vente est validée.
-    """
-    
-    # 1. On traite uniquement les nouvelles ventes
-    # Note: Dans un système réel, il est souvent préférable de vérifier 
-    # le statut (instance.status == Sale.VALIDATED) également.
-    if not created:
-        return 
-
-    # --- Logique conditionnelle basée sur le mode de paiement ---
-
-    if instance.payment_method == 'Cash':
-        
-        ## A. GESTION DU PAIEMENT CASH
-        
-        # 1. Choisir le compte à créditer (la caisse)
-        try:
-            # Idéalement, utilisez un ID ou une configuration plus robuste que le type en dur
-            account = AccountMoney.objects.get(type="CAISSE")
-        except AccountMoney.DoesNotExist:
-            # Gérer l'exception si le compte CAISSE n'existe pas
-            print("Erreur: Aucun compte de type CAISSE trouvé.")
-            return # Ou raise ValidationError("...")
-
-        # 2. Créer une transaction IN (Entrée) pour le mouvement de caisse
-        Transaction.objects.create(
-            account=account,
-            type="IN",
-            amount=instance.total_price,
-            sale=instance
-        )
-        
-    elif instance.payment_method == 'Credit':
-        
-        ## B. GESTION DU PAIEMENT CRÉDIT (Créance Client)
-
-        # 1. Vérification des informations client (à adapter selon vos besoins)
-        customer_name = instance.customer.split(',')[0] if instance.customer else "Client Inconnu"
-        # Il vous manque le champ téléphone dans votre modèle Sale. 
-        # Si vous n'avez pas le téléphone dans Sale, utilisez une valeur par défaut.
-        customer_phone = instance.customer.split(',')[1] if instance.customer else "N/A" 
-        
-        # 2. Créer une instance de Créance (Credit)
-        Credit.objects.create(
-            nom=customer_name,
-            telephone=customer_phone,
-            # La date de la créance est la date de la vente
-            date=instance.date, 
-            sale=instance
-            # Le statut par défaut est 'Pending'
-            # Note: Votre modèle Credit est incomplet, il manque le montant total dû !
-        )
-        
-        # NOTE IMPORTANTE: 
-        # Le solde du compte (AccountMoney) n'est PAS mis à jour ici car l'argent n'est pas reçu.
-        
-    else:
-        # Gérer les autres modes de paiement si nécessaire (par exemple, "BANQUE")
-        pass
-
-
-@receiver(post_save, sender=Sale)
-def update_account_on_sale(sender, instance, created, **kwargs):
+@sharding.on_instance_database
+def update_account_on_sale(sender, instance, created, update_fields=None, **kwargs):
     """
     Gère la création d'une Transaction liée à la caisse DE L'ANTENNE 
     ou d'une Créance (Crédit) lorsqu'une nouvelle vente est validée.
     """
     if not created:
+        if instance.payment_method == 'Credit' and update_fields is None:
+            # Vente modifiée : la créance impayée suit le nouveau total
+            Credit.objects.filter(sale=instance, status=Credit.PENDING).exclude(amount=instance.total_price).update(
+                balance=F('balance') + instance.total_price - F('amount'), amount=instance.total_price,
+            )
         return 
 
-    # 1. Identifier l'antenne du vendeur (créateur de la vente)
-    vendeur = instance.created_by
-    if not vendeur or not hasattr(vendeur, 'antenne'): # Remplacez par le nom de votre champ FK
-        # Optionnel: lever une erreur si le vendeur n'est pas rattaché à une antenne
+    # 1. Identifier l'antenne du vendeur (créateur de la vente), sans requête
+    if not instance.created_by_id:
         return
 
-    antenne_du_vendeur = vendeur.antenne
+    antenne_id = resolver.seller_antenne(instance.created_by_id)
 
     # --- Logique basée sur le mode de paiement ---
 
@@ -99,18 +43,15 @@ def update_account_on_sale(sender, instance, created, **kwargs):
         ## A. GESTION DU PAIEMENT CASH PAR ANTENNE
         
         # On cherche la CAISSE spécifiquement liée à cette ANTENNE
-        account = AccountMoney.objects.filter(
-            antenne=antenne_du_vendeur, 
-            type="CAISSE"
-        ).first()
+        account_id = resolver.account_for(antenne_id, "CAISSE")
 
-        if not account:
+        if account_id is None:
             # Sécurité : On ne peut pas valider une vente cash sans caisse configurée pour l'antenne
-            raise ValidationError(f"Configuration manquante : Aucune caisse trouvée pour l'antenne {antenne_du_vendeur.nom}")
+            raise ValidationError(f"Configuration manquante : Aucune caisse trouvée pour l'antenne n°{antenne_id}")
 
         # Création de la transaction dans la bonne caisse
         Transaction.objects.create(
-            account=account,
+            account_id=account_id,
             type="IN",
             amount=instance.total_price,
             sale=instance
@@ -119,9 +60,7 @@ def update_account_on_sale(sender, instance, created, **kwargs):
     elif instance.payment_method == 'Credit':
 
         ## B. GESTION DU PAIEMENT CRÉDIT (lié à l'antenne)
-        customer_name = instance.customer.split(',')[0] if instance.customer else "Client Inconnu"
-        # Si vous n'avez pas le téléphone dans Sale, utilisez une valeur par défaut.
-        customer_phone = instance.customer.split(',')[1] if instance.customer else "N/A" 
+        customer_name, customer_phone = customers.split_customer(instance.customer)
         
         # 2. Créer une instance de Créance (Credit)
         Credit.objects.create(
@@ -130,8 +69,133 @@ def update_account_on_sale(sender, instance, created, **kwargs):
             # La date de la créance est la date de la vente
             date=instance.date or timezone.now(), 
             sale=instance,
+            client_id=instance.client_id,
+            amount=instance.total_price,
+            balance=instance.total_price,
             status='Pending'
             # Le statut par défaut est 'Pending'
-            # Note: Votre modèle Credit est incomplet, il manque le montant total dû !
         )
-        
\ No newline at end of file
+
+
+# -----------------------------
+# CLIENT DE LA VENTE (voir sales/customers.py)
+# -----------------------------
+@receiver(pre_save, sender=Sale)
+@sharding.on_instance_database
+def attach_customer_to_sale(sender, instance, using, raw=False, update_fields=None, **kwargs):
+    """Rattache la vente au client désigné par `customer` (créé au besoin)."""
+    # Un enregistrement partiel ne peut écrire le client que s'il le liste
+    if raw or (update_fields is not None and not {'customer', 'client'} <= set(update_fields)):
+        return
+    _, phone = customers.parse(instance.customer)
+    if not phone:
+        instance.client = None
+        return
+    if instance.client_id is not None:
+        # Modification : relecture du seul numéro du client actuel
+        current = Customer.objects.using(using).filter(pk=instance.client_id).values_list('telephone', flat=True).first()
+        if current == phone:
+            return
+    instance.client_id = customers.resolve(instance.customer, using)
+
+
+# -----------------------------
+# AGRÉGAT JOURNALIER DES VENTES
+# -----------------------------
+@receiver(pre_save, sender=Sale)
+@sharding.on_instance_database
+def remember_sale_contribution(sender, instance, raw=False, **kwargs):
+    """
+    Mémorise la contribution actuelle (en base) de la vente avant sa
+    sauvegarde, pour que post_save n'applique que la différence.
+    """
+    if raw:
+        return
+    instance._rollup_previous = rollup.stored_contribution(instance.pk)
+
+
+@receiver(post_save, sender=Sale)
+@sharding.on_instance_database
+def update_daily_summary_on_sale(sender, instance, raw=False, **kwargs):
+    """
+    Met à jour DailySaleSummary après création, validation, rejet
+    ou modification d'une vente.
+    """
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    rollup.apply_change(previous, rollup.contribution_of(instance))
+    instance._rollup_previous = None
+
+
+@receiver(post_delete, sender=Sale)
+@sharding.on_instance_database
+def update_daily_summary_on_sale_delete(sender, instance, **kwargs):
+    rollup.apply_change(rollup.contribution_of(instance), None)
+
+
+# -----------------------------
+# CACHE DES RAPPORTS
+# -----------------------------
+@receiver([post_save, post_delete], sender=Sale)
+@sharding.on_instance_database
+def bump_report_version_on_sale(sender, instance, raw=False, **kwargs):
+    """Rend obsolètes les rapports en cache de l'antenne du vendeur."""
+    if raw:
+        return
+    antenne_id = resolver.seller_antenne(instance.created_by_id)
+    transaction.on_commit(lambda: report_cache.bump(antenne_id), using=sharding.current_alias())
+
+
+# -----------------------------
+# BARÈME DE PRIX EN MÉMOIRE
+# -----------------------------
+@receiver([post_save, post_delete], sender=ProductByAntenne)
+def invalidate_price_book_on_price(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    pricing.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_price_book_on_product(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Seuls le prix standard, la catégorie (ou l'apparition d'un produit) changent le barème."""
+    if raw or (update_fields is not None and not {'standard_price', 'category'} & set(update_fields)):
+        return
+    pricing.invalidate()
+
+
+# -----------------------------
+# SUPPRESSIONS DU CATALOGUE (voir sales/sync.py)
+# -----------------------------
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductByAntenne)
+def record_catalogue_deletion(sender, instance, using, **kwargs):
+    """Trace renvoyée aux postes hors ligne ; les copies des bases réparties ne comptent pas."""
+    if using != DEFAULT_DB_ALIAS:
+        return
+    kind = {Category: 'categories', Product: 'products', ProductByAntenne: 'prices'}[sender]
+    CatalogueDeletion.objects.create(
+        kind=kind, object_id=instance.pk, antenne_id=getattr(instance, 'antenne_id', None),
+    )
+
+
+# -----------------------------
+# INDEX DE RECHERCHE (voir core/search.py)
+# -----------------------------
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=Credit)
+@receiver(post_save, sender=Product)
+def index_for_search(sender, instance, created, using, update_fields=None, **kwargs):
+    """Réindexe l'objet dans sa base, sauf si seuls des champs non indexés changent."""
+    if update_fields is not None and not {'customer', 'nom', 'telephone', 'name'} & set(update_fields):
+        return
+    search.index(instance, using, created)
+
+
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=Credit)
+@receiver(post_delete, sender=Product)
+def unindex_for_search(sender, instance, using, **kwargs):
+    search.unindex(instance, using)
@@ -0,0 +1,110 @@
+# sales/sync.py
+"""
+Synchronisation des postes de saisie hors ligne.
+
+Un poste enregistre ses ventes localement, chacune avec un uuid qu'il
+génère lui-même, puis les envoie par lots dès que le réseau revient.
+En retour, il reçoit les changements du catalogue (catégories, produits,
+prix de son antenne) depuis son dernier filigrane, fondé sur
+TimeStampedModel.updated_at : un aller-retour suffit quelle que soit la
+durée de la coupure.
+
+Le filigrane est relu avec une marge (SYNC_OVERLAP) : une modification
+enregistrée par une transaction plus lente, avec un updated_at
+légèrement antérieur au filigrane, est ainsi renvoyée au tour suivant.
+Le poste applique les lignes du catalogue par identifiant, un renvoi
+est donc sans effet. Les lignes supprimées depuis le filigrane lui sont
+signalées par leur identifiant (CatalogueDeletion, sous 'deleted'), à
+retirer après avoir appliqué les lignes modifiées.
+"""
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .ingestion import ingest_sales
+from .models import CatalogueDeletion, Category, Product, ProductByAntenne
+
+SYNC_OVERLAP = timedelta(seconds=30)
+
+CATEGORY_FIELDS = ('id', 'name', 'type', 'is_validated', 'updated_at')
+PRODUCT_FIELDS = ('id', 'category_id', 'name', 'standard_price', 'unit', 'is_active', 'is_validated', 'updated_at')
+PRICE_FIELDS = ('id', 'product_id', 'price', 'is_active', 'is_validated', 'updated_at')
+
+
+def parse_watermark(value):
+    """Filigrane envoyé par le poste ; None pour une première synchronisation."""
+    if value in (None, ''):
+        return None
+    watermark = parse_datetime(value) if isinstance(value, str) else None
+    if watermark is None:
+        raise ValueError("Filigrane invalide (format ISO 8601 attendu).")
+    if timezone.is_naive(watermark):
+        watermark = timezone.make_aware(watermark)
+    return watermark
+
+
+def _changed(queryset, since):
+    if since is None:
+        # Première synchronisation : tout, y compris les lignes antérieures
+        # à l'ajout des horodatages (updated_at vide)
+        return queryset
+    return queryset.filter(updated_at__gte=since - SYNC_OVERLAP)
+
+
+def catalogue_changes(user, since):
+    """
+    Retourne (catalogue, filigrane) : les lignes modifiées depuis `since`,
+    les identifiants des lignes supprimées et le filigrane à renvoyer au
+    prochain appel. Les lignes désactivées (is_active) sont incluses pour
+    que le poste les retire.
+    """
+    # Le filigrane avance avec l'horloge même sans modification, pour que
+    # la marge de relecture ne renvoie pas indéfiniment les mêmes lignes
+    watermark = timezone.now() - SYNC_OVERLAP
+    if since and since > watermark:
+        watermark = since
+    prices = (ProductByAntenne.objects.filter(antenne_id=user.antenne_id)
+              if user.antenne_id else ProductByAntenne.objects.none())
+    querysets = {
+        'categories': (_changed(Category.objects.all(), since), CATEGORY_FIELDS),
+        'products': (_changed(Product.objects.all(), since), PRODUCT_FIELDS),
+        'prices': (_changed(prices, since), PRICE_FIELDS),
+    }
+
+    catalogue = {}
+    for name, (queryset, fields) in querysets.items():
+        rows = list(queryset.order_by('pk').values(*fields))
+        catalogue[name] = rows
+        latest = max((row['updated_at'] for row in rows if row['updated_at']), default=None)
+        if latest and latest > watermark:
+            watermark = latest
+
+    # Première synchronisation : le catalogue est complet, rien à retirer
+    deleted = {name: [] for name in querysets}
+    if since is not None:
+        visible = Q(kind__in=['categories', 'products'])
+        if user.antenne_id:
+            visible |= Q(kind='prices', antenne_id=user.antenne_id)
+        deletions = CatalogueDeletion.objects.filter(visible, deleted_at__gte=since - SYNC_OVERLAP)
+        for kind, object_id, deleted_at in deletions.order_by('pk').values_list('kind', 'object_id', 'deleted_at'):
+            deleted[kind].append(object_id)
+            if deleted_at > watermark:
+                watermark = deleted_at
+    catalogue['deleted'] = deleted
+    return catalogue, watermark
+
+
+def sync(user, sales, since):
+    """Enregistre les ventes du poste puis retourne les changements du catalogue."""
+    results = ingest_sales(sales, user) if sales else []
+    catalogue, watermark = catalogue_changes(user, since)
+    return {
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'duplicates': sum(1 for result in results if result['status'] == 'duplicate'),
+        'errors': sum(1 for result in results if result['status'] == 'error'),
+        'results': results,
+        'catalogue': catalogue,
+        'watermark': watermark.isoformat(),
+    }
@@ -0,0 +1,240 @@
+# sales/synthetic.py
+"""
+Générateur de données synthétiques pour les mesures de performance.
+
+Tout est inséré par bulk_create, par lots, sans passer par les signaux :
+les Transaction, Credit, ApprovalStep et soldes de comptes sont donc
+produits ici directement, puis l'agrégat journalier est reconstruit, les
+ventes et créances rattachées à leurs clients (Customer) et l'index de
+recherche reconstruit.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from accounts.models import Antenne, User, Ville
+from core import search
+from expense.ledger import signed_amount
+from expense.models import (
+    AccountMoney, ApprovalStep, Expense, ExpenseCategory, Transaction, ValidationThreshold,
+)
+from . import customers, rollup
+from .models import Category, Credit, Customer, Product, ProductByAntenne, Sale
+
+PASSWORD = 'bench-password'
+
+
+@contextmanager
+def _keep_dates(*models):
+    """Désactive auto_now_add le temps d'insérer des dates historiques."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _batches(total, batch_size):
+    start = 0
+    while start < total:
+        yield start, min(batch_size, total - start)
+        start += batch_size
+
+
+def generate(villes=5, antennes=20, sellers_per_antenne=3, products=200, sales=100_000,
+             expenses=None, days=365, credit_ratio=0.2, seed=42, batch_size=5000, stdout=None):
+    """
+    Remplit la base avec un réseau d'antennes et son historique de ventes
+    et de dépenses répartis sur `days` jours. Retourne le nombre de lignes
+    créées par modèle.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    expenses = sales // 20 if expenses is None else expenses
+    password = make_password(PASSWORD)
+    counts = {}
+
+    def log(message):
+        if stdout:
+            stdout.write(message)
+
+    def random_date():
+        return now - timedelta(seconds=rng.randint(0, days * 86400))
+
+    with transaction.atomic():
+        # --- Référentiel ---
+        ville_objs = Ville.objects.bulk_create(
+            [Ville(name=f"Ville {i}") for i in range(villes)]
+        )
+
+        central = User.objects.bulk_create([
+            User(username=f"bench_{role}", role=role, password=password, is_staff=True,
+                 is_superuser=(role == User.Role.ADMIN))
+            for role in (User.Role.ADMIN, User.Role.DIRECTEUR, User.Role.SUPERVISEUR)
+        ])
+        gerants = User.objects.bulk_create([
+            User(username=f"bench_gerant_{i}", role=User.Role.GERANT, password=password)
+            for i in range(antennes)
+        ])
+        antenne_objs = Antenne.objects.bulk_create([
+            Antenne(nom=f"Antenne {i}", lieux=ville_objs[i % villes], gerant=gerants[i])
+            for i in range(antennes)
+        ])
+        for gerant, antenne in zip(gerants, antenne_objs):
+            gerant.antenne = antenne
+        User.objects.bulk_update(gerants, ['antenne'])
+
+        vendeurs = User.objects.bulk_create([
+            User(username=f"bench_vendeur_{a}_{j}", role=User.Role.GERANT,
+                 antenne=antenne_objs[a], password=password)
+            for a in range(antennes) for j in range(max(sellers_per_antenne - 1, 0))
+        ])
+        sellers_by_antenne = {antenne.pk: [gerant] for gerant, antenne in zip(gerants, antenne_objs)}
+        for vendeur in vendeurs:
+            sellers_by_antenne[vendeur.antenne_id].append(vendeur)
+        counts['user'] = len(central) + len(gerants) + len(vendeurs)
+
+        accounts = AccountMoney.objects.bulk_create([
+            AccountMoney(name=f"{kind.title()} {antenne.nom}", type=kind, antenne=antenne)
+            for antenne in antenne_objs for kind in ('CAISSE', 'BANQUE')
+        ])
+        caisse_by_antenne = {a.antenne_id: a for a in accounts if a.type == 'CAISSE'}
+
+        categories = Category.objects.bulk_create([
+            Category(name=f"Catégorie bench {i}", type=('service', 'bien')[i % 2], is_validated=True)
+            for i in range(max(products // 20, 1))
+        ])
+        product_objs = Product.objects.bulk_create([
+            Product(
+                category=categories[i % len(categories)], name=f"Produit {i}",
+                standard_price=Decimal(rng.randint(1, 500) * 25), is_validated=True,
+            )
+            for i in range(products)
+        ])
+        prices = ProductByAntenne.objects.bulk_create([
+            ProductByAntenne(
+                product=product, antenne=antenne, is_validated=True,
+                price=product.standard_price + Decimal(rng.randint(-2, 4) * 25),
+            )
+            for antenne in antenne_objs for product in product_objs if rng.random() < 0.3
+        ], batch_size=batch_size)
+        price_map = {(p.product_id, p.antenne_id): p.price for p in prices}
+
+        counts.update(ville=len(ville_objs), antenne=len(antenne_objs), accountmoney=len(accounts),
+                      category=len(categories), product=len(product_objs), productbyantenne=len(prices))
+
+        # --- Ventes, créances et entrées de caisse ---
+        counts.update(sale=0, credit=0, transaction=0)
+        with _keep_dates(Sale, Transaction):
+            for _, size in _batches(sales, batch_size):
+                batch = []
+                for _ in range(size):
+                    antenne = rng.choice(antenne_objs)
+                    product = rng.choice(product_objs)
+                    quantity = rng.randint(1, 10)
+                    unit_price = price_map.get((product.pk, antenne.pk), product.standard_price)
+                    date = random_date()
+                    credit = rng.random() < credit_ratio
+                    batch.append(Sale(
+                        product=product, quantity=quantity, total_price=unit_price * quantity,
+                        date=date, created_at=date, updated_at=date,
+                        customer=f"Client {rng.randint(1, 50_000)}, 6{rng.randint(0, 99_999_999):08d}" if credit else None,
+                        payment_method='Credit' if credit else 'Cash',
+                        created_by=rng.choice(sellers_by_antenne[antenne.pk]),
+                        antenne=antenne, category_id=product.category_id,
+                        status=Sale.VALIDATED,
+                    ))
+                batch = Sale.objects.bulk_create(batch)
+
+                credits, movements = [], []
+                for sale in batch:
+                    if sale.payment_method == 'Credit':
+                        name, phone = sale.customer.split(', ')
+                        credits.append(Credit(nom=name, telephone=phone, date=sale.date, sale=sale,
+                                              amount=sale.total_price, balance=sale.total_price))
+                    else:
+                        movements.append(Transaction(
+                            account=caisse_by_antenne[sale.created_by.antenne_id], type='IN',
+                            amount=sale.total_price, sale=sale, created_at=sale.date,
+                        ))
+                Credit.objects.bulk_create(credits)
+                Transaction.objects.bulk_create(movements)
+                counts['sale'] += len(batch)
+                counts['credit'] += len(credits)
+                counts['transaction'] += len(movements)
+                log(f"  ventes : {counts['sale']}/{sales}")
+
+        # --- Dépenses et workflow d'approbation ---
+        if not ValidationThreshold.objects.exists():
+            ValidationThreshold.objects.bulk_create([
+                ValidationThreshold(level=1, min_amount=0, max_amount=50_000, role=User.Role.GERANT),
+                ValidationThreshold(level=2, min_amount=50_000, max_amount=500_000, role=User.Role.DIRECTEUR),
+                ValidationThreshold(level=3, min_amount=500_000, max_amount=None, role=User.Role.ADMIN),
+            ])
+        thresholds = list(ValidationThreshold.objects.order_by('level'))
+        expense_categories = ExpenseCategory.objects.bulk_create([
+            ExpenseCategory(name=name) for name in ('Loyer', 'Électricité', 'Internet', 'Fournitures', 'Salaires')
+        ])
+
+        counts.update(expense=0, approvalstep=0)
+        statuses = ['APPROVED'] * 6 + ['IN_REVIEW'] * 2 + ['PENDING', 'REJECTED']
+        with _keep_dates(Expense, ApprovalStep, Transaction):
+            for _, size in _batches(expenses, batch_size):
+                batch = []
+                for _ in range(size):
+                    antenne = rng.choice(antenne_objs)
+                    date = random_date()
+                    batch.append(Expense(
+                        title=f"Dépense {rng.randint(1, 10**6)}", category=rng.choice(expense_categories),
+                        account=caisse_by_antenne[antenne.pk], amount=Decimal(rng.randint(1, 400) * 500),
+                        antenne=antenne, created_by=antenne.gerant, status=rng.choice(statuses),
+                        created_at=date,
+                    ))
+                batch = Expense.objects.bulk_create(batch)
+
+                steps, movements = [], []
+                for expense in batch:
+                    for threshold in thresholds:
+                        if expense.amount >= threshold.min_amount and (
+                                threshold.max_amount is None or expense.amount <= threshold.max_amount):
+                            steps.append(ApprovalStep(
+                                expense=expense, level=threshold.level, role=threshold.role,
+                                approved=expense.status == 'APPROVED',
+                                rejected=expense.status == 'REJECTED',
+                                created_at=expense.created_at,
+                            ))
+                    if expense.status == 'APPROVED':
+                        movements.append(Transaction(
+                            account=expense.account, type='OUT', amount=expense.amount,
+                            expense=expense, created_at=expense.created_at,
+                        ))
+                ApprovalStep.objects.bulk_create(steps)
+                Transaction.objects.bulk_create(movements)
+                counts['expense'] += len(batch)
+                counts['approvalstep'] += len(steps)
+                counts['transaction'] += len(movements)
+                log(f"  dépenses : {counts['expense']}/{expenses}")
+
+        # --- Soldes et agrégats dérivés ---
+        balances = Transaction.objects.filter(account__in=accounts).values('account').annotate(total=Sum(signed_amount()))
+        for row in balances:
+            AccountMoney.objects.filter(pk=row['account']).update(balance=row['total'])
+
+        counts['dailysalesummary'] = rollup.rebuild(batch_size=batch_size)
+        customers.backfill(batch_size=batch_size)
+        counts['customer'] = Customer.objects.count()
+        counts['searchentry'] = sum(search.rebuild(batch_size=batch_size).values())
+
+    return counts
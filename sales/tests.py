@@ -1,3 +1,960 @@
-from django.test import TestCase
+import gzip
+import json
+import uuid
+from contextlib import ExitStack
+from unittest import skipUnless
 
-# Create your tests here.
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import F, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import Antenne, User, Ville
+from core import metrics, replica, search, sharding
+from core.exports import consume
+from core.queryplan import QueryRecorder, explain, normalize, plan_flags
+from core.pagination import KeysetPaginator, paginate
+from core.testing import AntenneTestCase
+from expense.models import AccountMoney, Expense, ExpenseCategory, Transaction
+from . import credits, customers, pricing, report_cache, rollup
+from .filters import SaleFilter
+from .ingestion import MAX_BATCH_SIZE, ingest_sales
+from .management.commands.advise_queries import Command as AdviseQueries
+from .models import (
+    Category, Credit, CreditPayment, Customer, DailySaleSummary, Product, ProductByAntenne, ReplicaHeartbeat,
+    Sale, SearchEntry,
+)
+from .reporting import build_period_report, period_bounds, sale_lines
+from .views import SALE_EXPORT_COLUMNS
+
+
+@skipUnless(settings.SHARDS, "Bases réparties désactivées (UNICOM_SHARDS=0)")
+class ShardRoutingTests(TransactionTestCase):
+    """
+    Répartition par ville (core/sharding.py), sur les deux bases SQLite
+    déclarées par core/settings_test.py.
+    """
+
+    databases = '__all__'
+
+    def setUp(self):
+        sharding.invalidate_antennes()
+        self.category = Category.objects.create(name="Impression", type="service")
+        self.product = Product.objects.create(category=self.category, name="Copie", standard_price=10)
+        self.antennes = []
+        for index in range(2):
+            ville = Ville.objects.create(name=f"Ville {index}")
+            gerant = User.objects.create(username=f"gerant{index}", role=User.Role.GERANT)
+            antenne = Antenne.objects.create(nom=f"Antenne {index}", lieux=ville, gerant=gerant)
+            gerant.antenne = antenne
+            gerant.save()
+            AccountMoney.objects.create(name=f"Caisse {index}", type="CAISSE", antenne=antenne)
+            self.antennes.append((antenne, gerant, sharding.shard_for_ville(ville.pk)))
+
+    def _sell(self, gerant, quantity, payment_method="Cash"):
+        return Sale.objects.create(
+            product=self.product, quantity=quantity, created_by=gerant,
+            payment_method=payment_method, customer="Client,0600", status=Sale.VALIDATED,
+        )
+
+    def test_operational_data_lives_in_the_city_shard(self):
+        antenne, gerant, shard = self.antennes[0]
+        sale = self._sell(gerant, 2)
+
+        self.assertEqual(sale._state.db, shard)
+        self.assertEqual(sharding.shard_for_pk(sale.pk), shard)
+        self.assertFalse(Sale.objects.using('default').exists())
+        self.assertEqual(Transaction.objects.using(shard).get(sale_id=sale.pk).amount, 20)
+        self.assertEqual(AccountMoney.objects.using(shard).get(antenne=antenne).balance, 20)
+        self.assertEqual(DailySaleSummary.objects.using(shard).get().amount, 20)
+
+    def test_reference_data_is_mirrored_in_every_shard(self):
+        for alias in sharding.shards():
+            self.assertTrue(Product.objects.using(alias).filter(pk=self.product.pk).exists())
+
+        _, gerant, shard = self.antennes[0]
+        self._sell(gerant, 1, payment_method="Credit")
+        self.product.delete()
+        for alias in sharding.shards():
+            self.assertFalse(Product.objects.using(alias).exists())
+        # La suppression suit ses cascades dans la base répartie
+        self.assertFalse(Sale.objects.using(shard).exists())
+
+    def test_reports_fan_out_over_shards(self):
+        (_, gerant0, shard0), (_, gerant1, shard1) = self.antennes
+        self.assertNotEqual(shard0, shard1)
+        first = self._sell(gerant0, 2)
+        second = self._sell(gerant1, 3, payment_method="Credit")
+
+        start, end = period_bounds('day')
+        report = build_period_report(start, end)
+        self.assertEqual(report['ventes_cash'], 20)
+        self.assertEqual(report['ventes_credit'], 30)
+        self.assertEqual(build_period_report(start, end, seller=gerant1)['total_ventes'], 30)
+
+        lignes, next_cursor = sale_lines(start, end, self.category.pk, page_size=1)
+        self.assertEqual([ligne['id'] for ligne in lignes], [first.pk])
+        lignes, _ = sale_lines(start, end, self.category.pk, after=next_cursor, page_size=1)
+        self.assertEqual([ligne['id'] for ligne in lignes], [second.pk])
+
+
+    def test_exports_and_expense_list_merge_every_shard(self):
+        (antenne0, gerant0, _), (antenne1, gerant1, _) = self.antennes
+        sales = [self._sell(gerant1, 3, payment_method="Credit"), self._sell(gerant0, 2)]
+        category = ExpenseCategory.objects.create(name="Équipement")
+        for antenne, gerant in ((antenne0, gerant0), (antenne1, gerant1)):
+            Expense.objects.create(title=f"Encre {antenne.nom}", category=category, amount=100, created_by=gerant,
+                                   account=AccountMoney.objects.using(sharding.shard_for_antenne(antenne.pk)).get())
+        admin = User.objects.create(username="admin", role=User.Role.ADMIN)
+        self.client.force_login(admin)
+
+        def export(name, **params):
+            response = self.client.get(reverse(name), {'format': 'ndjson', **params})
+            return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        self.assertEqual([row['id'] for row in export('sales:sale_export')], sorted(sale.pk for sale in sales))
+        report = export('sales:rapport_export', period='day')
+        self.assertEqual(sorted((row['paiement'], row['quantite']) for row in report), [("Cash", 2), ("Credit", 3)])
+        self.assertEqual(len(export('expenses:expense_export')), 2)
+        response = self.client.get(reverse('expenses:expense_list'))
+        self.assertEqual({expense.title for expense in response.context['expenses']},
+                         {"Encre Antenne 0", "Encre Antenne 1"})
+
+        # Sans droit de voir les rapports : ses seules ventes
+        self.client.force_login(gerant1)
+        self.assertEqual([row['id'] for row in export('sales:sale_export')], [sales[0].pk])
+        self.assertEqual([row['quantite'] for row in export('sales:rapport_export', period='day')], [3])
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "Réplique non configurée : lancer avec UNICOM_REPLICA=chemin")
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Lectures de consultation sur la réplique (core/replica.py) ; en test, la
+    réplique est un miroir de la base par défaut :
+        UNICOM_REPLICA=/tmp/replica.sqlite3 python manage.py test sales
+    """
+
+    databases = '__all__'
+
+    def setUp(self):
+        replica.forget_lag()
+        category = Category.objects.create(name="Impression", type="service")
+        self.product = Product.objects.create(category=category, name="Copie", standard_price=10)
+        self.user = User.objects.create_user(username="admin", password="x", role=User.Role.ADMIN)
+        self.client.force_login(self.user)
+        replica.beat()
+
+    def _replica_queries(self, method, url, **data):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = getattr(self.client, method)(url, data)
+        return response, len(queries)
+
+    def test_list_pages_read_the_replica(self):
+        response, replica_queries = self._replica_queries('get', reverse('sales:sale_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(replica_queries, 0)
+
+        # Hors REPLICA_ROUTES, tout reste sur la base principale
+        _, replica_queries = self._replica_queries('get', reverse('sales:sale_create'))
+        self.assertEqual(replica_queries, 0)
+
+    def test_writes_pin_the_browser_to_the_primary(self):
+        response = self.client.post(reverse('sales:sale_create'), {
+            'product': self.product.pk, 'quantity': 1, 'payment_method': 'Cash', 'customer': 'Client,0600',
+        })
+        self.assertIn(replica.STICKY_COOKIE, response.cookies)
+
+        _, replica_queries = self._replica_queries('get', reverse('sales:sale_list'))
+        self.assertEqual(replica_queries, 0)
+
+    def test_lagging_replica_is_skipped(self):
+        ReplicaHeartbeat.objects.filter(pk=1).update(
+            beat_at=ReplicaHeartbeat.objects.get(pk=1).beat_at - timedelta(seconds=settings.REPLICA_MAX_LAG + 1)
+        )
+        replica.forget_lag()
+        response, replica_queries = self._replica_queries('get', reverse('sales:sale_list'))
+        self.assertEqual(response.status_code, 200)
+        # Seule la lecture du battement touche la réplique
+        self.assertEqual(replica_queries, 1)
+
+
+class KeysetPaginationTests(TestCase):
+    """Pagination par clé (core/pagination.py) : pages complètes, sans trou ni doublon."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Impression", type="service")
+        products = [Product.objects.create(category=category, name=f"P{index}", standard_price=10) for index in range(7)]
+        # Même date pour trois produits, et deux produits sans date
+        Product.objects.filter(pk__in=[p.pk for p in products[1:4]]).update(created_at=products[1].created_at)
+        Product.objects.filter(pk__in=[p.pk for p in products[5:]]).update(created_at=None)
+        self.expected = list(Product.objects.order_by(
+            F('created_at').desc(nulls_last=True), F('pk').desc()).values_list('pk', flat=True))
+
+    def _walk(self, paginator):
+        page, seen = paginator.page(), []
+        while True:
+            seen += [row.pk for row in page]
+            if not page.has_next():
+                return seen, page
+            page = paginator.page(after=page.next_cursor())
+
+    def test_forward_and_backward_walks_cover_every_row_once(self):
+        paginator = KeysetPaginator(Product.objects.all(), 3)
+        seen, last = self._walk(paginator)
+        self.assertEqual(seen, self.expected)
+
+        back = []
+        page = paginator.page(last=True)
+        self.assertEqual([row.pk for row in page], self.expected[-3:])
+        while True:
+            back = [row.pk for row in page] + back
+            if not page.has_previous():
+                break
+            page = paginator.page(before=page.previous_cursor())
+        self.assertEqual(back, self.expected)
+
+        ascending = KeysetPaginator(Product.objects.all(), 2, descending=False)
+        self.assertEqual(self._walk(ascending)[0], self.expected[::-1])
+
+    def test_links_keep_filters_and_bad_cursor_falls_back_to_first_page(self):
+        request = RequestFactory().get('/', {'status': 'x', 'after': 'pas-un-curseur'})
+        page = paginate(request, Product.objects.all(), 3)
+        self.assertEqual([row.pk for row in page], self.expected[:3])
+        self.assertFalse(page.has_previous())
+        self.assertIn('status=x', page.next_query())
+        self.assertEqual((page.total, page.total_is_exact), (7, True))
+
+
+class PriceBookTests(AntenneTestCase):
+    """Barème par antenne (sales/pricing.py), gardé en mémoire par processus."""
+
+    def _total(self, quantity=1):
+        return self._sell(quantity).total_price
+
+    def test_sale_is_priced_from_the_antenne_book(self):
+        self.assertEqual(self._total(2), 20)
+        price = ProductByAntenne.objects.create(product=self.product, antenne=self.antenne, price=12)
+        self.assertEqual(self._total(2), 24)
+        price.is_active = False
+        price.save()
+        self.assertEqual(self._total(), 10)
+        self.product.standard_price = 11
+        self.product.save()
+        self.assertEqual(self._total(), 11)
+
+    def test_validation_keeps_the_price_and_the_credit(self):
+        sale = Sale.objects.create(product=self.product, quantity=2, created_by=self.seller, payment_method="Credit",
+                                   customer="Ali,0600", status=Sale.PENDING)
+        credit = Credit.objects.using(self.shard).get(sale=sale)
+        credits.pay(credit, 5)
+        ProductByAntenne.objects.create(product=self.product, antenne=self.antenne, price=12)
+
+        self.client.force_login(self._colleague("admin", role=User.Role.ADMIN))
+        self.client.get(reverse('sales:sale_validate', args=[sale.pk]))
+        sale = Sale.objects.using(self.shard).get(pk=sale.pk)
+        credit.refresh_from_db()
+        self.assertEqual((sale.status, sale.total_price), (Sale.VALIDATED, 20))
+        self.assertEqual((credit.amount, credit.balance), (20, 15))
+
+        # Une nouvelle quantité rechiffre la vente, sans lire le produit
+        sale.quantity = 3
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in settings.DATABASES]
+            sale.save()
+        self.assertFalse([q for c in contexts for q in c.captured_queries if 'FROM "sales_product"' in q['sql']])
+        credit.refresh_from_db()
+        self.assertEqual((sale.total_price, credit.amount, credit.balance), (36, 36, 31))
+
+    def test_new_product_is_read_again_and_unknown_product_refused(self):
+        pricing.price_for(self.product.pk)
+        # Créé sans signal, comme par un autre processus : le barème est relu
+        other = Product.objects.bulk_create([Product(category=self.category, name="Reliure", standard_price=500)])[0]
+        self.assertEqual(pricing.total_for(other.pk, self.antenne.pk, 2), 1000)
+        with self.assertRaises(ValidationError):
+            pricing.total_for(other.pk + 1000, self.antenne.pk, 1)
+
+    def test_book_expires_without_invalidation(self):
+        self.assertEqual(pricing.price_for(self.product.pk), 10)
+        Product.objects.filter(pk=self.product.pk).update(standard_price=15)
+        self.assertEqual(pricing.price_for(self.product.pk), 10)
+        with override_settings(PROCESS_CACHE_MAX_AGE=0):
+            self.assertEqual(pricing.price_for(self.product.pk), 15)
+
+
+class DailySummaryTests(AntenneTestCase):
+    """
+    Agrégat journalier (sales/rollup.py), tenu par les signaux de Sale ;
+    aussi avec des bases réparties, l'agrégat vivant dans la base des ventes.
+    """
+
+    def _summary(self):
+        """{(antenne, catégorie): (quantité, montant)} des lignes non nulles."""
+        rows = DailySaleSummary.objects.using(self.shard).values_list('antenne', 'category', 'quantity', 'amount')
+        return {(antenne, category): (quantity, amount) for antenne, category, quantity, amount in rows
+                if quantity or amount}
+
+    def test_edits_and_deletes_apply_the_difference(self):
+        first = self._sell(2)
+        second = self._sell(3)
+        key = (self.antenne.pk, self.category.pk)
+        self.assertEqual(self._summary(), {key: (5, 50)})
+
+        first.status = Sale.PENDING
+        first.save()
+        self.assertEqual(self._summary(), {key: (3, 30)})
+
+        first.status = Sale.VALIDATED
+        first.quantity = 4
+        first.save()
+        self.assertEqual(self._summary(), {key: (7, 70)})
+
+        second.delete()
+        self.assertEqual(self._summary(), {key: (4, 40)})
+        start, end = period_bounds('year')
+        self.assertEqual(build_period_report(start, end)['total_ventes'], 40)
+
+        with sharding.use_shard(self.shard):
+            self.assertEqual(rollup.rebuild(), 1)
+        self.assertEqual(self._summary(), {key: (4, 40)})
+
+    def test_seller_move_and_recategorisation_do_not_drift(self):
+        sale = self._sell(2)
+        kept = self._sell(1)
+
+        # Le vendeur change d'antenne (même ville, même base)
+        other = Antenne.objects.create(nom="Marché", lieux=self.antenne.lieux, gerant=self.seller)
+        AccountMoney.objects.create(name="Caisse marché", type="CAISSE", antenne=other)
+        self.seller.antenne = other
+        self.seller.save()
+        sale.quantity = 3
+        sale.save()
+        self.assertEqual(self._summary(), {
+            (self.antenne.pk, self.category.pk): (1, 10),
+            (other.pk, self.category.pk): (3, 30),
+        })
+
+        # Le produit change de catégorie : la suppression retire la vente de sa ligne
+        reliure = Category.objects.create(name="Reliure", type="service")
+        self.product.category = reliure
+        self.product.save()
+        Sale.objects.using(self.shard).get(pk=sale.pk).delete()
+        Sale.objects.using(self.shard).get(pk=kept.pk).delete()
+        self.assertEqual(self._summary(), {})
+        self.assertFalse(DailySaleSummary.objects.using(self.shard).filter(quantity__lt=0).exists())
+
+
+class PeriodReportTests(AntenneTestCase):
+    """Rapports périodiques (sales/reporting.py), lus dans l'agrégat journalier."""
+
+    def setUp(self):
+        super().setUp()
+        papeterie = Category.objects.create(name="Papeterie", type="bien")
+        self.cahier = Product.objects.create(category=papeterie, name="Cahier", standard_price=500)
+
+    def _queries(self, function):
+        """Résultat de `function()` et nombre de requêtes, toutes bases confondues."""
+        contexts = [CaptureQueriesContext(connections[alias]) for alias in settings.DATABASES]
+        for context in contexts:
+            context.__enter__()
+        try:
+            result = function()
+        finally:
+            for context in contexts:
+                context.__exit__(None, None, None)
+        return result, sum(len(context) for context in contexts)
+
+    def test_report_costs_two_queries_per_database(self):
+        for quantity in range(1, 6):
+            self._sell(quantity)
+            self._sell(1, "Credit", product=self.cahier)
+
+        start, end = period_bounds('year')
+        report, queries = self._queries(lambda: build_period_report(start, end))
+        self.assertEqual(queries, 2 * len(sharding.databases_for(DailySaleSummary)))
+        self.assertEqual((report['ventes_cash'], report['ventes_credit']), (150, 2500))
+        self.assertEqual(report['total_ventes'], 2650)
+
+        self._sell(100)
+        _, queries_after = self._queries(lambda: build_period_report(start, end))
+        self.assertEqual(queries_after, queries)
+
+    def test_seller_report_is_limited_to_own_sales(self):
+        self._sell(2)
+        self._sell(7, seller=self._colleague("autre"))
+
+        start, end = period_bounds('day')
+        self.assertEqual(build_period_report(start, end, seller=self.seller)['total_ventes'], 20)
+        self.assertEqual(build_period_report(start, end)['total_ventes'], 90)
+
+    def test_category_details_are_loaded_page_by_page(self):
+        for _ in range(60):
+            self._sell()
+        self._sell(product=self.cahier)
+
+        start, end = period_bounds('day')
+        seen, cursor = [], None
+        while True:
+            lignes, cursor = sale_lines(start, end, self.category.pk, after=cursor)
+            seen += [ligne['id'] for ligne in lignes]
+            if cursor is None:
+                break
+        self.assertEqual((len(seen), len(set(seen))), (60, 60))
+
+        self.client.force_login(self.seller)
+        url = reverse('sales:rapport_details')
+        response = self.client.get(url, {'category': self.category.pk, 'period': 'day', 'mine': 1})
+        self.assertEqual(len(response.context['lignes']), 50)
+        self.assertContains(response, "Charger plus")
+        response = self.client.get(f"{url}?{response.context['next_query']}")
+        self.assertEqual(len(response.context['lignes']), 10)
+        self.assertNotContains(response, "Charger plus")
+
+    def test_reports_require_login(self):
+        for name in ('sales:rapport_periodique', 'sales:mon_rapport_periodique'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response['Location'].startswith(settings.LOGIN_URL), response['Location'])
+
+    def test_details_keep_the_category_of_the_summary(self):
+        sale = self._sell(2)
+        self.product.category = self.cahier.category
+        self.product.save()
+
+        # Le produit a changé de catégorie : la vente reste comptée sous Impression
+        start, end = period_bounds('day')
+        lignes, _ = sale_lines(start, end, self.category.pk)
+        self.assertEqual([ligne['id'] for ligne in lignes], [sale.pk])
+        self.assertEqual(sale_lines(start, end, self.cahier.category_id)[0], [])
+
+
+@skipUnless(connections['default'].vendor == 'sqlite', "Plans lus au format EXPLAIN QUERY PLAN de SQLite")
+class QueryPlanTests(TransactionTestCase):
+    """Plans d'exécution des accès des vues (core/queryplan.py, Meta.indexes)."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.seller = User.objects.create(username="vendeur", role=User.Role.GERANT)
+        self.connection = connections['default']
+
+    def plan(self, queryset):
+        sql, params = queryset.using('default').query.sql_with_params()
+        return explain(self.connection, sql, params)
+
+    def test_view_accesses_use_their_index(self):
+        sale_list = self.plan(Sale.objects.filter(created_by=self.seller).order_by('-created_at')[:10])
+        self.assertTrue(any('sale_seller_created' in line for line in sale_list), sale_list)
+        self.assertEqual(plan_flags('sqlite', sale_list), {'full_scans': [], 'temp_sorts': []})
+
+        # Index partiel ou (statut, date) selon les statistiques : ni parcours complet ni tri
+        pending = self.plan(Sale.objects.filter(status=Sale.PENDING).order_by('date')[:50])
+        self.assertEqual(plan_flags('sqlite', pending), {'full_scans': [], 'temp_sorts': []})
+
+    def test_plan_flags(self):
+        flags = plan_flags('sqlite', [
+            'SCAN sales_sale', 'SEARCH sales_product USING INTEGER PRIMARY KEY (rowid=?)',
+            'SCAN sales_category USING COVERING INDEX sqlite_autoindex', 'USE TEMP B-TREE FOR ORDER BY',
+        ])
+        self.assertEqual(flags, {'full_scans': ['sales_sale'], 'temp_sorts': ['USE TEMP B-TREE FOR ORDER BY']})
+        flags = plan_flags('postgresql', [
+            'Sort  (cost=1.0..1.1 rows=1 width=8)', '  Sort Key: date', '  ->  Seq Scan on sales_sale',
+        ])
+        self.assertEqual(flags['full_scans'], ['sales_sale'])
+        self.assertEqual(len(flags['temp_sorts']), 1)
+        self.assertEqual(explain(self.connection, 'UPDATE sales_sale SET quantity = 1'), [])
+
+
+class QueryAdvisorTests(TransactionTestCase):
+    """Analyse des requêtes d'une page par advise_queries (N+1, parcours complets)."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        seller = User.objects.create(username="vendeur", role=User.Role.GERANT)
+        product = Product.objects.create(category=Category.objects.create(name="Impression", type="service"),
+                                         name="Copie", standard_price=10)
+        self.sales = Sale.objects.using('default').bulk_create(
+            Sale(product=product, quantity=1, created_by=seller, total_price=10) for _ in range(6)
+        )
+        self.command = AdviseQueries()
+        self.command.large_tables = {Sale._meta.db_table}
+        self.page = {'url': 'sales:sale_list', 'role': 'gerant', 'view': 'sales.views.sale_list', 'status': 200}
+
+    def test_repeated_queries_and_full_scans_are_reported(self):
+        with QueryRecorder(connections['default'], stack=True) as recorder:
+            for sale in self.sales:
+                Sale.objects.using('default').filter(pk=sale.pk).first()
+            list(Sale.objects.using('default').filter(customer="Client"))
+
+        findings = self.command.analyse(self.page, recorder.queries, {}, repeat_threshold=5)
+        kinds = sorted(finding['kind'] for finding in findings)
+        self.assertEqual(kinds, ['full_scan', 'n_plus_one'])
+        repeated = next(finding for finding in findings if finding['kind'] == 'n_plus_one')
+        self.assertEqual(repeated['executions'], 6)
+        self.assertTrue(repeated['origin'].startswith('sales/tests.py:'), repeated['origin'])
+
+        # Sous le seuil, une répétition n'est pas signalée
+        findings = self.command.analyse(self.page, recorder.queries, {}, repeat_threshold=7)
+        self.assertEqual([finding['kind'] for finding in findings], ['full_scan'])
+
+    def test_normalize_folds_in_lists(self):
+        self.assertEqual(
+            normalize('SELECT *  FROM "sales_sale"\n WHERE "id" IN (%s, %s, %s)'),
+            normalize('SELECT * FROM "sales_sale" WHERE "id" IN (%s)'),
+        )
+
+
+class ReportCacheTests(AntenneTestCase):
+    """Cache des rapports (sales/report_cache.py), invalidé par version à chaque vente."""
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.client.force_login(self.seller)
+
+    def _report(self):
+        return self.client.get(reverse('sales:mon_rapport_periodique')).context
+
+    def test_sales_invalidate_the_cached_report(self):
+        self._report()
+        self._report()
+        self.assertEqual((report_cache.stats()['hits'], report_cache.stats()['misses']), (1, 1))
+
+        self._sell(3)
+        self.assertEqual(self._report()['ventes_cash'], 30)
+        self.assertEqual(report_cache.stats()['misses'], 2)
+
+    @override_settings(REPORT_CACHE_LOCAL_TIMEOUT=0)
+    def test_process_local_cache_bounds_entry_lifetime(self):
+        self._report()
+        self._report()
+        self.assertEqual(report_cache.stats()['misses'], 2)
+
+
+class ExportTests(AntenneTestCase):
+    """
+    Exports en flux (core/exports.py) : sans droit de voir les rapports,
+    un utilisateur n'exporte que ses propres ventes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.other = self._colleague("autre")
+        self.admin = self._colleague("admin", role=User.Role.ADMIN)
+
+    def _export(self, user, name, **params):
+        self.client.force_login(user)
+        response = self.client.get(reverse(name), params)
+        content = b''.join(response.streaming_content)
+        if params.get('gzip'):
+            content = gzip.decompress(content)
+        return content.decode().splitlines()
+
+    def test_sale_export_is_limited_to_own_sales_without_report_permission(self):
+        for quantity in (1, 2, 3):
+            self._sell(quantity, customer=f"Ali {quantity},0600")
+        self._sell(4, customer="Ali 4,0600", seller=self.other)
+        self._sell(5, customer="Moussa,0611", seller=self.other)
+
+        lines = self._export(self.admin, 'sales:sale_export', customer="ali")
+        self.assertEqual(lines[0].split(','), [label for label, _ in SALE_EXPORT_COLUMNS])
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(len(self._export(self.seller, 'sales:sale_export', customer="ali")), 4)
+
+    def test_report_export_streams_the_daily_summary(self):
+        self._sell(2)
+        self._sell(3)
+        self._sell(4, seller=self.other)
+
+        [line] = self._export(self.admin, 'sales:rapport_export', period='day', format='ndjson', gzip=1)
+        row = json.loads(line)
+        self.assertEqual((row['quantite'], Decimal(row['montant'])), (9, 90))
+        [line] = self._export(self.seller, 'sales:rapport_export', period='day', format='ndjson')
+        self.assertEqual(json.loads(line)['quantite'], 5)
+
+    def test_report_details_are_limited_to_own_sales_without_report_permission(self):
+        self._sell(2)
+        self._sell(4, seller=self.other)
+        params = {'category': self.category.pk, 'period': 'day'}
+
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('sales:rapport_details'), params)
+        self.assertEqual([ligne['quantity'] for ligne in response.context['lignes']], [2])
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('sales:rapport_details'), params)
+        self.assertEqual([ligne['quantity'] for ligne in response.context['lignes']], [2, 4])
+
+
+class MetricsTests(AntenneTestCase):
+    """Métriques par vue (core/metrics.py), y compris pour les exports en flux."""
+
+    def setUp(self):
+        metrics.registry.reset()
+        super().setUp()
+        self.admin = self._colleague("admin", role=User.Role.ADMIN)
+        for quantity in (1, 2):
+            self._sell(quantity, seller=self.admin)
+        self.client.force_login(self.admin)
+
+    def test_requests_and_sql_are_counted_per_view(self):
+        self.client.get(reverse('sales:rapport_periodique'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('unicom_requests_total{view="sales:rapport_periodique",status="2xx"} 1', body)
+        self.assertIn('unicom_sql_queries_total{view="sales:rapport_periodique"}', body)
+
+    def test_streaming_export_is_recorded_once_read(self):
+        response = self.client.get(reverse('sales:sale_export'))
+        self.assertNotIn('sales:sale_export', metrics.registry.snapshot())
+
+        consume(response)
+        stats = metrics.registry.snapshot()['sales:sale_export']
+        self.assertEqual(stats['count'], 1)
+        self.assertGreater(stats['sql_queries'], 0)
+
+
+class SyntheticDataTests(TransactionTestCase):
+    """Jeu de données des mesures de performance (sales/synthetic.py)."""
+
+    databases = '__all__'
+
+    def test_generator_fills_derived_tables(self):
+        out = StringIO()
+        call_command('generate_synthetic_data', villes=1, antennes=2, products=5, sales=200,
+                     expenses=20, credit_ratio=0.5, stdout=out)
+        self.assertIn("Données synthétiques générées.", out.getvalue())
+
+        self.assertEqual(Sale.objects.count(), 200)
+        credit_sales = Sale.objects.filter(payment_method='Credit')
+        self.assertFalse(credit_sales.filter(client__isnull=True).exists())
+        self.assertEqual(Customer.objects.count(), credit_sales.values('client').distinct().count())
+        self.assertEqual(SearchEntry.objects.filter(kind='sale').count(), credit_sales.count())
+        self.assertEqual(DailySaleSummary.objects.aggregate(total=Sum('quantity'))['total'],
+                         Sale.objects.aggregate(total=Sum('quantity'))['total'])
+
+
+class SaleIngestionTests(AntenneTestCase):
+    """
+    Saisie groupée (sales/ingestion.py) et synchronisation hors ligne
+    (sales/sync.py) : un lot validé puis écrit en une transaction, avec
+    des requêtes en nombre constant ; aussi avec des bases réparties.
+    """
+
+    def setUp(self):
+        super().setUp()
+        ProductByAntenne.objects.create(product=self.product, antenne=self.antenne, price=12, is_active=True)
+        self.client.force_login(self.seller)
+
+    def _post(self, name, payload):
+        return self.client.post(reverse(name), json.dumps(payload), content_type='application/json')
+
+    def _non_inserts(self, queries):
+        return len([q for q in queries.captured_queries if not q['sql'].startswith('INSERT')])
+
+    def _batch(self, size):
+        lines = [{'product': self.product.pk, 'quantity': 2, 'payment_method': 'Cash'} for _ in range(size)]
+        lines.append({'product': self.product.pk, 'quantity': 1, 'payment_method': 'Credit', 'customer': "Ali,0600"})
+        lines.append({'product': 999999, 'quantity': 1, 'payment_method': 'Cash'})
+        return lines
+
+    def test_batch_is_priced_and_written_in_one_pass(self):
+        self._post('sales:sale_batch_create', self._batch(5))  # caches et client chargés
+        with CaptureQueriesContext(connections[self.shard]) as small:
+            self._post('sales:sale_batch_create', self._batch(5))
+        with CaptureQueriesContext(connections[self.shard]) as queries:
+            response = self._post('sales:sale_batch_create', self._batch(100))
+        # Seuls les INSERT groupés sont découpés (limite de paramètres SQLite)
+        self.assertEqual(self._non_inserts(queries), self._non_inserts(small))
+
+        body = response.json()
+        self.assertEqual((body['created'], body['duplicates'], body['errors']), (101, 0, 1))
+        self.assertEqual(body['results'][0]['total_price'], '24.00')
+        self.assertEqual(body['results'][-1]['status'], 'error')
+
+        with sharding.use_shard(self.shard):
+            self.assertEqual(AccountMoney.objects.get(pk=self.caisse.pk).balance, 110 * 24)
+            self.assertEqual(DailySaleSummary.objects.get(payment_method='Cash').amount, 110 * 24)
+            self.assertEqual(list(Credit.objects.values_list('nom', 'balance').distinct()), [("Ali", 12)])
+
+    def test_sync_is_idempotent_and_keeps_offline_dates(self):
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        offline = '2026-01-02T09:30:00+01:00'
+        line = {'product': self.product.pk, 'quantity': 1, 'payment_method': 'Cash'}
+        sales = [
+            dict(line, uuid=first, date=offline),
+            dict(line, uuid=second),
+            dict(line, uuid=first, date=offline),  # renvoyée dans le même lot
+            dict(line, uuid='pas-un-uuid'),
+        ]
+        body = self._post('sales:sale_sync', {'since': None, 'sales': sales}).json()
+        self.assertEqual((body['created'], body['duplicates'], body['errors']), (2, 1, 1))
+
+        # Renvoi complet après une coupure : rien n'est enregistré deux fois
+        body = self._post('sales:sale_sync', {'since': body['watermark'], 'sales': sales}).json()
+        self.assertEqual((body['created'], body['duplicates'], body['errors']), (0, 3, 1))
+
+        with sharding.use_shard(self.shard):
+            self.assertEqual(Sale.objects.get(client_uuid=first).date, parse_datetime(offline))
+            self.assertEqual(DailySaleSummary.objects.get(day='2026-01-02').amount, 12)
+            self.assertEqual(AccountMoney.objects.get(pk=self.caisse.pk).balance, 24)
+
+    def test_sync_returns_catalogue_changes_since_the_watermark(self):
+        earlier = timezone.now() - timedelta(hours=1)
+        for model in (Category, Product, ProductByAntenne):
+            model.objects.update(updated_at=earlier)
+
+        body = self._post('sales:sale_sync', {'since': None}).json()
+        self.assertEqual([row['id'] for row in body['catalogue']['products']], [self.product.pk])
+        self.assertEqual(len(body['catalogue']['prices']), 1)
+
+        body = self._post('sales:sale_sync', {'since': body['watermark']}).json()
+        self.assertEqual(body['catalogue'], {
+            'categories': [], 'products': [], 'prices': [],
+            'deleted': {'categories': [], 'products': [], 'prices': []},
+        })
+
+        price = ProductByAntenne.objects.get()
+        price.price = 15
+        price.save()
+        body = self._post('sales:sale_sync', {'since': body['watermark']}).json()
+        self.assertEqual([row['price'] for row in body['catalogue']['prices']], ['15.00'])
+        self.assertEqual(self._post('sales:sale_sync', {'since': 'hier'}).status_code, 400)
+
+    def test_sync_reports_deactivated_and_deleted_catalogue_rows(self):
+        reliure = Product.objects.create(category=self.category, name="Reliure", standard_price=500)
+        other = Antenne.objects.create(nom="Marché", gerant=self._colleague("autre"))
+        ProductByAntenne.objects.create(product=reliure, antenne=other, price=450)
+        watermark = self._post('sales:sale_sync', {'since': None}).json()['watermark']
+
+        self.product.is_active = False
+        self.product.save()
+        reliure_pk = reliure.pk
+        reliure.delete()  # et son prix dans l'autre antenne, par cascade
+        ProductByAntenne.objects.get(antenne=self.antenne).delete()
+        catalogue = self._post('sales:sale_sync', {'since': watermark}).json()['catalogue']
+        self.assertEqual([(row['id'], row['is_active']) for row in catalogue['products']], [(self.product.pk, False)])
+        self.assertEqual(catalogue['deleted']['products'], [reliure_pk])
+        # Seul le prix de l'antenne du vendeur le concerne
+        self.assertEqual(len(catalogue['deleted']['prices']), 1)
+
+    def test_malformed_batches_are_refused(self):
+        self.assertEqual(self._post('sales:sale_batch_create', {'product': 1}).status_code, 400)
+        too_many = [{'product': self.product.pk, 'quantity': 1}] * (MAX_BATCH_SIZE + 1)
+        self.assertEqual(self._post('sales:sale_batch_create', too_many).status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+
+
+class SearchIndexTests(AntenneTestCase):
+    """
+    Index de recherche (core/search.py), tenu par les signaux ; aussi avec
+    des bases réparties (UNICOM_SHARDS=2), chaque base indexant ses objets.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.reliure = Product.objects.create(category=self.category, name="Reliure", standard_price=500)
+        self.other = self._colleague("autre")
+
+    def _customers(self, **data):
+        with sharding.use_shard(self.shard):
+            return sorted(SaleFilter(data, queryset=Sale.objects.all()).qs.values_list('customer', flat=True))
+
+    def _check_prefix_search(self):
+        self._sell(customer="Hélène Abakar,0600")
+        self._sell(customer="Abdel Mahamat,0611", product=self.reliure)
+        deleted = self._sell(customer="Abakar Issa,0622")
+        deleted.delete()
+
+        self.assertEqual(self._customers(customer="aba"), ["Hélène Abakar,0600"])
+        self.assertEqual(self._customers(customer="HELE aba"), ["Hélène Abakar,0600"])
+        self.assertEqual(self._customers(customer="ab"), ["Abdel Mahamat,0611", "Hélène Abakar,0600"])
+        self.assertEqual(self._customers(product="reli"), ["Abdel Mahamat,0611"])
+        self.assertEqual(self._customers(customer="inconnu"), [])
+
+    def test_filters_match_word_prefixes_without_accents(self):
+        self._check_prefix_search()
+
+    @override_settings(SEARCH_FTS5=False)
+    def test_portable_index_gives_the_same_matches(self):
+        # Bascule vers l'index de repli : produits réindexés (base par défaut)
+        search.rebuild(kinds=['product'])
+        self._check_prefix_search()
+
+    def test_global_search_is_limited_to_what_the_user_may_see(self):
+        own = self._sell(customer="Moussa Ali,0600")
+        self._sell(payment_method="Credit", customer="Moussa Brahim,0611", seller=self.other)
+        Expense.objects.create(
+            title="Moustiquaires", account=self.caisse, amount=1000, created_by=self.other,
+        )
+        admin = User.objects.create(username="admin", role=User.Role.ADMIN)
+
+        mine = search.search(self.seller, "mous")
+        self.assertEqual([hit['label'] for hit in mine['sale']], [f"Vente n°{own.pk} : Moussa Ali,0600"])
+        self.assertEqual(len(mine['expense']), 1)
+        self.assertNotIn('credit', mine)
+
+        everything = search.search(admin, "mous")
+        self.assertEqual(len(everything['sale']), 2)
+        self.assertEqual([hit['label'] for hit in everything['credit']], ["Crédit Moussa Brahim (0611)"])
+
+    def test_rebuild_restores_the_index(self):
+        self._sell(customer="Achta Hassan,0600")
+        for alias in sharding.databases_for(SearchEntry):
+            SearchEntry.objects.using(alias).all().delete()
+        self.assertEqual(self._customers(customer="achta"), [])
+
+        with sharding.use_shard(self.shard):
+            written = search.rebuild()
+        self.assertEqual((written['sale'], written['credit'], written['expense']), (1, 0, 0))
+        self.assertEqual(self._customers(customer="achta"), ["Achta Hassan,0600"])
+
+
+class CustomerTests(AntenneTestCase):
+    """
+    Clients extraits du texte saisi (sales/customers.py) ; aussi avec des
+    bases réparties, chaque base ayant ses fiches.
+    """
+
+    def _credit(self, customer, quantity=1):
+        return self._sell(quantity, "Credit", customer=customer)
+
+    def test_phone_numbers_are_normalised(self):
+        for raw in ("66 12 34 56", "+235 66123456", "00235-66-12-34-56", "66.12.34.56"):
+            self.assertEqual(customers.normalize_phone(raw), "66123456")
+        self.assertEqual(customers.normalize_phone("N/A"), "")
+        # Trop long pour Customer.telephone : aucun client plutôt qu'une erreur d'insertion
+        self.assertEqual(customers.normalize_phone("1" * 21), "")
+        self.assertEqual(customers.normalize_phone("1" * 20), "1" * 20)
+        self.assertEqual(customers.parse("Sans virgule"), ("Sans virgule", ""))
+
+    def test_sales_and_credits_share_one_customer_per_phone(self):
+        first = self._credit("Ali Moussa, 66 12 34 56")
+        second = self._sell(customer="Ali M.,+235 66123456")
+        anonymous = self._credit("Passant")
+
+        self.assertIsNotNone(first.client_id)
+        self.assertEqual(second.client_id, first.client_id)
+        self.assertIsNone(anonymous.client_id)
+        with sharding.use_shard(self.shard):
+            self.assertEqual(Customer.objects.get().nom, "Ali Moussa")
+            self.assertEqual(Credit.objects.get(sale=first).client_id, first.client_id)
+            # Crédit sans virgule dans le texte saisi : plus d'erreur à la création
+            self.assertEqual(Credit.objects.get(sale=anonymous).telephone, "N/A")
+
+        first.customer = "Ali Moussa, 99 00 11 22"
+        first.save()
+        self.assertNotEqual(first.client_id, second.client_id)
+
+    def test_batch_ingestion_links_customers(self):
+        with sharding.use_shard(self.shard):
+            results = ingest_sales([
+                {'product': self.product.pk, 'quantity': 1, 'payment_method': 'Credit', 'customer': "Zara, 66 00 00 01"},
+                {'product': self.product.pk, 'quantity': 2, 'payment_method': 'Cash', 'customer': "Zara, 66000001"},
+            ], self.seller)
+            sales = Sale.objects.filter(pk__in=[result['id'] for result in results])
+            self.assertEqual(len({sale.client_id for sale in sales}), 1)
+            self.assertEqual(Credit.objects.get().client_id, sales[0].client_id)
+
+    def test_backfill_links_historical_rows(self):
+        sales = [self._credit(f"Client {n}, 6600000{n % 3}") for n in range(5)]
+        with sharding.use_shard(self.shard):
+            Sale.objects.update(client=None)
+            Credit.objects.update(client=None)
+            Customer.objects.all().delete()
+
+            call_command('backfill_customers', batch_size=2, stdout=StringIO())
+            self.assertEqual(Customer.objects.count(), 3)
+            self.assertFalse(Sale.objects.filter(client__isnull=True).exists())
+            self.assertFalse(Credit.objects.filter(client__isnull=True).exists())
+            self.assertEqual(Sale.objects.get(pk=sales[3].pk).client_id, Sale.objects.get(pk=sales[0].pk).client_id)
+
+    def test_ledger_totals_outstanding_credits(self):
+        paid = self._credit("Fatimé, 66 55 44 33", quantity=3)
+        self._credit("Fatimé, 66 55 44 33", quantity=2)
+        self._sell(customer="Fatimé, 66 55 44 33")
+        with sharding.use_shard(self.shard):
+            credits.settle(Credit.objects.filter(sale=paid))
+
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('sales:customer_ledger', args=[paid.client_id]))
+        self.assertEqual(response.status_code, 200)
+        totals = response.context['totals']
+        self.assertEqual((totals['credits'], totals['pending']), (2, 1))
+        self.assertEqual((totals['outstanding'], totals['paid']), (20, 30))
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+
+class CreditSettlementTests(AntenneTestCase):
+    """Paiements, règlement en masse et balance âgée des créances (sales/credits.py)."""
+
+    standard_price = 100
+
+    def _credit(self, quantity=1):
+        sale = self._sell(quantity, "Credit", customer="Client, 66000000")
+        return Credit.objects.using(self.shard).get(sale=sale)
+
+    def _caisse_balance(self):
+        return AccountMoney.objects.using(self.shard).get(pk=self.caisse.pk).balance
+
+    def test_credit_carries_amount_and_balance(self):
+        credit = self._credit(quantity=3)
+        self.assertEqual((credit.amount, credit.balance), (300, 300))
+
+    def test_partial_payments_until_settled(self):
+        credit = self._credit(quantity=3)
+        credits.pay(credit, 100, user=self.seller)
+        credit.refresh_from_db()
+        self.assertEqual((credit.balance, credit.status), (200, Credit.PENDING))
+
+        with self.assertRaises(ValidationError):
+            credits.pay(credit, 500)
+        with self.assertRaises(ValidationError):
+            credits.pay(credit, 200, kind="BANQUE")
+
+        credits.pay(credit, 200)
+        credit.refresh_from_db()
+        self.assertEqual((credit.balance, credit.status), (0, Credit.PAID))
+        self.assertEqual(self._caisse_balance(), 300)
+        payments = CreditPayment.objects.using(self.shard).filter(credit=credit)
+        self.assertEqual(sorted(payments.values_list('amount', flat=True)), [100, 200])
+        self.assertTrue(Transaction.objects.using(self.shard).filter(pk=payments[0].transaction_id, type="IN").exists())
+
+    def test_bulk_settlement_updates_each_account_once(self):
+        batch = [self._credit(quantity=n) for n in (1, 2, 3)]
+        credits.pay(batch[2], 50)
+
+        with CaptureQueriesContext(connections[self.shard]) as queries:
+            result = credits.settle(Credit.objects.using(self.shard).filter(pk__in=[c.pk for c in batch]))
+        self.assertEqual((result['settled'], result['total'], result['skipped']), (3, 550, []))
+        balance_updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "expense_accountmoney"')]
+        self.assertEqual(len(balance_updates), 1)
+        self.assertEqual(self._caisse_balance(), 600)
+        self.assertFalse(Credit.objects.using(self.shard).filter(status=Credit.PENDING).exists())
+
+        # Déjà payées : rien n'est encaissé une seconde fois
+        self.assertEqual(credits.settle(Credit.objects.using(self.shard).all())['settled'], 0)
+
+    def test_aging_groups_outstanding_by_antenne_and_age(self):
+        now = timezone.now()
+        for days, quantity in ((0, 1), (30, 2), (31, 3), (75, 4), (200, 5)):
+            credit = self._credit(quantity)
+            Credit.objects.using(self.shard).filter(pk=credit.pk).update(date=now - timedelta(days=days, hours=1))
+        credits.pay(credit, 100)
+
+        [line] = credits.aging(now=now)
+        self.assertEqual(line['antenne'], self.antenne)
+        self.assertEqual((line['count'], line['total']), (5, 1400))
+        self.assertEqual(
+            [line[key] for key, _, _ in credits.AGING_BUCKETS],
+            [300, 300, 400, 400],
+        )
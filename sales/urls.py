@@ -22,9 +22,20 @@ urlpatterns = [
 
     path('ventes/', views.sale_list, name='sale_list'),  # Liste des ventes
     path('ventes/creer/', views.sale_create, name='sale_create'),  # Création d'une vente
+    path('ventes/lot/', views.sale_batch_create, name='sale_batch_create'),  # Saisie groupée (JSON)
+    path('ventes/sync/', views.sale_sync, name='sale_sync'),  # Synchronisation hors ligne (JSON)
     path('ventes/<int:pk>/modifier/', views.sale_update, name='sale_update'),  # Modification d'une vente
     path('ventes/<int:pk>/valider/', views.sale_validate, name='sale_validate'),  # Validation d'une vente
     path('ventes/<int:pk>/rejeter/', views.sale_reject, name='sale_reject'), 
     path('ventes/compte', views.rapport_periodique, name='rapport_periodique'),
     path('ventes/mon-compte', views.mon_rapport_periodique, name='mon_rapport_periodique'),
+    path('ventes/compte/details', views.rapport_details, name='rapport_details'),
+    path('ventes/compte/export', views.rapport_export, name='rapport_export'),
+    path('ventes/compte/cache', views.report_cache_stats, name='report_cache_stats'),
+    path('ventes/export/', views.sale_export, name='sale_export'),
+
+    # Clients
+    path('clients/<int:pk>/', views.customer_ledger, name='customer_ledger'),  # Fiche client (encours)
+    path('creances/<int:pk>/paiement/', views.credit_payment, name='credit_payment'),  # Paiement d'une créance
+    path('creances/balance-agee/', views.credit_aging, name='credit_aging'),  # Balance âgée
 ]
@@ -1,19 +1,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+import json
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-# Si vous voulez le jour courant, sinon vous passerez la date en paramètre
-from datetime import date, timedelta, timezone
-from expense.models import AccountMoney, Expense
+from expense import resolver
+from expense.models import AccountMoney
 from sales.filters import SaleFilter
-from .models import Category, Product, Sale
-from .forms import CategoryForm, ProductForm, ReportingPeriodForm, SaleForm
+from .models import ArchiveBatch, ArchivedSale, Category, Credit, Customer, DailySaleSummary, Product, Sale
+from .forms import CategoryForm, CreditPaymentForm, ProductForm, ReportingPeriodForm, SaleForm
+from . import credits, pricing, report_cache
+from .ingestion import MAX_BATCH_SIZE, ingest_sales
+from .reporting import build_period_report, period_bounds, sale_lines
+from .sync import parse_watermark, sync
 from accounts.permissions import Permissions
 # Import des décorateurs
 from accounts.decorators import role_required, permission_required
-from django.core.paginator import Paginator
-from django.db.models import Sum
-from django.utils import timezone
-from collections import defaultdict
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Q, Sum
+from urllib.parse import urlencode
+from core.exports import CHUNK_SIZE, export_options, stream_rows
+from core import sharding
+from core.pagination import paginate
+import heapq
+from itertools import groupby
+from operator import itemgetter
 # --- Categories ---
 
 
@@ -71,11 +82,13 @@ def category_validate(request, pk):
 
 @login_required
 def product_list(request):
-    products = Product.objects.all()  # Récupérer tous les produits
-    paginator = Paginator(products, 15)  # Afficher 10 produits par page
+    # 15 produits par page, dans l'ordre de création
+    page_obj = paginate(request, Product.objects.select_related('category'), 15, descending=False)
 
-    page_number = request.GET.get('page')  # Récupérer le numéro de la page
-    page_obj = paginator.get_page(page_number)  # Obtenir la page actuelle
+    # Prix affiché : celui de l'antenne de l'utilisateur (barème en mémoire)
+    antenne_id = resolver.seller_antenne(request.user.pk)
+    for product in page_obj:
+        product.price = pricing.price_for(product.pk, antenne_id)
 
     return render(request, 'sales/product_list.html', {'page_obj': page_obj})
 
@@ -172,6 +185,64 @@ def sale_create(request):
     return render(request, 'sales/sale_form.html', {'form': form})
 
 
+@login_required
+@require_POST
+def sale_batch_create(request):
+    """
+    Saisie groupée de ventes : le corps est un tableau JSON de lignes
+    {"product": id, "quantity": n, "payment_method": "Cash"|"Credit", "customer": "..."}.
+    Retourne un résultat par ligne (voir sales.ingestion.ingest_sales).
+    """
+    try:
+        lines = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': "Corps JSON invalide."}, status=400)
+
+    if not isinstance(lines, list):
+        return JsonResponse({'error': "Un tableau de ventes est attendu."}, status=400)
+    if len(lines) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': f"Au plus {MAX_BATCH_SIZE} ventes par lot."}, status=400)
+
+    results = ingest_sales(lines, request.user)
+    created = sum(1 for result in results if result['status'] == 'created')
+    errors = sum(1 for result in results if result['status'] == 'error')
+    return JsonResponse({
+        'created': created,
+        'duplicates': len(results) - created - errors,
+        'errors': errors,
+        'results': results,
+    })
+
+
+@login_required
+@require_POST
+def sale_sync(request):
+    """
+    Synchronisation d'un poste de saisie hors ligne. Corps JSON :
+    {"since": filigrane ou null, "sales": [lignes avec "uuid" et "date"]}.
+    Les ventes déjà reçues (même uuid) sont signalées comme doublons ;
+    la réponse porte les changements du catalogue et le nouveau filigrane.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': "Corps JSON invalide."}, status=400)
+
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': "Un objet {since, sales} est attendu."}, status=400)
+    sales = payload.get('sales') or []
+    if not isinstance(sales, list):
+        return JsonResponse({'error': "Un tableau de ventes est attendu."}, status=400)
+    if len(sales) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': f"Au plus {MAX_BATCH_SIZE} ventes par lot."}, status=400)
+    try:
+        since = parse_watermark(payload.get('since'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    return JsonResponse(sync(request.user, sales, since))
+
+
 @login_required
 def sale_update(request, pk):
     sale = get_object_or_404(Sale, pk=pk)
@@ -184,8 +255,7 @@ def sale_update(request, pk):
 
             sale = form.save(commit=False)
             sale.status = Sale.PENDING  # Forcer le statut à "Pending" pour la mise à jour
-            # Calculer le total_price basé sur le produit et la quantité
-            sale.total_price = sale.product.price * sale.quantity
+            # total_price est recalculé par Sale.save au barème de l'antenne du vendeur
             sale.save()
             messages.success(
                 request, "La vente a été mise à jour et est toujours en attente de validation.")
@@ -203,7 +273,7 @@ def sale_validate(request, pk):
     # Valider la vente
     if sale.status == Sale.PENDING:
         sale.status = Sale.VALIDATED
-        sale.save()
+        sale.save(update_fields=['status'])
         messages.success(request, "La vente a été validée avec succès.")
     else:
         messages.info(
@@ -219,7 +289,7 @@ def sale_reject(request, pk):
     # Rejeter la vente
     if sale.status == Sale.PENDING:
         sale.status = Sale.REJECTED
-        sale.save()
+        sale.save(update_fields=['status'])
         messages.success(request, "La modification de la vente a été rejetée.")
     else:
         messages.info(
@@ -231,18 +301,22 @@ def sale_reject(request, pk):
 @login_required
 def sale_list(request):
 
-    queryset = Sale.objects.filter(
-        created_by=request.user).order_by('-created_at')
+    queryset = Sale.objects.filter(created_by=request.user)
 
     sale_filter = SaleFilter(request.GET, queryset=queryset)
     filtered_qs = sale_filter.qs
 
-    solde_caisse = AccountMoney.objects.get_or_create(type='CAISSE', name='Caisse Principale')
-    solde_banque = AccountMoney.objects.get_or_create(type='BANQUE')
+    # Comptes de l'antenne du vendeur : identifiants résolus en mémoire,
+    # soldes relus en une requête
+    antenne_id = resolver.seller_antenne(request.user.pk)
+    caisse_id = resolver.account_for(antenne_id, 'CAISSE')
+    banque_id = resolver.account_for(antenne_id, 'BANQUE')
+    accounts = AccountMoney.objects.in_bulk([pk for pk in (caisse_id, banque_id) if pk])
+    solde_caisse = accounts.get(caisse_id)
+    solde_banque = accounts.get(banque_id)
 
-    paginator = Paginator(filtered_qs, 10)  # 10 ventes par page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # 10 ventes par page, les plus récentes d'abord (index sale_seller_created)
+    page_obj = paginate(request, filtered_qs, 10)
 
     context = {
         'page_obj': page_obj,
@@ -254,281 +328,242 @@ def sale_list(request):
     return render(request, 'sales/sale_list.html', context)
 
 
-def rapport_periodique(request):
-    
-    # 1. Traitement du Formulaire et Détermination des Dates
-    
-    now = timezone.localtime(timezone.now())
-    selected_period = 'day'
-    
-    # Date de fin par défaut (maintenant, mais arrondie à la fin de la journée pour inclure toutes les transactions)
-    # L'heure de fin est ajustée si on ne filtre pas par jour
-    end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-    # Date de début par défaut (début de la journée)
-    start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+@login_required
+@permission_required(Permissions.MANAGE_ANTENNES)
+def customer_ledger(request, pk):
+    """
+    Fiche d'un client : encours et ventes. Les totaux des créances viennent
+    d'un seul agrégat sur l'index credit_client_status, les ventes sont
+    paginées sur l'index sale_client_created.
+    """
+    customer = get_object_or_404(Customer, pk=pk)
+    pending = Q(status=Credit.PENDING)
+    totals = customer.credits.aggregate(
+        credits=Count('pk'),
+        pending=Count('pk', filter=pending),
+        outstanding=Sum('balance', filter=pending),
+        paid=Sum(F('amount') - F('balance')),
+    )
+    pending_credits = customer.credits.filter(pending).select_related('sale__product').order_by('date')[:50]
+    page_obj = paginate(request, customer.sales.select_related('product'), 15)
 
-    form = ReportingPeriodForm(request.GET or {'period': 'day'}) # Si pas de GET, utilise 'day'
+    context = {
+        'customer': customer,
+        'totals': totals,
+        'pending_credits': pending_credits,
+        'page_obj': page_obj,
+        'payment_form': CreditPaymentForm(),
+    }
+    return render(request, 'sales/customer_ledger.html', context)
 
+
+@login_required
+@permission_required(Permissions.MANAGE_TREASURY)
+@require_POST
+def credit_payment(request, pk):
+    """Paiement total ou partiel d'une créance, depuis la fiche client."""
+    credit = get_object_or_404(Credit, pk=pk)
+    form = CreditPaymentForm(request.POST)
+    if form.is_valid():
+        try:
+            credits.pay(credit, form.cleaned_data['amount'], form.cleaned_data['account'], user=request.user)
+            messages.success(request, "Paiement enregistré.")
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+    else:
+        messages.error(request, "Montant ou compte invalide.")
+    if credit.client_id:
+        return redirect('sales:customer_ledger', pk=credit.client_id)
+    return redirect('sales:sale_list')
+
+
+@login_required
+@permission_required(Permissions.VIEW_REPORTS)
+def credit_aging(request):
+    """Balance âgée des créances impayées par antenne (voir sales/credits.py)."""
+    lines = credits.aging()
+    buckets = [key for key, _, _ in credits.AGING_BUCKETS]
+    for line in lines:
+        line['amounts'] = [line[key] for key in buckets]
+    context = {
+        'lines': lines,
+        'labels': [label for _, label, _ in credits.AGING_BUCKETS],
+        'total_count': sum(line['count'] for line in lines),
+        'total': sum(line['total'] for line in lines),
+        'total_amounts': [sum(line[key] for line in lines) for key in buckets],
+    }
+    return render(request, 'sales/credit_aging.html', context)
+
+
+def _rapport(request, seller=None):
+    """
+    Rendu commun des rapports périodiques : la période vient du
+    ReportingPeriodForm, les chiffres de sales.reporting.
+    """
+    selected_period = 'day'
+    form = ReportingPeriodForm(request.GET or {'period': 'day'}) # Si pas de GET, utilise 'day'
     if form.is_valid():
         selected_period = form.cleaned_data['period']
 
-        if selected_period == 'day':
-            pass # Les dates par défaut sont déjà le jour actuel
-            
-        elif selected_period == 'week':
-            # Les 7 derniers jours (la semaine passée)
-            start_date = start_date - timedelta(days=7)
-            
-        elif selected_period == 'month':
-            # Début du mois actuel
-            start_date = start_date.replace(day=1)
-            
-        elif selected_period == 'quarter':
-            # Début du trimestre actuel (logique plus précise)
-            current_month = start_date.month
-            start_month = ((current_month - 1) // 3) * 3 + 1
-            start_date = start_date.replace(month=start_month, day=1)
-            
-        elif selected_period == 'year':
-            # Début de l'année actuelle
-            start_date = start_date.replace(month=1, day=1)
-
-    # --- 2. Récupération et Structuration des Ventes ---
-
-    # Utilisation du filtre __range sur le champ date (DateTimeField)
-    ventes_validees_de_la_periode = Sale.objects.filter(
-        date__range=[start_date, end_date], # Application du filtre de période
-        status=Sale.VALIDATED 
-    ).select_related('product', 'product__category').order_by('product__category__type', 'product__category__name') 
-    
-    
-    # Le reste de la logique de structuration des ventes reste inchangée
-    ventes_detaillees_par_categorie = defaultdict(lambda: {
-        'total_par_type': 0,
-        'categories': defaultdict(lambda: {
-            'total': 0,
-            'details': []
-        })
-    })
-    
-    for vente in ventes_validees_de_la_periode:
-        category_type = vente.product.category.get_type_display() 
-        category_name = vente.product.category.name 
-        
-        ventes_detaillees_par_categorie[category_type]['categories'][category_name]['details'].append({
-            'produit': vente.product.name,
-            'quantite': vente.quantity,
-            'prix_unitaire': vente.product.price, 
-            'total_vente': vente.total_price,
-            'methode_paiement': vente.get_payment_method_display(),
-            'client': vente.customer if vente.customer else 'N/A'
-        })
-        
-        montant = vente.total_price
-        ventes_detaillees_par_categorie[category_type]['categories'][category_name]['total'] += montant
-        ventes_detaillees_par_categorie[category_type]['total_par_type'] += montant
-
-    final_ventes_structure = {}
-    for type_vente, data_type in ventes_detaillees_par_categorie.items():
-        data_type['categories'] = dict(data_type['categories']) 
-        final_ventes_structure[type_vente] = data_type
-
-
-    # --- 3. Calculs Agrégés (Totaux Cash/Credit) ---
-
-    ventes_cash_total = ventes_validees_de_la_periode.filter(
-        payment_method='Cash'
-    ).aggregate(Sum('total_price'))['total_price__sum'] or 0
-    
-    ventes_credit_total = ventes_validees_de_la_periode.filter(
-        payment_method='Credit'
-    ).aggregate(Sum('total_price'))['total_price__sum'] or 0
-    
-    total_ventes = ventes_cash_total + ventes_credit_total
-
-    # --- 4. Calcul et Regroupement des Dépenses (Sorties) ---
-    
-    # Utilisation du filtre __range sur le champ created_at (DateTimeField)
-    depenses_de_la_periode = Expense.objects.filter(
-        created_at__range=[start_date, end_date], # Application du filtre de période
-        status='APPROVED' 
-    )
-    
-    depenses_regroupees = depenses_de_la_periode.values(
-        'category__name' 
-    ).annotate(
-        total_depense=Sum('amount')
-    ).order_by('category__name')
-
-    total_depenses_global = depenses_de_la_periode.aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    # Le solde net n'inclut que les ventes qui ont été encaissées (Cash)
-    solde_net = ventes_cash_total - total_depenses_global 
-    
-    # --- 5. Préparation du Contexte Final ---
+    start_date, end_date = period_bounds(selected_period)
+
+    details_query = {'period': selected_period}
+    if seller is not None:
+        details_query['mine'] = 1
 
     contexte = {
-        # Dates de la période sélectionnée
         'form': form,
-        'start_date': start_date, 
+        'start_date': start_date,
         'end_date': end_date,
         'selected_period': selected_period,
-        
-        # Structure détaillée corrigée
-        'ventes_detaillees_par_categorie': final_ventes_structure, 
-        
-        # Données agrégées 
-        'ventes_cash': ventes_cash_total,
-        'ventes_credit': ventes_credit_total,
-        'total_ventes': total_ventes,
-        
-        # Dépenses
-        'depenses_par_section': depenses_regroupees,
-        'total_depenses_global': total_depenses_global,
-        
-        # Solde
-        'solde_net': solde_net,
+        'details_query': urlencode(details_query),
+        **report_cache.cached(
+            start_date, end_date,
+            lambda: build_period_report(start_date, end_date, seller=seller),
+            antenne_id=resolver.seller_antenne(seller.pk) if seller is not None else None,
+            seller_id=seller.pk if seller is not None else None,
+        ),
     }
-
     return render(request, 'sales/accounting.html', contexte)
 
 
+@login_required
+def rapport_periodique(request):
+    return _rapport(request)
+
+
+@login_required
 def mon_rapport_periodique(request):
-    
-    # 1. Traitement du Formulaire et Détermination des Dates
-    
-    now = timezone.localtime(timezone.now())
-    selected_period = 'day'
-    
-    # Date de fin par défaut (maintenant, mais arrondie à la fin de la journée pour inclure toutes les transactions)
-    # L'heure de fin est ajustée si on ne filtre pas par jour
-    end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-    # Date de début par défaut (début de la journée)
-    start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return _rapport(request, seller=request.user)
 
-    form = ReportingPeriodForm(request.GET or {'period': 'day'}) # Si pas de GET, utilise 'day'
 
-    if form.is_valid():
-        selected_period = form.cleaned_data['period']
+@login_required
+@role_required('admin')
+def report_cache_stats(request):
+    """Compteurs succès/échecs du cache des rapports (JSON)."""
+    return JsonResponse(report_cache.stats())
 
-        if selected_period == 'day':
-            pass # Les dates par défaut sont déjà le jour actuel
-            
-        elif selected_period == 'week':
-            # Les 7 derniers jours (la semaine passée)
-            start_date = start_date - timedelta(days=7)
-            
-        elif selected_period == 'month':
-            # Début du mois actuel
-            start_date = start_date.replace(day=1)
-            
-        elif selected_period == 'quarter':
-            # Début du trimestre actuel (logique plus précise)
-            current_month = start_date.month
-            start_month = ((current_month - 1) // 3) * 3 + 1
-            start_date = start_date.replace(month=start_month, day=1)
-            
-        elif selected_period == 'year':
-            # Début de l'année actuelle
-            start_date = start_date.replace(month=1, day=1)
-
-    # --- 2. Récupération et Structuration des Ventes ---
-
-    # Utilisation du filtre __range sur le champ date (DateTimeField)
-    ventes_validees_de_la_periode = Sale.objects.filter(
-        date__range=[start_date, end_date], # Application du filtre de période
-        status=Sale.VALIDATED,
-        created_by=request.user
-    ).select_related('product', 'product__category').order_by('product__category__type', 'product__category__name') 
-    
-    
-    # Le reste de la logique de structuration des ventes reste inchangée
-    ventes_detaillees_par_categorie = defaultdict(lambda: {
-        'total_par_type': 0,
-        'categories': defaultdict(lambda: {
-            'total': 0,
-            'details': []
-        })
-    })
-    
-    for vente in ventes_validees_de_la_periode:
-        category_type = vente.product.category.get_type_display() 
-        category_name = vente.product.category.name 
-        
-        ventes_detaillees_par_categorie[category_type]['categories'][category_name]['details'].append({
-            'produit': vente.product.name,
-            'quantite': vente.quantity,
-            'prix_unitaire': vente.product.price, 
-            'total_vente': vente.total_price,
-            'methode_paiement': vente.get_payment_method_display(),
-            'client': vente.customer if vente.customer else 'N/A'
-        })
-        
-        montant = vente.total_price
-        ventes_detaillees_par_categorie[category_type]['categories'][category_name]['total'] += montant
-        ventes_detaillees_par_categorie[category_type]['total_par_type'] += montant
-
-    final_ventes_structure = {}
-    for type_vente, data_type in ventes_detaillees_par_categorie.items():
-        data_type['categories'] = dict(data_type['categories']) 
-        final_ventes_structure[type_vente] = data_type
-
-
-    # --- 3. Calculs Agrégés (Totaux Cash/Credit) ---
-
-    ventes_cash_total = ventes_validees_de_la_periode.filter(
-        payment_method='Cash'
-    ).aggregate(Sum('total_price'))['total_price__sum'] or 0
-    
-    ventes_credit_total = ventes_validees_de_la_periode.filter(
-        payment_method='Credit'
-    ).aggregate(Sum('total_price'))['total_price__sum'] or 0
-    
-    total_ventes = ventes_cash_total + ventes_credit_total
-
-    # --- 4. Calcul et Regroupement des Dépenses (Sorties) ---
-    
-    # Utilisation du filtre __range sur le champ created_at (DateTimeField)
-    depenses_de_la_periode = Expense.objects.filter(
-        created_at__range=[start_date, end_date], # Application du filtre de période
-        status='APPROVED',
-        created_by=request.user
+
+@login_required
+def rapport_details(request):
+    """
+    Lignes de vente d'une catégorie du rapport, chargées à la demande
+    depuis accounting.html. Pagination par clé (date, id) via ?after=.
+    Sans droit de voir les rapports, seules les ventes de l'utilisateur.
+    """
+    category = get_object_or_404(Category, pk=request.GET.get('category'))
+
+    form = ReportingPeriodForm(request.GET)
+    selected_period = form.cleaned_data['period'] if form.is_valid() else 'day'
+    start_date, end_date = period_bounds(selected_period)
+
+    mine = request.GET.get('mine') or not request.user.has_permission(Permissions.VIEW_REPORTS)
+    seller = request.user if mine else None
+    lignes, next_cursor = sale_lines(
+        start_date, end_date, category.pk,
+        seller=seller, after=request.GET.get('after'),
     )
-    
-    depenses_regroupees = depenses_de_la_periode.values(
-        'category__name' 
-    ).annotate(
-        total_depense=Sum('amount')
-    ).order_by('category__name')
-
-    total_depenses_global = depenses_de_la_periode.aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    # Le solde net n'inclut que les ventes qui ont été encaissées (Cash)
-    solde_net = ventes_cash_total - total_depenses_global 
-    
-    # --- 5. Préparation du Contexte Final ---
 
-    contexte = {
-        # Dates de la période sélectionnée
-        'form': form,
-        'start_date': start_date, 
-        'end_date': end_date,
-        'selected_period': selected_period,
-        
-        # Structure détaillée corrigée
-        'ventes_detaillees_par_categorie': final_ventes_structure, 
-        
-        # Données agrégées 
-        'ventes_cash': ventes_cash_total,
-        'ventes_credit': ventes_credit_total,
-        'total_ventes': total_ventes,
-        
-        # Dépenses
-        'depenses_par_section': depenses_regroupees,
-        'total_depenses_global': total_depenses_global,
-        
-        # Solde
-        'solde_net': solde_net,
-    }
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['after'] = next_cursor
+        next_query = params.urlencode()
+
+    return render(request, 'sales/_report_sale_lines.html', {
+        'lignes': lignes,
+        'next_query': next_query,
+        'first_page': not request.GET.get('after'),
+    })
+
 
-    return render(request, 'sales/accounting.html', contexte)
\ No newline at end of file
+# --- Exports ---
+
+SALE_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('date', 'date'),
+    ('produit', 'product__name'),
+    ('categorie', 'product__category__name'),
+    ('quantite', 'quantity'),
+    ('total', 'total_price'),
+    ('paiement', 'payment_method'),
+    ('client', 'customer'),
+    ('statut', 'status'),
+    ('vendeur', 'created_by__username'),
+)
+
+
+@login_required
+def sale_export(request):
+    """
+    Export en flux des ventes filtrées par SaleFilter (?format=csv|ndjson, ?gzip=1).
+    Les utilisateurs autorisés à voir les rapports exportent toutes les antennes.
+    Les ventes archivées sont incluses quand la période filtrée les couvre. Les
+    lignes de chaque base (voir core/sharding.py) sont fusionnées par id.
+    """
+    header = [label for label, _ in SALE_EXPORT_COLUMNS]
+    fields = [field for _, field in SALE_EXPORT_COLUMNS]
+    everyone = request.user.has_permission(Permissions.VIEW_REPORTS)
+
+    def filtered(model):
+        queryset = model.objects.order_by('id')
+        if not everyone:
+            queryset = queryset.filter(created_by=request.user)
+        return SaleFilter(request.GET, queryset=queryset)
+
+    def shard_rows(alias):
+        sale_filter = filtered(Sale)
+        current = sharding.bind(sale_filter.qs).values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+        horizon = ArchiveBatch.current_horizon()
+        period = sale_filter.form.cleaned_data.get('created_at') if sale_filter.is_valid() else None
+        if horizon is None or (period and period.start and period.start > horizon):
+            return current
+        archived = sharding.bind(filtered(ArchivedSale).qs).values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+        # Une vente encore liée à une créance reste dans la table courante
+        return heapq.merge(archived, current, key=itemgetter(0))
+
+    antenne_id = None if everyone else resolver.seller_antenne(request.user.pk)
+    rows = sharding.merged(Sale, shard_rows, key=itemgetter(0), antenne_id=antenne_id)
+    return stream_rows(rows, header, filename='ventes', **export_options(request))
+
+
+@login_required
+def rapport_export(request):
+    """
+    Export en flux du rapport périodique, au grain de l'agrégat journalier :
+    une ligne par (jour, catégorie, produit, mode de paiement). Sans droit
+    de voir les rapports, seules les ventes de l'utilisateur.
+    """
+    form = ReportingPeriodForm(request.GET)
+    selected_period = form.cleaned_data['period'] if form.is_valid() else 'day'
+    start_date, end_date = period_bounds(selected_period)
+
+    mine = request.GET.get('mine') or not request.user.has_permission(Permissions.VIEW_REPORTS)
+    group = ['day', 'category__type', 'category__name', 'product__name', 'payment_method']
+
+    def shard_rows(alias):
+        summaries = DailySaleSummary.objects.filter(
+            day__range=[start_date.date(), end_date.date()]
+        )
+        if mine:
+            summaries = summaries.filter(seller=request.user)
+        return sharding.bind(summaries).values(*group).annotate(
+            quantite=Sum('quantity'),
+            montant=Sum('amount'),
+        ).order_by(*group).values_list(*group, 'quantite', 'montant').iterator(chunk_size=CHUNK_SIZE)
+
+    # Une même ligne peut venir de plusieurs bases (voir core/sharding.py) :
+    # fusionnées dans l'ordre du regroupement, puis additionnées
+    def totals(merged):
+        for key, lines in groupby(merged, key=itemgetter(slice(0, 5))):
+            lines = list(lines)
+            yield (*key, sum(line[5] for line in lines), sum(line[6] for line in lines))
+
+    antenne_id = resolver.seller_antenne(request.user.pk) if mine else None
+    merged = sharding.merged(DailySaleSummary, shard_rows, key=itemgetter(slice(0, 5)), antenne_id=antenne_id)
+    return stream_rows(
+        totals(merged),
+        header=['jour', 'type', 'categorie', 'produit', 'paiement', 'quantite', 'montant'],
+        filename=f"rapport_{selected_period}_{start_date:%Y%m%d}",
+        **export_options(request),
+    )